@@ -14,8 +14,43 @@ OPENAI_API_KEY = os.getenv('OPENAI_API_KEY', '')
 # Tavily API Key for web search
 TAVILY_API_KEY = os.getenv('TAVILY_API_KEY', '')
 
+# Logging Configuration (applied by the command-line entry points)
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+
 # Processing Configuration
 INPUT_DOCUMENTS_PATH = os.getenv('INPUT_DOCUMENTS_PATH', 'input document')
 OUTPUT_JSON_PATH = os.getenv('OUTPUT_JSON_PATH', 'output/json')
 CHUNK_SIZE = int(os.getenv('CHUNK_SIZE', '1000'))
 BATCH_SIZE = int(os.getenv('BATCH_SIZE', '10'))
+# Maximum number of chunks extracted concurrently during ingestion
+GRAPHRAG_CONCURRENCY = int(os.getenv('GRAPHRAG_CONCURRENCY', '8'))
+# Extract all chunks through the OpenAI Batch API (half price, results within 24h)
+USE_BATCH_API = os.getenv('USE_BATCH_API', '0') == '1'
+BATCH_POLL_INTERVAL = int(os.getenv('BATCH_POLL_INTERVAL', '30'))
+
+# Print the Cypher QA chain's intermediate steps (generated Cypher, context) to stdout
+GRAPHQA_VERBOSE = os.getenv('GRAPHQA_VERBOSE', '0') == '1'
+
+# Number of documents returned by the hybrid search tool
+HYBRID_SEARCH_K = int(os.getenv('HYBRID_SEARCH_K', '6'))
+
+# Grader Model Configuration (binary yes/no judges, kept separate from the answer model)
+GRADER_MODEL = os.getenv('GRADER_MODEL', 'gpt-4.1-nano')
+GRADER_MAX_TOKENS = int(os.getenv('GRADER_MAX_TOKENS', '64'))
+
+# Cache Configuration
+CACHE_DIR = os.getenv('CACHE_DIR', 'output/cache')
+EMBEDDING_CACHE_SIZE = int(os.getenv('EMBEDDING_CACHE_SIZE', '10000'))  # In-memory vectors kept by the embedding cache
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv('SEMANTIC_CACHE_THRESHOLD', '0.93'))
+WEB_SEARCH_CACHE_TTL = int(os.getenv('WEB_SEARCH_CACHE_TTL', '86400'))
+TOOL_CACHE_THRESHOLD = float(os.getenv('TOOL_CACHE_THRESHOLD', '0.95'))  # Cosine similarity for reusing rewrites and search results
+TOOL_CACHE_SIZE = int(os.getenv('TOOL_CACHE_SIZE', '1024'))
+
+# Neo4j Driver Pool Configuration
+NEO4J_MAX_POOL = int(os.getenv('NEO4J_MAX_POOL', '50'))
+NEO4J_ACQ_TIMEOUT = float(os.getenv('NEO4J_ACQ_TIMEOUT', '60'))
+NEO4J_DRIVER_CONFIG = {
+    'max_connection_pool_size': NEO4J_MAX_POOL,
+    'connection_acquisition_timeout': NEO4J_ACQ_TIMEOUT,
+    'max_connection_lifetime': 3600,
+}
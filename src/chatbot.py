@@ -1,6 +1,10 @@
 """Advanced GraphRAG chatbot using LangGraph for intelligent query handling - Agent-based approach."""
 
+import asyncio
 import logging
+import os
+import re
+import threading
 from typing import Dict, List, Any, Optional
 from functools import partial
 from langchain_openai import ChatOpenAI
@@ -12,34 +16,102 @@ from langgraph.graph import StateGraph, END
 from langchain_neo4j import Neo4jGraph
 from langchain_neo4j import GraphCypherQAChain
 from langchain_core.prompts import PromptTemplate
-from langchain_core.messages import HumanMessage
+from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
+from langchain_core.tools import StructuredTool
 from langgraph.prebuilt import ToolNode, tools_condition
-from tavily import TavilyClient
+from tavily import AsyncTavilyClient, TavilyClient
 
 from config.settings import (
-    NEO4J_URI, NEO4J_USERNAME, NEO4J_PASSWORD, 
-    OPENAI_API_KEY, OUTPUT_JSON_PATH, TAVILY_API_KEY
+    NEO4J_URI, NEO4J_USERNAME, NEO4J_PASSWORD, NEO4J_DRIVER_CONFIG,
+    OPENAI_API_KEY, OUTPUT_JSON_PATH, TAVILY_API_KEY, CACHE_DIR, EMBEDDING_CACHE_SIZE,
+    TOOL_CACHE_THRESHOLD, TOOL_CACHE_SIZE,
+    SEMANTIC_CACHE_THRESHOLD, WEB_SEARCH_CACHE_TTL, GRADER_MODEL, GRADER_MAX_TOKENS,
+    GRAPHQA_VERBOSE, HYBRID_SEARCH_K
 )
 
 # Import from new modular files
+from src.embedding_cache import CachedEmbeddings
 from src.graph_state import AgentState
+from src.semcache import SemCache
+from src.web_search_cache import WebSearchCache
 from src.graph_nodes import (
     create_hybrid_search_tool, create_structured_query_tool, create_web_search_tool,
-    rewrite_query_tool, grade_documents_tool, grade_answer_tool, create_query_rewriter_chain
+    create_query_rewriter_chain, agrade_documents, agrade_answer
 )
 from src.graders import (
-    create_relevance_grader, create_hallucination_grader, create_answer_usefulness_grader
+    create_batch_relevance_grader, create_combined_answer_grader
 )
 
-# Set up logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-class GraphRAGChatbot:
-    """Advanced GraphRAG chatbot using LangGraph with agent-based approach."""
+# Indexes backing the lookups used in the Cypher prompt examples (name CONTAINS, publication_date =)
+LOOKUP_INDEX_QUERIES = [
+    "CREATE TEXT INDEX ente_name_text IF NOT EXISTS FOR (n:Ente) ON (n.name)",
+    "CREATE TEXT INDEX fonte_normativa_name_text IF NOT EXISTS FOR (n:FonteNormativa) ON (n.name)",
+    "CREATE TEXT INDEX provvedimento_name_text IF NOT EXISTS FOR (n:Provvedimento) ON (n.name)",
+    "CREATE INDEX provvedimento_publication_date IF NOT EXISTS FOR (n:Provvedimento) ON (n.publication_date)",
+]
+
+# Agent instructions; ToolNode runs the tool calls of one turn concurrently, so independent
+# lookups should be requested together rather than one per turn
+AGENT_SYSTEM_PROMPT = """Sei un assistente esperto in normativa sulla privacy che usa i tool disponibili per rispondere.
+Quando hai bisogno di più tool indipendenti tra loro (ad esempio hybrid_search_tool e structured_query_tool per la stessa domanda), richiedili tutti nello stesso turno invece che uno alla volta: vengono eseguiti in parallelo."""
+
+# Limits for questions answered directly, without running the workflow
+MIN_QUESTION_CHARS = 3
+MAX_QUESTION_CHARS = 8000
+_SMALL_TALK_RE = re.compile(r"^(ciao|salve|buongiorno|buonasera|grazie( mille)?|ok|okay)[\s!.?]*$", re.IGNORECASE)
+
+
+def _direct_reply(question: str) -> Optional[str]:
+    """Return a canned reply for empty, oversized or small-talk questions, else None."""
+    stripped = question.strip()
+    if len(stripped) < MIN_QUESTION_CHARS:
+        return "Per favore, formula una domanda più dettagliata."
+    if len(question) > MAX_QUESTION_CHARS:
+        return f"La domanda è troppo lunga: riformulala in meno di {MAX_QUESTION_CHARS} caratteri."
+    if _SMALL_TALK_RE.match(stripped):
+        return "Ciao! Chiedimi pure qualcosa sui documenti del knowledge graph."
+    return None
+
+
+# Intent pre-classifier: obvious lookups go straight to a tool, skipping the agent's planning turn
+_ITALIAN_MONTHS = "gennaio|febbraio|marzo|aprile|maggio|giugno|luglio|agosto|settembre|ottobre|novembre|dicembre"
+_DATE_RE = re.compile(
+    rf"\b(?:(?:19|20)\d{{2}}-\d{{2}}-\d{{2}}|\d{{1,2}}\s+(?:{_ITALIAN_MONTHS})(?:\s+(?:19|20)\d{{2}})?)\b",
+    re.IGNORECASE
+)
+_INTERROGATIVE_RE = re.compile(
+    r"\b(chi|cosa|che|come|quando|quale|quali|quanto|quanti|quante|perch[eé]|dove)\b|\?", re.IGNORECASE
+)
+KEYWORD_QUERY_MAX_WORDS = 6
+
 
-    # Define a custom prompt for Cypher query generation
-    CYPHER_GENERATION_TEMPLATE = """
+def _classify_intent(question: str) -> Optional[str]:
+    """Return the tool to call directly for an obvious lookup, or None to let the agent decide."""
+    if _DATE_RE.search(question):
+        return "structured_query_tool"
+    if len(question.split()) < KEYWORD_QUERY_MAX_WORDS and not _INTERROGATIVE_RE.search(question):
+        return "hybrid_search_tool"
+    return None
+
+
+def _has_pending_tool_call(state: AgentState) -> bool:
+    """Return True if the last message is an AI message with tool calls not yet executed."""
+    last_message = state["messages"][-1]
+    return isinstance(last_message, AIMessage) and bool(last_message.tool_calls)
+
+
+def _answer_graded_useful(messages: List[Any]) -> bool:
+    """Return True if the last grade_answer_tool call of a run judged the answer 'utile'."""
+    for message in reversed(messages):
+        if getattr(message, "name", None) == "grade_answer_tool":
+            return message.content == "utile"
+    return False
+
+
+# Define a custom prompt for Cypher query generation
+CYPHER_GENERATION_TEMPLATE = """
 Sei un esperto di Neo4j e Cypher. Il tuo compito è generare query Cypher per rispondere a domande degli utenti basate su uno schema di grafo.
 
 Istruzioni:
@@ -95,12 +167,31 @@ RETURN p.name as name, p.description as description, labels(p) as type
 **Query Cypher:**
 """
 
-    CYPHER_GENERATION_PROMPT = PromptTemplate(
-        input_variables=["schema", "question"],
-        template=CYPHER_GENERATION_TEMPLATE
-    )
+CYPHER_GENERATION_PROMPT = PromptTemplate(
+    input_variables=["schema", "question"],
+    template=CYPHER_GENERATION_TEMPLATE
+)
+
+# Answer generation prompt
+ANSWER_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", """Sei un assistente esperto in normativa sulla privacy. Usa il contesto fornito dai tool per rispondere in modo accurato e dettagliato alla domanda dell'utente.
+
+Istruzioni:
+- Rispondi solo con informazioni presenti nel contesto fornito dai tool
+- Se il contesto non contiene informazioni sufficienti, rispondi "Non ho informazioni sufficienti per rispondere a questa domanda."
+- Sii preciso e cita fonti specifiche quando possibile
+- Usa un linguaggio chiaro e professionale"""),
+    ("human", "{question}")
+])
+
+
+class GraphRAGChatbot:
+    """Advanced GraphRAG chatbot using LangGraph with agent-based approach."""
+
+    # Cypher generation prompt, built once at module level
+    CYPHER_GENERATION_PROMPT = CYPHER_GENERATION_PROMPT
     
-    def __init__(self, openai_api_key: str = None):
+    def __init__(self, openai_api_key: str = None, grader_llm: Optional[ChatOpenAI] = None):
         """Initialize the GraphRAG chatbot."""
         # Initialize LLM
         self.llm = ChatOpenAI(
@@ -109,56 +200,72 @@ RETURN p.name as name, p.description as description, labels(p) as type
             openai_api_key=openai_api_key
         )
         
-        # Initialize Neo4j graph for structured queries
+        # Graders only emit yes/no scores, so they run on a smaller model with capped output
+        self.grader_llm = grader_llm or ChatOpenAI(
+            model=GRADER_MODEL,
+            temperature=0,
+            max_tokens=GRADER_MAX_TOKENS,
+            openai_api_key=openai_api_key
+        )
+        
+        # Initialize Neo4j graph for structured queries; its driver (and connection
+        # pool) is shared with the vector store below
         self.graph = Neo4jGraph(
             url=NEO4J_URI,
             username=NEO4J_USERNAME,
-            password=NEO4J_PASSWORD
+            password=NEO4J_PASSWORD,
+            driver_config=NEO4J_DRIVER_CONFIG
         )
+        self.create_lookup_indices()
         
         # Initialize GraphCypherQAChain for structured queries with custom prompt
-        self.graph_qa_chain = GraphCypherQAChain.from_llm(
-            llm=self.llm,
-            graph=self.graph,
-            verbose=True,
-            cypher_prompt=self.CYPHER_GENERATION_PROMPT,
-            allow_dangerous_requests=True
+        self.graph_qa_chain = self._build_graph_qa_chain()
+        
+        # Initialize embeddings with a persistent cache so repeated queries skip the API
+        self.embeddings = CachedEmbeddings(
+            OpenAIEmbeddings(openai_api_key=openai_api_key),
+            path=os.path.join(CACHE_DIR, "emb_cache.sqlite"),
+            maxsize=EMBEDDING_CACHE_SIZE
         )
         
-        # Initialize vector store for hybrid search
+        # Semantic cache of graded answers, so paraphrased questions skip the workflow
+        self.answer_cache = SemCache(
+            self.embeddings,
+            tau=SEMANTIC_CACHE_THRESHOLD,
+            path=os.path.join(CACHE_DIR, "answer_cache.jsonl")
+        )
+        
+        # In-memory semantic caches for the rewrite and hybrid search tools
+        self.rewrite_cache = SemCache(self.embeddings, tau=TOOL_CACHE_THRESHOLD, capacity=TOOL_CACHE_SIZE)
+        self.search_cache = SemCache(self.embeddings, tau=TOOL_CACHE_THRESHOLD, capacity=TOOL_CACHE_SIZE)
+        
+        # Initialize vector store for hybrid search, choosing the path from the indexes that exist
+        indexes = self.get_vector_indexes()
         try:
-            # First try to connect to existing hybrid index
-            self.vector_store = Neo4jVector.from_existing_index(
-                OpenAIEmbeddings(openai_api_key=openai_api_key),
-                url=NEO4J_URI,
-                username=NEO4J_USERNAME,
-                password=NEO4J_PASSWORD,
-                index_name="vector_index",
-                keyword_index_name="keyword_index",  # Add keyword index for hybrid search
-                text_node_property="description",
-                embedding_node_property="embedding",
-                search_type="hybrid"  # Enable hybrid search
-            )
-        except Exception as e:
-            logger.warning(f"Could not initialize hybrid vector store from existing index: {str(e)}")
-            # If that fails, try to create from existing graph data with hybrid support
-            try:
-                # Get all unique labels from the graph
-                labels_query = """
-                    MATCH (n) 
-                    WITH DISTINCT labels(n) as label_list
-                    UNWIND label_list as label
-                    RETURN DISTINCT label
-                """
-                result = self.graph.query(labels_query)
-                all_labels = [record['label'] for record in result]
-                
-                # Create vector store from existing graph data for all labels with hybrid search
+            if {"vector_index", "keyword_index"} <= indexes:
+                self.vector_store = Neo4jVector.from_existing_index(
+                    self.embeddings,
+                    graph=self.graph,
+                    index_name="vector_index",
+                    keyword_index_name="keyword_index",  # Add keyword index for hybrid search
+                    text_node_property="description",
+                    embedding_node_property="embedding",
+                    search_type="hybrid"  # Enable hybrid search
+                )
+            elif "vector_index" in indexes:
+                # Basic vector store when the keyword index is missing
+                self.vector_store = Neo4jVector.from_existing_index(
+                    self.embeddings,
+                    graph=self.graph,
+                    index_name="vector_index",
+                    text_node_property="description",
+                    embedding_node_property="embedding"
+                )
+            else:
+                # No indexes yet: create them from existing graph data with hybrid support
                 self.vector_store = Neo4jVector.from_existing_graph(
-                    OpenAIEmbeddings(openai_api_key=openai_api_key),
-                    url=NEO4J_URI,
-                    username=NEO4J_USERNAME,
-                    password=NEO4J_PASSWORD,
+                    self.embeddings,
+                    graph=self.graph,
                     index_name="vector_index",
                     node_label="FonteNormativa",  # Start with one common label
                     text_node_properties=["name", "description"],
@@ -166,84 +273,134 @@ RETURN p.name as name, p.description as description, labels(p) as type
                     search_type="hybrid",  # Enable hybrid search
                     keyword_index_name="keyword_index"  # Add keyword index
                 )
-            except Exception as e2:
-                logger.warning(f"Could not initialize hybrid vector store from existing graph: {str(e2)}")
-                # Fallback to basic vector store
-                try:
-                    self.vector_store = Neo4jVector.from_existing_index(
-                        OpenAIEmbeddings(openai_api_key=openai_api_key),
-                        url=NEO4J_URI,
-                        username=NEO4J_USERNAME,
-                        password=NEO4J_PASSWORD,
-                        index_name="vector_index",
-                        text_node_property="description",
-                        embedding_node_property="embedding"
-                    )
-                except Exception as e3:
-                    logger.warning(f"Could not initialize basic vector store: {str(e3)}")
-                    self.vector_store = None
+        except Exception as e:
+            logger.warning(f"Could not initialize vector store: {str(e)}")
+            self.vector_store = None
         
         # Initialize Tavily client for web search
         self.tavily_client = TavilyClient(api_key=TAVILY_API_KEY) if TAVILY_API_KEY else None
+        # Async client for aask(), so web searches overlap with the other tool calls of a turn
+        self.async_tavily_client = AsyncTavilyClient(api_key=TAVILY_API_KEY) if TAVILY_API_KEY else None
+        # Web search results are paid round-trips: reuse them for a day across sessions
+        self.web_search_cache = WebSearchCache(
+            path=os.path.join(CACHE_DIR, "tavily"),
+            ttl=WEB_SEARCH_CACHE_TTL
+        )
         
         # Initialize answer generation prompt
-        self.answer_prompt = ChatPromptTemplate.from_messages([
-            ("system", """Sei un assistente esperto in normativa sulla privacy. Usa il contesto fornito dai tool per rispondere in modo accurato e dettagliato alla domanda dell'utente.
-
-Istruzioni:
-- Rispondi solo con informazioni presenti nel contesto fornito dai tool
-- Se il contesto non contiene informazioni sufficienti, rispondi "Non ho informazioni sufficienti per rispondere a questa domanda."
-- Sii preciso e cita fonti specifiche quando possibile
-- Usa un linguaggio chiaro e professionale"""),
-            ("human", "{question}")
-        ])
+        self.answer_prompt = ANSWER_PROMPT
         self.answer_chain = self.answer_prompt | self.llm | StrOutputParser()
+        
+        # Build and compile the workflow once; ask() reuses the compiled app
+        self._app = self.build_workflow()
+        
+        # Event loop that drives aask() for synchronous callers of ask(), started on first use
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[threading.Thread] = None
+        self._loop_lock = threading.Lock()
+    
+    def get_vector_indexes(self) -> set:
+        """Return which of the vector and keyword indexes exist in the database."""
+        try:
+            result = self.graph.query(
+                "SHOW INDEXES YIELD name, type "
+                "WHERE name IN ['vector_index', 'keyword_index'] RETURN name, type"
+            )
+            return {record['name'] for record in result}
+        except Exception as e:
+            logger.warning(f"Could not list Neo4j indexes: {str(e)}")
+            return set()
+    
+    def create_lookup_indices(self):
+        """Create (idempotently) the indexes used by the generated Cypher lookups."""
+        for index_query in LOOKUP_INDEX_QUERIES:
+            try:
+                self.graph.query(index_query)
+            except Exception as e:
+                logger.warning(f"Could not create lookup index: {str(e)}")
+    
+    def _build_graph_qa_chain(self) -> GraphCypherQAChain:
+        """Build the Cypher QA chain; it snapshots the graph schema it passes to the prompt when built."""
+        return GraphCypherQAChain.from_llm(
+            llm=self.llm,
+            graph=self.graph,
+            verbose=GRAPHQA_VERBOSE,
+            cypher_prompt=self.CYPHER_GENERATION_PROMPT,
+            allow_dangerous_requests=True
+        )
+    
+    def refresh_schema(self):
+        """Re-read the graph schema (e.g. after ingestion) and rebuild the chains that embed it."""
+        self.graph.refresh_schema()
+        self.graph_qa_chain = self._build_graph_qa_chain()
+        self._app = self.build_workflow()
     
     def build_workflow(self) -> StateGraph:
         """Costruisce il workflow agentico con un ciclo ReAct."""
         workflow = StateGraph(AgentState)
 
         # 1. Create tools with injected dependencies
-        hybrid_search_tool = create_hybrid_search_tool(vector_store=self.vector_store, graph=self.graph)
+        hybrid_search_tool = create_hybrid_search_tool(
+            vector_store=self.vector_store, graph=self.graph, k=HYBRID_SEARCH_K, cache=self.search_cache
+        )
         structured_query_tool = create_structured_query_tool(graph_qa_chain=self.graph_qa_chain, graph=self.graph)
-        web_search_tool = create_web_search_tool(tavily_client=self.tavily_client)
+        web_search_tool = create_web_search_tool(
+            tavily_client=self.tavily_client, cache=self.web_search_cache,
+            async_tavily_client=self.async_tavily_client
+        )
         
         # Create advanced RAG tools
         query_rewriter_chain = create_query_rewriter_chain(self.llm)
         
-        # Create tool instances with proper dependency injection
-        def rewrite_tool_func(question: str) -> str:
-            return rewrite_query_tool(question, query_rewriter_chain)
+        # Tools are async only: the workflow is run by aask() through ainvoke
+        async def rewrite_tool_func(question: str) -> str:
+            try:
+                if (hit := await asyncio.to_thread(self.rewrite_cache.get, question)):
+                    return hit
+                rewritten = await query_rewriter_chain.ainvoke({"question": question})
+                await asyncio.to_thread(self.rewrite_cache.put, question, rewritten)
+                return rewritten
+            except Exception as e:
+                logger.error(f"Error in query rewriting: {str(e)}")
+                return question
         
-        relevance_grader = create_relevance_grader(self.llm)
-        hallucination_grader = create_hallucination_grader(self.llm)
-        usefulness_grader = create_answer_usefulness_grader(self.llm)
+        relevance_grader = create_batch_relevance_grader(self.grader_llm)
+        answer_grader = create_combined_answer_grader(self.grader_llm)
         
-        def grade_docs_tool_func(documents: List[Dict], question: str) -> List[Dict]:
-            return grade_documents_tool(documents, question, relevance_grader)
+        # Documents are graded in one batched call; the answer by one combined call
+        async def grade_docs_tool_func(documents: List[Dict], question: str) -> List[Dict]:
+            if not documents:
+                return documents
+            try:
+                return await agrade_documents(documents, question, relevance_grader)
+            except Exception as e:
+                logger.error(f"Error in document grading: {str(e)}")
+                return documents
         
-        def grade_answer_tool_func(generation: str, documents: List[Dict], question: str) -> str:
-            return grade_answer_tool(generation, documents, question, hallucination_grader, usefulness_grader)
+        async def grade_answer_tool_func(generation: str, documents: List[Dict], question: str) -> str:
+            try:
+                return await agrade_answer(generation, documents, question, answer_grader)
+            except Exception as e:
+                logger.error(f"Error in answer grading: {str(e)}")
+                return "utile"
         
         # Update tool names and descriptions for clarity
-        from langchain_core.tools import Tool
-        
-        rewrite_tool = Tool(
+        rewrite_tool = StructuredTool.from_function(
             name="rewrite_query_tool",
             description="Riscrive una domanda per ottimizzarla per la ricerca. Utile se la domanda iniziale è ambigua.",
-            func=rewrite_tool_func
+            coroutine=rewrite_tool_func
         )
         
-        grade_docs_tool = Tool(
+        grade_docs_tool = StructuredTool.from_function(
             name="grade_documents_tool",
             description="Filtra i documenti per pertinenza, scartando quelli non rilevanti.",
-            func=grade_docs_tool_func
+            coroutine=grade_docs_tool_func
         )
         
-        grade_answer_tool_instance = Tool(
+        grade_answer_tool_instance = StructuredTool.from_function(
             name="grade_answer_tool",
             description="Valuta la qualità di una risposta finale. Controlla se è basata sui fatti e se risponde effettivamente alla domanda.",
-            func=grade_answer_tool_func
+            coroutine=grade_answer_tool_func
         )
         
         tools = [
@@ -257,14 +414,20 @@ Istruzioni:
 
         # 2. Define the agent node
         # This node invokes the LLM, which will decide whether to respond or call a tool.
-        llm_with_tools = self.llm.bind_tools(tools)
-        def agent_node(state: AgentState):
-            response = llm_with_tools.invoke(state["messages"])
+        self._llm_with_tools = self.llm.bind_tools(tools, parallel_tool_calls=True)
+        agent_system_message = SystemMessage(content=AGENT_SYSTEM_PROMPT)
+        async def agent_node(state: AgentState):
+            # A tool call pre-routed by aask() goes straight to the tools node
+            if _has_pending_tool_call(state):
+                return {"messages": []}
+            response = await self._llm_with_tools.ainvoke([agent_system_message] + state["messages"])
             return {"messages": [response]}
 
         # 3. Define the ToolNode
-        # This node executes the tools called by the agent.
-        tool_node = ToolNode(tools)
+        # This node executes the tools called by the agent; the calls of one turn run
+        # concurrently under asyncio.gather (sync tools in worker threads), and
+        # tool errors are returned to the agent as messages instead of aborting the run.
+        tool_node = ToolNode(tools, handle_tool_errors=True)
 
         # 4. Add nodes to the workflow
         workflow.add_node("agent", agent_node)
@@ -290,25 +453,65 @@ Istruzioni:
 
         return workflow.compile()
     
+    def _background_loop(self) -> asyncio.AbstractEventLoop:
+        """Return the event loop running on the chatbot's background thread, starting it if needed."""
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._loop_thread = threading.Thread(
+                    target=self._loop.run_forever, name="graphrag-chatbot-loop", daemon=True
+                )
+                self._loop_thread.start()
+            return self._loop
+    
     def ask(self, question: str) -> str:
-        """Ask a question and get an answer."""
+        """Ask a question and get an answer (synchronous shim over aask)."""
+        # One persistent loop on its own thread keeps the async HTTP clients' connection pools,
+        # and is safe to call from several threads or from inside a running loop
+        future = asyncio.run_coroutine_threadsafe(self.aask(question), self._background_loop())
+        return future.result()
+    
+    async def aask(self, question: str) -> str:
+        """Ask a question and get an answer without blocking the event loop."""
+        # Trivial or malformed input never reaches the LLM
+        direct_reply = _direct_reply(question)
+        if direct_reply is not None:
+            return direct_reply
+        
         try:
-            # Build and compile workflow
-            app = self.build_workflow()
+            # Serve paraphrases of already answered questions without running the workflow
+            cached_answer = await asyncio.to_thread(self.answer_cache.get, question)
+            if cached_answer is not None:
+                return cached_answer
             
             # Create initial state with human message
             initial_state = {"messages": [HumanMessage(content=question)]}
             
-            # Run the workflow
-            final_state = app.invoke(initial_state)
+            # Obvious lookups skip the agent's planning turn with a pre-routed tool call
+            routed_tool = _classify_intent(question)
+            if routed_tool is not None:
+                logger.info(f"Routing question directly to {routed_tool}")
+                initial_state["messages"].append(AIMessage(content="", tool_calls=[{
+                    "name": routed_tool, "args": {"query": question}, "id": "intent_route"
+                }]))
+            
+            # Run the workflow compiled in __init__
+            final_state = await self._app.ainvoke(initial_state)
             
             # Extract the final answer from the last message
             if final_state["messages"]:
                 last_message = final_state["messages"][-1]
+                answer = None
                 if hasattr(last_message, 'content'):
-                    return last_message.content
+                    answer = last_message.content
                 elif isinstance(last_message, dict) and 'content' in last_message:
-                    return last_message['content']
+                    answer = last_message['content']
+                
+                if answer is not None:
+                    # Only cache answers that the answer grader judged grounded and useful
+                    if _answer_graded_useful(final_state["messages"]):
+                        await asyncio.to_thread(self.answer_cache.put, question, answer)
+                    return answer
             
             return "Mi dispiace, non sono riuscito a generare una risposta."
             
@@ -318,8 +521,14 @@ Istruzioni:
     
     def close(self):
         """Close connections."""
-        # Neo4jGraph handles connection cleanup automatically
-        pass
+        self.graph.close()
+        self.embeddings.close()
+        with self._loop_lock:
+            if self._loop is not None:
+                self._loop.call_soon_threadsafe(self._loop.stop)
+                self._loop_thread.join()
+                self._loop.close()
+                self._loop = self._loop_thread = None
 
 def main():
     """Main function to run the chatbot."""
@@ -327,6 +536,9 @@ def main():
     import os
     sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
     from config.settings import OPENAI_API_KEY
+    from src.logging_config import configure_logging
+    
+    configure_logging()
     
     # Initialize chatbot
     chatbot = GraphRAGChatbot(openai_api_key=OPENAI_API_KEY)
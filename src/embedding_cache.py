@@ -0,0 +1,138 @@
+"""Persistent embedding cache for GraphRAG, keyed by model and text."""
+
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Dict, List
+
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+# SQLite limits the number of bound parameters per statement
+_SQLITE_MAX_PARAMS = 500
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that caches vectors in an in-memory LRU backed by SQLite.
+
+    Vectors are keyed by SHA-256(model + "\\0" + text), so identical texts are only
+    sent to the underlying embedding API once, across queries and across runs.
+    """
+
+    def __init__(self, inner: Embeddings, path: str, maxsize: int = 1024):
+        """Wrap `inner` and persist its vectors to the SQLite file at `path`."""
+        self.inner = inner
+        self.path = path
+        self.maxsize = maxsize
+        self._memory: "OrderedDict[bytes, array]" = OrderedDict()
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _key(self, text: str) -> bytes:
+        """Return the cache key for a text under the wrapped model."""
+        model = getattr(self.inner, "model", "")
+        return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).digest()
+
+    def _connection(self) -> sqlite3.Connection:
+        """Open the SQLite store on first use."""
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS emb_cache (hash BLOB PRIMARY KEY, vec BLOB)"
+            )
+            self._conn.commit()
+        return self._conn
+
+    def _remember(self, key: bytes, vector: array):
+        """Insert a vector into the in-memory LRU, evicting the oldest entry."""
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        if len(self._memory) > self.maxsize:
+            self._memory.popitem(last=False)
+
+    def _lookup(self, keys: List[bytes]) -> Dict[bytes, array]:
+        """Return the cached vectors for `keys`, checking memory before SQLite."""
+        found = {}
+        missing = []
+        for key in keys:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                found[key] = vector
+            else:
+                missing.append(key)
+
+        if missing:
+            conn = self._connection()
+            for i in range(0, len(missing), _SQLITE_MAX_PARAMS):
+                batch = missing[i:i + _SQLITE_MAX_PARAMS]
+                placeholders = ",".join("?" * len(batch))
+                rows = conn.execute(
+                    f"SELECT hash, vec FROM emb_cache WHERE hash IN ({placeholders})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    vector = array("f")
+                    vector.frombytes(blob)
+                    found[key] = vector
+                    self._remember(key, vector)
+        return found
+
+    def _store(self, items: Dict[bytes, array]):
+        """Persist freshly computed vectors to memory and SQLite."""
+        rows = []
+        for key, vector in items.items():
+            self._remember(key, vector)
+            rows.append((key, vector.tobytes()))
+        conn = self._connection()
+        conn.executemany("INSERT OR IGNORE INTO emb_cache (hash, vec) VALUES (?, ?)", rows)
+        conn.commit()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed documents, calling the wrapped model only for cache misses."""
+        keys = [self._key(text) for text in texts]
+        with self._lock:
+            cached = self._lookup(keys)
+
+        # Deduplicate misses so repeated texts in one batch are embedded once
+        misses = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in misses:
+                misses[key] = text
+
+        if misses:
+            vectors = self.inner.embed_documents(list(misses.values()))
+            fresh = {key: array("f", values) for key, values in zip(misses.keys(), vectors)}
+            with self._lock:
+                self._store(fresh)
+            cached.update(fresh)
+            logger.info(f"Embedding cache: {len(texts) - len(misses)} hits, {len(misses)} misses")
+
+        return [cached[key].tolist() for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embed a query, serving repeated queries from the cache."""
+        key = self._key(text)
+        with self._lock:
+            cached = self._lookup([key])
+        if key in cached:
+            return cached[key].tolist()
+
+        vector = array("f", self.inner.embed_query(text))
+        with self._lock:
+            self._store({key: vector})
+        return vector.tolist()
+
+    def close(self):
+        """Close the SQLite connection."""
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
@@ -1,20 +1,53 @@
 """Graders for document and answer evaluation in RAG pipeline."""
 
+import functools
 import logging
+from collections import OrderedDict
 from typing import List, Dict
 from pydantic import BaseModel, Field
 from langchain_core.prompts import ChatPromptTemplate
 
-# Set up logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+def _memoize_by_llm(maxsize: int = 4):
+    """
+    Cache a grader builder per LLM instance, keyed by id(llm).
+
+    Chat models are not hashable, so functools.lru_cache cannot key on them directly.
+    The LLM is kept alongside the chain so its id cannot be reused while cached.
+    """
+    def decorator(builder):
+        cache = OrderedDict()
+
+        @functools.wraps(builder)
+        def wrapper(llm):
+            key = id(llm)
+            entry = cache.get(key)
+            if entry is not None and entry[0] is llm:
+                cache.move_to_end(key)
+                return entry[1]
+            chain = builder(llm)
+            cache[key] = (llm, chain)
+            if len(cache) > maxsize:
+                cache.popitem(last=False)
+            return chain
+
+        wrapper.cache_clear = cache.clear
+        return wrapper
+    return decorator
+
+
 class GradeDocuments(BaseModel):
     """Punteggio binario per la pertinenza dei documenti recuperati."""
     binary_score: str = Field(description="I documenti sono pertinenti alla domanda, 'yes' o 'no'")
 
 
+class GradeDocumentsBatch(BaseModel):
+    """Punteggi binari di pertinenza per una lista numerata di documenti."""
+    scores: List[str] = Field(description="Per ciascun documento, nell'ordine della numerazione, 'yes' o 'no'")
+
+
 class GradeHallucinations(BaseModel):
     """Punteggio binario sulla presenza di allucinazioni nella risposta."""
     binary_score: str = Field(description="La risposta è basata sui fatti, 'yes' o 'no'")
@@ -25,34 +58,71 @@ class GradeAnswerUsefulness(BaseModel):
     binary_score: str = Field(description="La risposta risolve la domanda, 'yes' o 'no'")
 
 
+class CombinedAnswerGrade(BaseModel):
+    """Punteggi binari su fondatezza e utilità della risposta, in un'unica valutazione."""
+    grounded: str = Field(description="La risposta è basata sui fatti dei documenti, 'yes' o 'no'")
+    useful: str = Field(description="La risposta risolve la domanda, 'yes' o 'no'")
+
+
+# Grader prompts are static, so they are built once at import time
+RELEVANCE_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", """Sei un valutatore che giudica la pertinenza di un documento recuperato rispetto a una domanda dell'utente. L'obiettivo è scartare recuperi erronei. Se il documento contiene parole chiave o significato semantico relativo alla domanda, consideralo pertinente. Fornisci un punteggio binario 'yes' o 'no'."""),
+    ("human", "Documento recuperato: \n\n {document} \n\n Domanda utente: {question}"),
+])
+
+BATCH_RELEVANCE_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", """Sei un valutatore che giudica la pertinenza di documenti recuperati rispetto a una domanda dell'utente. L'obiettivo è scartare recuperi erronei. Se un documento contiene parole chiave o significato semantico relativo alla domanda, consideralo pertinente. Restituisci un punteggio 'yes' o 'no' per ciascun documento, nello stesso ordine della numerazione."""),
+    ("human", "Per ciascun documento numerato, rispondi yes/no sulla pertinenza alla domanda. Documenti:\n{numbered_docs}\nDomanda: {question}"),
+])
+
+HALLUCINATION_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", """Sei un valutatore che controlla se una risposta è basata sui fatti forniti nei documenti di contesto. Fornisci un punteggio binario 'yes' o 'no'. 'yes' significa che la risposta è basata sui fatti, 'no' significa che contiene allucinazioni."""),
+    ("human", "Documenti di contesto: \n\n {documents} \n\n Risposta generata: {generation}"),
+])
+
+USEFULNESS_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", """Sei un valutatore che controlla se una risposta è utile per risolvere una domanda dell'utente. Fornisci un punteggio binario 'yes' o 'no'. 'yes' significa che la risposta risolve la domanda, 'no' significa che non è utile."""),
+    ("human", "Domanda utente: {question} \n\n Risposta generata: {generation}"),
+])
+
+COMBINED_ANSWER_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", """Sei un valutatore che giudica una risposta generata rispetto ai documenti di contesto e alla domanda dell'utente. Rispondi a due domande con un punteggio binario 'yes' o 'no':
+1. grounded: la risposta è basata sui fatti forniti nei documenti? 'no' significa che contiene allucinazioni.
+2. useful: la risposta risolve la domanda dell'utente?"""),
+    ("human", "Documenti di contesto: \n\n {documents} \n\n Domanda utente: {question} \n\n Risposta generata: {generation}"),
+])
+
+
+@_memoize_by_llm()
 def create_relevance_grader(llm):
     """Create a document relevance grader chain."""
-    system_prompt = """Sei un valutatore che giudica la pertinenza di un documento recuperato rispetto a una domanda dell'utente. L'obiettivo è scartare recuperi erronei. Se il documento contiene parole chiave o significato semantico relativo alla domanda, consideralo pertinente. Fornisci un punteggio binario 'yes' o 'no'."""
-    grade_prompt = ChatPromptTemplate.from_messages([
-        ("system", system_prompt),
-        ("human", "Documento recuperato: \n\n {document} \n\n Domanda utente: {question}"),
-    ])
-    structured_llm_grader = llm.with_structured_output(GradeDocuments)
-    return grade_prompt | structured_llm_grader
+    structured_llm_grader = llm.with_structured_output(GradeDocuments, method="function_calling")
+    return RELEVANCE_PROMPT | structured_llm_grader
 
 
+@_memoize_by_llm()
+def create_batch_relevance_grader(llm):
+    """Create a relevance grader chain that scores a numbered list of documents in one call."""
+    structured_llm_grader = llm.with_structured_output(GradeDocumentsBatch, method="function_calling")
+    return BATCH_RELEVANCE_PROMPT | structured_llm_grader
+
+
+@_memoize_by_llm()
 def create_hallucination_grader(llm):
     """Create a hallucination grader chain."""
-    system_prompt = """Sei un valutatore che controlla se una risposta è basata sui fatti forniti nei documenti di contesto. Fornisci un punteggio binario 'yes' o 'no'. 'yes' significa che la risposta è basata sui fatti, 'no' significa che contiene allucinazioni."""
-    hallucination_prompt = ChatPromptTemplate.from_messages([
-        ("system", system_prompt),
-        ("human", "Documenti di contesto: \n\n {documents} \n\n Risposta generata: {generation}"),
-    ])
-    structured_llm_grader = llm.with_structured_output(GradeHallucinations)
-    return hallucination_prompt | structured_llm_grader
+    structured_llm_grader = llm.with_structured_output(GradeHallucinations, method="function_calling")
+    return HALLUCINATION_PROMPT | structured_llm_grader
 
 
+@_memoize_by_llm()
 def create_answer_usefulness_grader(llm):
     """Create an answer usefulness grader chain."""
-    system_prompt = """Sei un valutatore che controlla se una risposta è utile per risolvere una domanda dell'utente. Fornisci un punteggio binario 'yes' o 'no'. 'yes' significa che la risposta risolve la domanda, 'no' significa che non è utile."""
-    answer_prompt = ChatPromptTemplate.from_messages([
-        ("system", system_prompt),
-        ("human", "Domanda utente: {question} \n\n Risposta generata: {generation}"),
-    ])
-    structured_llm_grader = llm.with_structured_output(GradeAnswerUsefulness)
-    return answer_prompt | structured_llm_grader
+    structured_llm_grader = llm.with_structured_output(GradeAnswerUsefulness, method="function_calling")
+    return USEFULNESS_PROMPT | structured_llm_grader
+
+
+@_memoize_by_llm()
+def create_combined_answer_grader(llm):
+    """Create a single grader chain that checks both groundedness and usefulness."""
+    structured_llm_grader = llm.with_structured_output(CombinedAnswerGrade, method="function_calling")
+    return COMBINED_ANSWER_PROMPT | structured_llm_grader
@@ -1,28 +1,103 @@
 """Graph nodes for the LangGraph workflow - Refactored as Tools."""
 
+import asyncio
 import logging
-from typing import List, Dict, Any
-from langchain_core.tools import tool
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional
+
+import numpy as np
+from langchain_core.tools import StructuredTool, tool
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
+from langchain_neo4j.vectorstores.neo4j_vector import remove_lucene_chars
+
+from src.semcache import SemCache
+from src.web_search_cache import WebSearchCache, normalize_query
 
-# Set up logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Per-document character budgets for the grader prompts (prompt size drives grader latency)
+RELEVANCE_DOC_CHARS = 600
+ANSWER_GRADER_DOC_CHARS = 800
+ANSWER_GRADER_MAX_DOCS = 6
+# Documents per batched relevance call; larger sets are split into concurrent calls
+RELEVANCE_BATCH_DOCS = 8
+
+
+# Query rewriting prompt, built once at import time
+REWRITE_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", """Sei un riscrittore di domande che converte una domanda di input in una versione migliore, ottimizzata per la ricerca vettoriale o web. Analizza l'input e ragiona sull'intento semantico sottostante."""),
+    ("human", "Ecco la domanda iniziale: \n\n {question} \n\n Formula una domanda migliorata."),
+])
+
+
+# Graph context for all hybrid search hits in one round-trip, keyed by document id or source
+RELATED_CONTEXT_QUERY = """
+    UNWIND $doc_ids AS doc_id
+    MATCH (d:Document)-[r]-(related)
+    WHERE d.id = doc_id OR d.source = doc_id
+    RETURN doc_id AS key,
+           d.name AS document_name,
+           collect(DISTINCT related.name) AS related_entities,
+           collect(DISTINCT labels(related)[0]) AS entity_types
+"""
+
+
+# Fulltext lookup on the entity keyword index, tried before the (embedding) vector search
+KEYWORD_SEARCH_QUERY = """
+    CALL db.index.fulltext.queryNodes('keyword_index', $q) YIELD node, score
+    RETURN node.description AS content,
+           node {.*, description: Null, embedding: Null} AS metadata,
+           score
+    LIMIT $k
+"""
+# Keyword hits needed, each scoring above the threshold, to skip the vector search
+KEYWORD_FAST_PATH_MIN_HITS = 3
+KEYWORD_FAST_PATH_MIN_SCORE = 2.0
+# Reciprocal rank fusion constant
+RRF_K = 60
+
+
+def _keyword_search(graph: Any, query: str, k: int) -> List[Dict]:
+    """Run a fulltext search on the keyword index, returning scored documents."""
+    lucene_query = remove_lucene_chars(query).strip()
+    if not lucene_query:
+        return []
+    try:
+        return graph.query(KEYWORD_SEARCH_QUERY, params={"q": lucene_query, "k": k})
+    except Exception as e:
+        logger.warning(f"Error in keyword search: {str(e)}")
+        return []
+
+
+def _rrf_fuse(ranked_lists: List[List[Dict]]) -> List[Dict]:
+    """Merge ranked document lists with reciprocal rank fusion, deduplicating by content."""
+    positions: Dict[str, int] = {}
+    docs: List[Dict] = []
+    doc_indices: List[int] = []
+    ranks: List[int] = []
+    for ranked in ranked_lists:
+        for rank, doc in enumerate(ranked):
+            index = positions.setdefault(doc["content"], len(docs))
+            if index == len(docs):
+                docs.append(doc)
+            doc_indices.append(index)
+            ranks.append(rank)
+    
+    # Accumulate 1 / (k + rank) per document in one vectorized pass
+    scores = np.zeros(len(docs))
+    np.add.at(scores, doc_indices, 1.0 / (RRF_K + np.asarray(ranks, dtype=np.float64) + 1))
+    # Stable sort keeps first-seen order among ties
+    return [docs[i] for i in np.argsort(-scores, kind="stable")]
+
 
 def create_query_rewriter_chain(llm):
     """Create a query rewriter chain for Adaptive RAG."""
-    system_prompt = """Sei un riscrittore di domande che converte una domanda di input in una versione migliore, ottimizzata per la ricerca vettoriale o web. Analizza l'input e ragiona sull'intento semantico sottostante."""
-    rewrite_prompt = ChatPromptTemplate.from_messages([
-        ("system", system_prompt),
-        ("human", "Ecco la domanda iniziale: \n\n {question} \n\n Formula una domanda migliorata."),
-    ])
-    return rewrite_prompt | llm | StrOutputParser()
+    return REWRITE_PROMPT | llm | StrOutputParser()
 
 
 @tool
-def rewrite_query_tool(question: str, rewriter_chain: Any = None) -> str:
+def rewrite_query_tool(question: str, rewriter_chain: Any = None, cache: Any = None) -> str:
     """
     Riscrive una domanda per ottimizzarla per la ricerca. Utile se la domanda iniziale è ambigua.
     Input: la domanda originale.
@@ -31,12 +106,80 @@ def rewrite_query_tool(question: str, rewriter_chain: Any = None) -> str:
     if rewriter_chain is None:
         return question
     try:
-        return rewriter_chain.invoke({"question": question})
+        if cache is not None and (hit := cache.get(question)):
+            return hit
+        rewritten = rewriter_chain.invoke({"question": question})
+        if cache is not None:
+            cache.put(question, rewritten)
+        return rewritten
     except Exception as e:
         logger.error(f"Error in query rewriting: {str(e)}")
         return question
 
 
+def _run_coroutine(coro):
+    """Run a coroutine from sync code, even when called inside a running event loop."""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, coro).result()
+
+
+async def _agrade_batch(batch: List[str], question: str, relevance_grader: Any) -> List[str]:
+    """Grade a batch of document contents in one LLM call, returning one score per document."""
+    # Truncate each document so the numbered list stays within the context window
+    numbered_docs = "\n".join(
+        f"[{i}] {content[:RELEVANCE_DOC_CHARS].strip()}" for i, content in enumerate(batch)
+    )
+    grade = await relevance_grader.ainvoke({"question": question, "numbered_docs": numbered_docs})
+    if len(grade.scores) != len(batch):
+        logger.warning(f"Relevance grader returned {len(grade.scores)} scores for {len(batch)} documents")
+    return grade.scores
+
+
+async def agrade_documents(documents: List[Dict], question: str, relevance_grader: Any) -> List[Dict]:
+    """Grade documents in batched LLM calls, run concurrently, and keep the relevant ones."""
+    contents = [d.get("content", "") or d.get("page_content", "") for d in documents]
+    graded = [(d, content) for d, content in zip(documents, contents) if content]
+    if not graded:
+        return []
+    
+    batches = [graded[i:i + RELEVANCE_BATCH_DOCS] for i in range(0, len(graded), RELEVANCE_BATCH_DOCS)]
+    results = await asyncio.gather(
+        *(_agrade_batch([content for _, content in batch], question, relevance_grader) for batch in batches),
+        return_exceptions=True
+    )
+    
+    filtered_docs = []
+    for batch, scores in zip(batches, results):
+        if isinstance(scores, Exception):
+            logger.error(f"Error grading a batch of {len(batch)} documents: {str(scores)}")
+            scores = []
+        for i, (d, _) in enumerate(batch):
+            # Keep document if the grader did not score it
+            if i >= len(scores) or scores[i].strip().lower() != "no":
+                filtered_docs.append(d)
+    return filtered_docs
+
+
+async def agrade_answer(generation: str, documents: List[Dict], question: str, answer_grader: Any) -> str:
+    """Grade groundedness and usefulness of an answer with one combined LLM call."""
+    # Extract truncated document contents for the groundedness check
+    doc_contents = [d.get("content", "") or d.get("page_content", "") for d in documents[:ANSWER_GRADER_MAX_DOCS]]
+    doc_context = "\n---\n".join(content[:ANSWER_GRADER_DOC_CHARS].strip() for content in doc_contents if content)
+    
+    grade = await answer_grader.ainvoke({
+        "documents": doc_context, "question": question, "generation": generation
+    })
+    if grade.grounded.strip().lower() == 'no':
+        return "non supportato"
+    if grade.useful.strip().lower() == 'no':
+        return "non utile"
+    return "utile"
+
+
 @tool
 def grade_documents_tool(documents: List[Dict], question: str, relevance_grader: Any = None) -> List[Dict]:
     """
@@ -48,65 +191,35 @@ def grade_documents_tool(documents: List[Dict], question: str, relevance_grader:
         return documents
     
     try:
-        filtered_docs = []
-        for d in documents:
-            try:
-                content = d.get("content", "") or d.get("page_content", "")
-                if content:
-                    grade = relevance_grader.invoke({"question": question, "document": content})
-                    if grade.binary_score == "yes":
-                        filtered_docs.append(d)
-            except Exception as doc_error:
-                logger.warning(f"Error grading document: {str(doc_error)}")
-                # Keep document if grading fails
-                filtered_docs.append(d)
-        return filtered_docs
+        return _run_coroutine(agrade_documents(documents, question, relevance_grader))
     except Exception as e:
         logger.error(f"Error in document grading: {str(e)}")
         return documents
 
 
 @tool
-def grade_answer_tool(generation: str, documents: List[Dict], question: str, hallucination_grader: Any = None, usefulness_grader: Any = None) -> str:
+def grade_answer_tool(generation: str, documents: List[Dict], question: str, answer_grader: Any = None) -> str:
     """
     Valuta la qualità di una risposta finale. Controlla se è basata sui fatti (non ha allucinazioni)
     e se risponde effettivamente alla domanda.
     Output: 'utile' se entrambi i controlli passano, altrimenti 'non utile' o 'non supportato'.
     """
-    if not hallucination_grader or not usefulness_grader:
-        return "utile"  # Default to useful if graders not available
+    if not answer_grader:
+        return "utile"  # Default to useful if grader not available
     
     try:
-        # Check hallucinations
-        if hallucination_grader:
-            # Extract document contents for hallucination check
-            doc_contents = [d.get("content", "") or d.get("page_content", "") for d in documents]
-            doc_context = "\n\n".join([content for content in doc_contents if content])
-            
-            hallucination_grade = hallucination_grader.invoke({
-                "documents": doc_context, 
-                "generation": generation
-            })
-            if hallucination_grade.binary_score == 'no':
-                return "non supportato"
-
-        # Check usefulness
-        if usefulness_grader:
-            usefulness_grade = usefulness_grader.invoke({
-                "question": question, 
-                "generation": generation
-            })
-            if usefulness_grade.binary_score == 'no':
-                return "non utile"
-
-        return "utile"
+        return _run_coroutine(agrade_answer(generation, documents, question, answer_grader))
     except Exception as e:
         logger.error(f"Error in answer grading: {str(e)}")
         return "utile"  # Default to useful if grading fails
 
 
-def create_hybrid_search_tool(vector_store: Any = None, graph: Any = None):
-    """Create a hybrid search tool with injected dependencies."""
+def create_hybrid_search_tool(vector_store: Any = None, graph: Any = None, k: int = 6,
+                              cache: Optional[SemCache] = None):
+    """
+    Create a hybrid search tool with injected dependencies, returning the top `k` documents.
+    When `cache` is set, results are reused for semantically equivalent queries.
+    """
     
     @tool
     def hybrid_search_tool(query: str) -> List[Dict]:
@@ -126,45 +239,59 @@ def create_hybrid_search_tool(vector_store: Any = None, graph: Any = None):
         
         try:
             all_results = []
-            # Perform hybrid search with metadata filtering if available
-            search_kwargs = {"k": 3}
-            
-            # Perform hybrid search - this will use both vector and keyword search
-            results = vector_store.similarity_search(query, **search_kwargs)
             
-            # Enhance results with custom retrieval if graph is available
-            enhanced_results = []
-            for doc in results:
-                enhanced_doc = {
-                    "content": doc.page_content, 
-                    "metadata": doc.metadata
-                }
+            # Fast path: strong exact keyword matches answer the query without embedding it,
+            # so it runs before the semantic cache, whose lookups embed the query too
+            keyword_hits = _keyword_search(graph, query, k) if graph else []
+            keyword_docs = [
+                {"content": hit["content"], "metadata": hit["metadata"]} for hit in keyword_hits if hit.get("content")
+            ]
+            strong_hits = [hit for hit in keyword_hits if hit.get("score", 0) > KEYWORD_FAST_PATH_MIN_SCORE]
+            fast_path = len(strong_hits) >= KEYWORD_FAST_PATH_MIN_HITS
+            if fast_path:
+                logger.info(f"Keyword fast path: {len(strong_hits)} strong matches, skipping vector search")
+                results = keyword_docs
+            else:
+                if cache is not None and (hit := cache.get(query)):
+                    logger.info(f"Hybrid search cache hit for '{query}'")
+                    return hit
                 
-                # If graph is available, fetch additional context
-                if graph:
-                    try:
-                        # Get document ID from metadata
-                        doc_id = doc.metadata.get('id') or doc.metadata.get('source', '')
-                        if doc_id:
-                            # Fetch related information from the graph
-                            related_query = """
-                                MATCH (d:Document)-[r]-(related)
-                                WHERE d.id = $doc_id OR d.source = $doc_id
-                                RETURN d.name as document_name,
-                                       collect(DISTINCT related.name) as related_entities,
-                                       collect(DISTINCT labels(related)[0]) as entity_types
-                                LIMIT 5
-                            """
-                            related_results = graph.query(related_query, params={"doc_id": doc_id})
-                            if related_results:
-                                enhanced_doc["related_context"] = related_results[0]
-                    except Exception as graph_error:
-                        logger.warning(f"Error fetching related context: {str(graph_error)}")
+                # Neo4j's hybrid ranking already orders the results: fetch only the top k
+                search_kwargs = {"k": k}
                 
+                # Perform hybrid search - this will use both vector and keyword search
+                vector_docs = [
+                    {"content": doc.page_content, "metadata": doc.metadata}
+                    for doc in vector_store.similarity_search(query, **search_kwargs)
+                ]
+                results = _rrf_fuse([vector_docs, keyword_docs])[:k] if keyword_docs else vector_docs
+            
+            # Get document IDs from metadata
+            doc_ids = [doc["metadata"].get('id') or doc["metadata"].get('source', '') for doc in results]
+            
+            # If graph is available, fetch additional context for all results at once
+            related_contexts = {}
+            if graph and any(doc_ids):
+                try:
+                    rows = graph.query(RELATED_CONTEXT_QUERY, params={"doc_ids": [d for d in doc_ids if d]})
+                    for row in rows:
+                        key = row.pop("key")
+                        related_contexts.setdefault(key, row)
+                except Exception as graph_error:
+                    logger.warning(f"Error fetching related context: {str(graph_error)}")
+            
+            # Enhance results with the graph context
+            enhanced_results = []
+            for doc, doc_id in zip(results, doc_ids):
+                enhanced_doc = dict(doc)
+                if doc_id in related_contexts:
+                    enhanced_doc["related_context"] = related_contexts[doc_id]
                 enhanced_results.append(enhanced_doc)
             
             all_results.extend(enhanced_results)
             logger.info(f"Found {len(all_results)} hybrid search results with enhanced context")
+            if cache is not None and all_results and not fast_path:
+                cache.put(query, all_results)
             return all_results
         except Exception as e:
             logger.error(f"Error in hybrid search: {str(e)}")
@@ -172,11 +299,20 @@ def create_hybrid_search_tool(vector_store: Any = None, graph: Any = None):
     
     return hybrid_search_tool
 
+# Name/description lookup used as a fallback for the Cypher QA chain
+FALLBACK_SEARCH_QUERY = """
+    MATCH (e)
+    WHERE toLower(e.name) CONTAINS toLower($query) 
+       OR toLower(e.description) CONTAINS toLower($query)
+    RETURN e.type as type, e.name as name, e.description as description
+    LIMIT 5
+"""
+
+
 def create_structured_query_tool(graph_qa_chain: Any = None, graph: Any = None):
     """Create a structured query tool with injected dependencies."""
     
-    @tool
-    def structured_query_tool(query: str) -> List[Dict]:
+    async def structured_query_tool(query: str) -> List[Dict]:
         """
         Esegue una query strutturata (Cypher) sul knowledge graph.
         Usa questa funzione per domande specifiche su conteggi, relazioni dirette o proprietà di entità.
@@ -191,42 +327,56 @@ def create_structured_query_tool(graph_qa_chain: Any = None, graph: Any = None):
         if not graph_qa_chain and not graph:
             return []
         
-        try:
-            all_results = []
+        all_results = []
+        if graph_qa_chain:
             try:
                 # Use GraphCypherQAChain to generate and execute Cypher query
-                result = graph_qa_chain.invoke({"query": query})
-                all_results.append({
-                    "question": query,
-                    "result": result
-                })
+                result = await graph_qa_chain.ainvoke({"query": query})
+                if result:
+                    all_results.append({"question": query, "result": result})
             except Exception as e:
                 logger.error(f"Error in GraphCypherQAChain for query '{query}': {str(e)}")
-                # Fallback to simple search
-                if graph:
-                    cypher_query = """
-                        MATCH (e)
-                        WHERE toLower(e.name) CONTAINS toLower($query) 
-                           OR toLower(e.description) CONTAINS toLower($query)
-                        RETURN e.type as type, e.name as name, e.description as description
-                        LIMIT 5
-                    """
-                    results = graph.query(cypher_query, params={"query": query})
-                    all_results.extend([dict(record) for record in results])
-            
-            logger.info(f"Found {len(all_results)} graph query results")
-            return all_results
-        except Exception as e:
-            logger.error(f"Error in structured query: {str(e)}")
-            return []
+        
+        # Fallback to simple search, only when the chain produced nothing
+        if not all_results and graph:
+            try:
+                results = await asyncio.to_thread(graph.query, FALLBACK_SEARCH_QUERY, params={"query": query})
+                all_results.extend([dict(record) for record in results])
+            except Exception as e:
+                logger.error(f"Error in fallback graph search: {str(e)}")
+        
+        logger.info(f"Found {len(all_results)} graph query results")
+        return all_results
     
-    return structured_query_tool
+    return StructuredTool.from_function(coroutine=structured_query_tool)
 
-def create_web_search_tool(tavily_client: Any = None):
-    """Create a web search tool with injected dependencies."""
+def create_web_search_tool(tavily_client: Any = None, cache: Optional[WebSearchCache] = None,
+                           async_tavily_client: Any = None):
+    """
+    Create a web search tool with injected dependencies, awaiting `async_tavily_client` when set
+    and running the sync `tavily_client` in a worker thread otherwise.
+    """
     
-    @tool
-    def web_search_tool(query: str) -> List[Dict]:
+    def format_results(search_results: Dict) -> List[Dict]:
+        # Extract and format results
+        web_results = []
+        if "results" in search_results:
+            for result in search_results["results"]:
+                web_results.append({
+                    "content": result.get("content", ""),
+                    "url": result.get("url", ""),
+                    "title": result.get("title", "")
+                })
+        return web_results
+    
+    async def search(query: str) -> List[Dict]:
+        # Perform web search without blocking the event loop during the HTTP call
+        search_kwargs = {"query": query, "max_results": 3, "search_depth": "advanced"}
+        if async_tavily_client is not None:
+            return format_results(await async_tavily_client.search(**search_kwargs))
+        return format_results(await asyncio.to_thread(tavily_client.search, **search_kwargs))
+    
+    async def web_search_tool(query: str) -> List[Dict]:
         """
         Esegue una ricerca sul web quando le informazioni non sono disponibili nel knowledge graph.
         Usa questa funzione come fallback se gli altri tool non trovano risultati pertinenti.
@@ -237,27 +387,25 @@ def create_web_search_tool(tavily_client: Any = None):
         Returns:
             Lista di risultati della ricerca web
         """
-        if not tavily_client:
+        if not tavily_client and not async_tavily_client:
             logger.warning("Tavily client not initialized - skipping web search")
             return []
         
         try:
-            # Perform web search
-            search_results = tavily_client.search(
-                query=query,
-                max_results=3,
-                search_depth="advanced"
-            )
-            
-            # Extract and format results
-            web_results = []
-            if "results" in search_results:
-                for result in search_results["results"]:
-                    web_results.append({
-                        "content": result.get("content", ""),
-                        "url": result.get("url", ""),
-                        "title": result.get("title", "")
-                    })
+            if cache is None:
+                web_results = await search(query)
+            else:
+                key = normalize_query(query)
+                web_results = cache.get(key)
+                if web_results is None:
+                    # Concurrent calls for the same query wait for a single search
+                    async with cache.alock_for(key):
+                        web_results = cache.get(key)
+                        if web_results is None:
+                            web_results = await search(query)
+                            cache.put(key, web_results)
+                else:
+                    logger.info(f"Web search cache hit for '{key}'")
             
             logger.info(f"Found {len(web_results)} web search results")
             return web_results
@@ -265,7 +413,7 @@ def create_web_search_tool(tavily_client: Any = None):
             logger.error(f"Error in web search: {str(e)}")
             return []
     
-    return web_search_tool
+    return StructuredTool.from_function(coroutine=web_search_tool)
 
 def create_metadata_filter_tool(vector_store: Any = None):
     """Create a metadata filter tool with injected dependencies."""
@@ -1,10 +1,16 @@
 """Ingestion pipeline for GraphRAG using LangChain extraction chains."""
 
+import asyncio
+import hashlib
 import json
 import os
 import logging
-from typing import List, Dict, Any
+import time
+import orjson
+from functools import cached_property
+from typing import List, Dict, Any, Iterator, Tuple
 from pathlib import Path
+from openai import OpenAI
 from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import JsonOutputParser
@@ -12,48 +18,133 @@ from langchain_core.runnables import RunnablePassthrough
 from langchain_neo4j import Neo4jGraph
 from langchain_neo4j import Neo4jVector
 from langchain_openai import OpenAIEmbeddings
-from langchain_community.graphs.graph_document import GraphDocument
+from langchain_community.graphs.graph_document import GraphDocument, Node, Relationship as GraphRelationship
 from langchain_core.documents import Document
+from langchain_core.messages import convert_to_openai_messages
+from neo4j import AsyncGraphDatabase
 
-from config.settings import NEO4J_URI, NEO4J_USERNAME, NEO4J_PASSWORD, OUTPUT_JSON_PATH, OPENAI_API_KEY
+from config.settings import (
+    NEO4J_URI, NEO4J_USERNAME, NEO4J_PASSWORD, OUTPUT_JSON_PATH, OPENAI_API_KEY, GRAPHRAG_CONCURRENCY,
+    USE_BATCH_API, BATCH_POLL_INTERVAL, CACHE_DIR, EMBEDDING_CACHE_SIZE, NEO4J_DRIVER_CONFIG
+)
+from src.embedding_cache import CachedEmbeddings
 from src.schema import KnowledgeGraph, get_extraction_prompt
 
-# Set up logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Extraction prompt and structured-output JSON schema, built once at import time
+EXTRACTION_PROMPT = get_extraction_prompt()
+KNOWLEDGE_GRAPH_SCHEMA = KnowledgeGraph.model_json_schema()
+
+# Indexes backing the per-chunk dedup lookups and the MERGE on Entity ids
+ENTITY_INDEX_QUERIES = [
+    "CREATE INDEX entity_source IF NOT EXISTS FOR (n:Entity) ON (n.source_document)",
+    "CREATE INDEX entity_chunk IF NOT EXISTS FOR (n:Entity) ON (n.chunk_id)",
+    "CREATE CONSTRAINT entity_id IF NOT EXISTS FOR (n:Entity) REQUIRE n.id IS UNIQUE",
+    "CREATE INDEX chunk_source IF NOT EXISTS FOR (c:Chunk) ON (c.source_document)",
+]
+
+# Vector index over the entity embeddings, written by Neo4jVector as FLOAT32 vectors
+VECTOR_INDEX_QUERY = """
+    CREATE VECTOR INDEX vector_index IF NOT EXISTS
+    FOR (n:Entity)
+    ON n.embedding
+    OPTIONS {{indexConfig: {{
+        {quantization}
+        `vector.dimensions`: 1536,
+        `vector.similarity_function`: 'cosine'
+    }}}}
+"""
+
+# Texts per embeddings request (the API accepts up to 2048 inputs)
+EMBEDDING_BATCH_SIZE = 512
+
+# Batched graph writes: one UNWIND per document for nodes and one for relationships,
+# producing the same typed labels and relationships as Neo4jGraph.add_graph_documents
+NODE_IMPORT_QUERY = """
+    UNWIND $nodes AS row
+    CALL apoc.merge.node([row.type], {id: row.id}, row.properties, {}) YIELD node
+    RETURN count(node) AS count
+"""
+REL_IMPORT_QUERY = """
+    UNWIND $rels AS row
+    CALL apoc.merge.node([row.source_label], {id: row.source}, {}, {}) YIELD node AS source
+    CALL apoc.merge.node([row.target_label], {id: row.target}, {}, {}) YIELD node AS target
+    CALL apoc.merge.relationship(source, row.type, {}, row.properties, target) YIELD rel
+    RETURN count(rel) AS count
+"""
+
+# Chunks are recorded once their graph and embeddings are stored, whether or not they
+# yielded entities; the Entity branch covers databases ingested before chunks were recorded
+MARK_CHUNKS_QUERY = """
+    UNWIND $chunks AS row
+    MERGE (:Chunk {id: row.id, source_document: row.source_document})
+"""
+PROCESSED_CHUNKS_QUERY = """
+    MATCH (c:Chunk {source_document: $source_document})
+    RETURN c.id AS chunk_id
+    UNION
+    MATCH (n:Entity {source_document: $source_document})
+    RETURN DISTINCT n.chunk_id AS chunk_id
+"""
+
+# Terminal states of an OpenAI batch job
+BATCH_TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
 class GraphRAGIngestor:
     def __init__(self, openai_api_key: str = None):
-        """Initialize the GraphRAG ingestor with LangChain components."""
-        # Initialize LLM
-        self.llm = ChatOpenAI(
+        """
+        Initialize the GraphRAG ingestor.
+        
+        The LLM, Neo4j and embedding clients are created on first use, so commands that only
+        need some of them (e.g. clearing the database) do not pay for the others.
+        """
+        self.openai_api_key = openai_api_key
+        self.extraction_prompt = EXTRACTION_PROMPT
+
+    @cached_property
+    def llm(self) -> ChatOpenAI:
+        """LLM used for knowledge graph extraction."""
+        return ChatOpenAI(
             model="gpt-4o-mini",  # or your preferred model
             temperature=0,
-            openai_api_key=openai_api_key
+            openai_api_key=self.openai_api_key
         )
-        
-        # Initialize Neo4j graph
-        self.graph = Neo4jGraph(
+
+    @cached_property
+    def graph(self) -> Neo4jGraph:
+        """Neo4j graph, pooled like the chatbot's; its driver is shared with the vector store."""
+        return Neo4jGraph(
             url=NEO4J_URI,
             username=NEO4J_USERNAME,
-            password=NEO4J_PASSWORD
+            password=NEO4J_PASSWORD,
+            driver_config=NEO4J_DRIVER_CONFIG
         )
-        
-        # Create extraction chain using with_structured_output for better reliability
-        self.extraction_prompt = get_extraction_prompt()
-        self.extraction_chain = (
+
+    @cached_property
+    def extraction_chain(self):
+        """Extraction chain using with_structured_output for better reliability."""
+        return (
             {"text": RunnablePassthrough()}
             | self.extraction_prompt
             | self.llm.with_structured_output(KnowledgeGraph)
         )
-        
-        # Initialize Embeddings and Vector Store for ingestion
-        self.embeddings = OpenAIEmbeddings(openai_api_key=openai_api_key)
-        self.vector_store = Neo4jVector(
+
+    @cached_property
+    def embeddings(self) -> CachedEmbeddings:
+        """Embeddings behind the persistent cache shared with the chatbot, so re-ingested descriptions skip the API."""
+        return CachedEmbeddings(
+            OpenAIEmbeddings(openai_api_key=self.openai_api_key),
+            path=os.path.join(CACHE_DIR, "emb_cache.sqlite"),
+            maxsize=EMBEDDING_CACHE_SIZE
+        )
+
+    @cached_property
+    def vector_store(self) -> Neo4jVector:
+        """Vector store the entity embeddings are written to."""
+        return Neo4jVector(
             embedding=self.embeddings,
-            url=NEO4J_URI,
-            username=NEO4J_USERNAME,
-            password=NEO4J_PASSWORD,
+            graph=self.graph,
             index_name="vector_index",
             keyword_index_name="keyword_index",
             search_type="hybrid",
@@ -62,6 +153,22 @@ class GraphRAGIngestor:
             embedding_node_property="embedding"
         )
 
+    def create_entity_indices(self):
+        """Create (idempotently) the indexes and constraint used while ingesting."""
+        for index_query in ENTITY_INDEX_QUERIES:
+            try:
+                self.graph.query(index_query)
+            except Exception as e:
+                logger.warning(f"Could not create entity index: {str(e)}")
+    
+    async def acreate_entity_indices(self, driver):
+        """Async variant of create_entity_indices, run on the async driver."""
+        for index_query in ENTITY_INDEX_QUERIES:
+            try:
+                await self._run(driver, index_query)
+            except Exception as e:
+                logger.warning(f"Could not create entity index: {str(e)}")
+
     def clear_database(self):
         """Clear all nodes and relationships from the Neo4j database."""
         try:
@@ -75,9 +182,9 @@ class GraphRAGIngestor:
         """Extract knowledge graph from text using LangChain chain."""
         try:
             result = self.extraction_chain.invoke(text)
-            # The result from the chain is a dictionary, so we instantiate the KnowledgeGraph object
+            # The result from the chain may be a dictionary, so we validate it into a KnowledgeGraph object
             if isinstance(result, dict):
-                return KnowledgeGraph(**result)
+                return KnowledgeGraph.model_validate(result)
             # If it's already a KnowledgeGraph object, return it directly
             return result
         except Exception as e:
@@ -85,14 +192,93 @@ class GraphRAGIngestor:
             # Return empty graph on error
             return KnowledgeGraph(entities=[], relationships=[])
     
+    def _batch_request(self, chunk_id: str, text: str) -> Dict[str, Any]:
+        """Build one Batch API request line for extracting a chunk's knowledge graph."""
+        messages = convert_to_openai_messages(self.extraction_prompt.format_messages(text=text))
+        return {
+            "custom_id": chunk_id,
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": {
+                "model": self.llm.model_name,
+                "temperature": 0,
+                "messages": messages,
+                "response_format": {
+                    "type": "json_schema",
+                    "json_schema": {"name": "KnowledgeGraph", "schema": KNOWLEDGE_GRAPH_SCHEMA}
+                }
+            }
+        }
+    
+    def batch_extract(self, all_chunks: List[Tuple[str, str, str]]) -> Dict[str, KnowledgeGraph]:
+        """
+        Extract knowledge graphs for many chunks through the OpenAI Batch API.
+        
+        Takes (chunk_id, text, source_document) tuples and returns a KnowledgeGraph per chunk
+        id. Chunks whose request failed or could not be parsed are left out of the result.
+        """
+        if not all_chunks:
+            return {}
+        
+        client = OpenAI(api_key=self.openai_api_key)
+        payload = "\n".join(
+            json.dumps(self._batch_request(chunk_id, text), ensure_ascii=False)
+            for chunk_id, text, _ in all_chunks
+        )
+        input_file = client.files.create(
+            file=("extraction_batch.jsonl", payload.encode("utf-8")), purpose="batch"
+        )
+        batch = client.batches.create(
+            input_file_id=input_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h"
+        )
+        logger.info(f"Submitted extraction batch {batch.id} with {len(all_chunks)} chunks")
+        
+        while batch.status not in BATCH_TERMINAL_STATUSES:
+            time.sleep(BATCH_POLL_INTERVAL)
+            batch = client.batches.retrieve(batch.id)
+            logger.info(f"Batch {batch.id} status: {batch.status}")
+        
+        if batch.status != "completed" or not batch.output_file_id:
+            logger.error(f"Extraction batch {batch.id} ended with status {batch.status}")
+            return {}
+        
+        results = {}
+        for line in client.files.content(batch.output_file_id).text.splitlines():
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                content = record["response"]["body"]["choices"][0]["message"]["content"]
+                # Parse and validate the JSON in one pass, without an intermediate dict
+                results[record["custom_id"]] = KnowledgeGraph.model_validate_json(content)
+            except Exception as e:
+                logger.warning(f"Could not parse batch result line: {str(e)}")
+        logger.info(f"Batch {batch.id} returned {len(results)}/{len(all_chunks)} knowledge graphs")
+        return results
+    
+    async def aextract_knowledge_graph(self, text: str) -> KnowledgeGraph:
+        """Extract knowledge graph from text without blocking the event loop."""
+        try:
+            result = await self.extraction_chain.ainvoke(text)
+            if isinstance(result, dict):
+                return KnowledgeGraph.model_validate(result)
+            return result
+        except Exception as e:
+            logger.error(f"Error extracting knowledge graph: {str(e)}")
+            # Return empty graph on error
+            return KnowledgeGraph(entities=[], relationships=[])
+    
     def convert_to_graph_document(self, kg: KnowledgeGraph, chunk_id: str, source_document: str) -> GraphDocument:
         """Convert KnowledgeGraph to LangChain GraphDocument format."""
         try:
-            from langchain_core.documents import Document
-            from langchain_community.graphs.graph_document import Node, Relationship
+            # Provenance shared by every node and relationship of the chunk
+            common_props = {"chunk_id": chunk_id, "source_document": source_document}
             
-            # Convert entities to nodes
+            # Convert entities to nodes, mapping node IDs to Node objects in the same pass
             nodes = []
+            node_map = {}
             for entity in kg.entities:
                 node = Node(
                     id=entity.id,
@@ -103,96 +289,174 @@ class GraphRAGIngestor:
                         "publication_date": entity.publication_date,
                         "document_type": entity.document_type,
                         "reference_number": entity.reference_number,
-                        "chunk_id": chunk_id,
-                        "source_document": source_document
+                        **common_props
                     }
                 )
                 nodes.append(node)
+                node_map[entity.id] = node
             
-            # Convert relationships
+            # Convert relationships between known nodes
             relationships = []
-            # Create a mapping of node IDs to Node objects for easy lookup
-            node_map = {node.id: node for node in nodes}
-            
             for rel in kg.relationships:
-                # Get the source and target nodes
                 source_node = node_map.get(rel.source_entity_id)
                 target_node = node_map.get(rel.target_entity_id)
-                
                 if source_node and target_node:
-                    relationship = Relationship(
+                    relationships.append(GraphRelationship(
                         source=source_node,
                         target=target_node,
                         type=rel.type,
-                        properties={
-                            "description": rel.description or "",
-                            "chunk_id": chunk_id,
-                            "source_document": source_document
-                        }
-                    )
-                    relationships.append(relationship)
+                        properties={"description": rel.description or "", **common_props}
+                    ))
             
             # Create document for the chunk
             document = Document(
                 page_content=f"Chunk {chunk_id} from {source_document}",
-                metadata={
-                    "chunk_id": chunk_id,
-                    "source_document": source_document
-                }
+                metadata=dict(common_props)
             )
             
-            # Create GraphDocument
-            graph_document = GraphDocument(
+            return GraphDocument(
                 nodes=nodes,
                 relationships=relationships,
                 source=document
             )
             
-            return graph_document
-            
         except Exception as e:
             logger.error(f"Error converting to GraphDocument: {str(e)}")
             return None
     
     def store_graph_and_embeddings(self, graph_document: GraphDocument):
         """Store the graph document and generate embeddings for the nodes."""
+        if not graph_document:
+            logger.warning("No graph document to store.")
+            return
+        self.store_all([graph_document])
+    
+    def store_all(self, graph_documents: List[GraphDocument]):
+        """Store many graph documents at once, embedding all node descriptions in batched requests."""
+        graph_documents = [gd for gd in graph_documents if gd]
+        if not graph_documents:
+            logger.warning("No graph documents to store.")
+            return
+        
         try:
-            if not graph_document:
-                logger.warning("No graph document to store.")
-                return
-
-            # Create documents for vector store from the nodes' descriptions
-            # We will embed the description of each entity
-            documents_to_embed = [
-                Document(page_content=node.properties.get("description", ""), metadata=node.properties)
-                for node in graph_document.nodes if node.properties.get("description")
-            ]
-
             # Store graph structure
-            self.graph.add_graph_documents([graph_document])
-            logger.info(f"Stored graph document with {len(graph_document.nodes)} nodes and {len(graph_document.relationships)} relationships.")
-
-            # Add documents to the vector store, which also creates embeddings
-            if documents_to_embed:
-                self.vector_store.add_documents(documents_to_embed)
-                logger.info(f"Generated and stored embeddings for {len(documents_to_embed)} nodes.")
-
+            self.write_graph(graph_documents)
+            self._log_stored(graph_documents)
+            self.store_embeddings(graph_documents)
+            self.graph.query(MARK_CHUNKS_QUERY, {"chunks": self._chunk_markers(graph_documents)})
         except Exception as e:
             logger.error(f"Error storing graph and embeddings: {str(e)}")
     
+    async def astore_all(self, driver, graph_documents: List[GraphDocument]):
+        """Async variant of store_all: the graph write runs on the async driver."""
+        graph_documents = [gd for gd in graph_documents if gd]
+        if not graph_documents:
+            logger.warning("No graph documents to store.")
+            return
+        
+        try:
+            await self.awrite_graph(driver, graph_documents)
+            self._log_stored(graph_documents)
+            # The embeddings client and vector store are sync: keep them off the event loop
+            await asyncio.to_thread(self.store_embeddings, graph_documents)
+            await self._run(driver, MARK_CHUNKS_QUERY, {"chunks": self._chunk_markers(graph_documents)})
+        except Exception as e:
+            logger.error(f"Error storing graph and embeddings: {str(e)}")
+    
+    def _chunk_markers(self, graph_documents: List[GraphDocument]) -> List[Dict[str, str]]:
+        """Return the chunk records that mark the chunks of the graph documents as processed."""
+        return [
+            {"id": gd.source.metadata["chunk_id"], "source_document": gd.source.metadata["source_document"]}
+            for gd in graph_documents
+        ]
+    
+    def _log_stored(self, graph_documents: List[GraphDocument]):
+        """Log how many nodes and relationships were written."""
+        node_count = sum(len(gd.nodes) for gd in graph_documents)
+        relationship_count = sum(len(gd.relationships) for gd in graph_documents)
+        logger.info(f"Stored {len(graph_documents)} graph documents with {node_count} nodes and {relationship_count} relationships.")
+    
+    def store_embeddings(self, graph_documents: List[GraphDocument]):
+        """Embed the node descriptions of the graph documents and write them to the vector store."""
+        texts, metadatas = [], []
+        for description, properties in self._embed_iter(graph_documents):
+            texts.append(description)
+            metadatas.append(properties)
+        if not texts:
+            return
+        
+        embeddings = []
+        for i in range(0, len(texts), EMBEDDING_BATCH_SIZE):
+            embeddings.extend(self.embeddings.embed_documents(texts[i:i + EMBEDDING_BATCH_SIZE]))
+        
+        self.vector_store.add_embeddings(
+            texts=texts,
+            embeddings=embeddings,
+            metadatas=metadatas
+        )
+        logger.info(f"Generated and stored embeddings for {len(texts)} nodes.")
+    
+    def _embed_iter(self, graph_documents: List[GraphDocument]) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Yield (description, properties) of each node to embed, skipping nodes without a description."""
+        # Embed each entity once per (entity, description):
+        # chunks often re-describe the same entity with identical text
+        seen = set()
+        for gd in graph_documents:
+            for node in gd.nodes:
+                description = node.properties.get("description")
+                if not description:
+                    continue
+                key = (node.id, hashlib.sha256(description.encode("utf-8")).digest())
+                if key not in seen:
+                    seen.add(key)
+                    yield description, node.properties
+    
+    def _graph_write_params(self, graph_documents: List[GraphDocument]) -> Tuple[List[Dict], List[Dict]]:
+        """Flatten the nodes and relationships of many graph documents into UNWIND parameters."""
+        nodes = [
+            {"id": node.id, "type": node.type.replace("`", ""), "properties": node.properties}
+            for gd in graph_documents for node in gd.nodes
+        ]
+        rels = [
+            {
+                "source": rel.source.id,
+                "source_label": rel.source.type.replace("`", ""),
+                "target": rel.target.id,
+                "target_label": rel.target.type.replace("`", ""),
+                "type": rel.type.replace(" ", "_").upper().replace("`", ""),
+                "properties": rel.properties
+            }
+            for gd in graph_documents for rel in gd.relationships
+        ]
+        return nodes, rels
+    
+    def write_graph(self, graph_documents: List[GraphDocument]):
+        """Write the nodes and relationships of many graph documents in two UNWIND queries."""
+        nodes, rels = self._graph_write_params(graph_documents)
+        if nodes:
+            self.graph.query(NODE_IMPORT_QUERY, {"nodes": nodes})
+        if rels:
+            self.graph.query(REL_IMPORT_QUERY, {"rels": rels})
+    
+    async def awrite_graph(self, driver, graph_documents: List[GraphDocument]):
+        """Async variant of write_graph, run on the async driver."""
+        nodes, rels = self._graph_write_params(graph_documents)
+        if nodes:
+            await self._run(driver, NODE_IMPORT_QUERY, {"nodes": nodes})
+        if rels:
+            await self._run(driver, REL_IMPORT_QUERY, {"rels": rels})
+    
     def create_vector_indices(self):
         """Create vector indices in Neo4j for semantic search."""
         try:
-            # Create vector index using the new CREATE VECTOR INDEX syntax (Neo4j 5.x+)
-            self.graph.query("""
-                CREATE VECTOR INDEX vector_index IF NOT EXISTS
-                FOR (n:Entity)
-                ON n.description
-                OPTIONS {indexConfig: {
-                    `vector.dimensions`: 1536,
-                    `vector.similarity_function`: 'cosine'
-                }}
-            """)
+            # Create a quantized vector index (Neo4j 5.23+): the index keeps compact vectors in memory
+            self.graph.query(VECTOR_INDEX_QUERY.format(quantization="`vector.quantization.enabled`: true,"))
+            logger.info("Vector index created successfully")
+            return
+        except Exception as e:
+            logger.warning(f"Could not create quantized vector index, retrying without quantization: {str(e)}")
+        try:
+            self.graph.query(VECTOR_INDEX_QUERY.format(quantization=""))
             logger.info("Vector index created successfully")
         except Exception as e:
             logger.warning(f"Could not create vector index: {str(e)}")
@@ -227,6 +491,22 @@ class GraphRAGIngestor:
         # Store graph and generate embeddings
         self.store_graph_and_embeddings(graph_document)
     
+    async def aprocess_chunk(self, chunk_data: Dict[str, Any], source_document: str,
+                             semaphore: asyncio.Semaphore) -> GraphDocument:
+        """Extract a chunk's graph document, bounding concurrent LLM extractions with `semaphore`."""
+        chunk_id = chunk_data.get("id", "")
+        text = chunk_data.get("testo", "")
+        
+        if not text:
+            logger.warning(f"Empty text for chunk {chunk_id}")
+            return
+        
+        async with semaphore:
+            logger.info(f"Processing chunk {chunk_id}")
+            kg = await self.aextract_knowledge_graph(text)
+        
+        return self.convert_to_graph_document(kg, chunk_id, source_document)
+    
     def document_already_processed(self, source_document: str) -> bool:
         """Check if a document has already been processed by querying Neo4j."""
         try:
@@ -241,24 +521,88 @@ class GraphRAGIngestor:
             logger.warning(f"Error checking if document already processed: {str(e)}")
             return False
     
+    def processed_chunk_ids(self, source_document: str) -> set:
+        """Return the ids of the chunks of a document already stored in Neo4j, in one query."""
+        try:
+            result = self.graph.query(PROCESSED_CHUNKS_QUERY, {"source_document": source_document})
+            return {row["chunk_id"] for row in result}
+        except Exception as e:
+            logger.warning(f"Error checking processed chunks: {str(e)}")
+            return set()
+    
+    async def aprocessed_chunk_ids(self, driver, source_document: str) -> set:
+        """Async variant of processed_chunk_ids, run on the async driver."""
+        try:
+            result = await self._run(driver, PROCESSED_CHUNKS_QUERY, {"source_document": source_document})
+            return {row["chunk_id"] for row in result}
+        except Exception as e:
+            logger.warning(f"Error checking processed chunks: {str(e)}")
+            return set()
+    
+    def _async_driver(self):
+        """Open an async Neo4j driver for the running event loop, pooled like the chatbot's driver."""
+        return AsyncGraphDatabase.driver(
+            NEO4J_URI, auth=(NEO4J_USERNAME, NEO4J_PASSWORD), **NEO4J_DRIVER_CONFIG
+        )
+    
+    async def _run(self, driver, cypher: str, params: Dict[str, Any] = None) -> List[Dict[str, Any]]:
+        """Run a Cypher query on the async driver and return its records as dicts."""
+        async with driver.session() as session:
+            result = await session.run(cypher, params or {})
+            return [record.data() async for record in result]
+    
     def process_document_json(self, json_path: str):
         """Process a document JSON file through the pipeline."""
+        asyncio.run(self.aprocess_document_json(json_path))
+    
+    async def aprocess_document_json(self, json_path: str):
+        """Process a document JSON file, extracting up to GRAPHRAG_CONCURRENCY chunks at a time."""
+        await self.aprocess_documents([json_path])
+    
+    async def aprocess_documents(self, json_paths: List[str]):
+        """Process document JSON files one after another over a single pooled async driver."""
+        # The async driver is bound to the running event loop, so each run opens its own
+        async with self._async_driver() as driver:
+            # Index the dedup lookups before the first one, once per run
+            await self.acreate_entity_indices(driver)
+            for json_path in json_paths:
+                await self._aprocess_document_json(driver, json_path)
+    
+    async def _aprocess_document_json(self, driver, json_path: str):
+        """Process a document JSON file, running Neo4j queries on `driver` alongside the LLM calls."""
         try:
-            with open(json_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            with open(json_path, 'rb') as f:
+                data = orjson.loads(f.read())
             
             source_document = data.get("file_sorgente", "")
             chunks = data.get("chunks", [])
             
-            # Check if document already processed
-            if self.document_already_processed(source_document):
-                logger.info(f"Document {source_document} already processed, skipping...")
-                return
+            # Skip chunks already stored by a previous (possibly interrupted) run;
+            # chunks without text are never extracted, so they never count as pending
+            existing = await self.aprocessed_chunk_ids(driver, source_document)
+            if existing:
+                chunks = [chunk for chunk in chunks if chunk.get("testo") and chunk.get("id", "") not in existing]
+                if not chunks:
+                    logger.info(f"Document {source_document} already processed, skipping...")
+                    return
+                logger.info(f"Document {source_document} partially processed, resuming {len(chunks)} chunks")
             
             logger.info(f"Processing document {source_document} with {len(chunks)} chunks")
             
-            for chunk in chunks:
-                self.process_chunk(chunk, source_document)
+            semaphore = asyncio.Semaphore(GRAPHRAG_CONCURRENCY)
+            results = await asyncio.gather(
+                *[self.aprocess_chunk(chunk, source_document, semaphore) for chunk in chunks],
+                return_exceptions=True
+            )
+            graph_documents = []
+            for chunk, result in zip(chunks, results):
+                if isinstance(result, Exception):
+                    logger.error(f"Error processing chunk {chunk.get('id', '')}: {str(result)}")
+                elif result:
+                    graph_documents.append(result)
+            
+            # One graph write and batched embedding requests for the whole document
+            await self.astore_all(driver, graph_documents)
                 
         except Exception as e:
             logger.error(f"Error processing document {json_path}: {str(e)}")
@@ -273,18 +617,53 @@ class GraphRAGIngestor:
         
         logger.info(f"Found {len(json_files)} JSON files to process")
         
-        for json_file in json_files:
-            self.process_document_json(str(json_file))
-        
-        # Create indices after processing all documents
+        # Create search indices up front so they are maintained as documents are written
         self.create_vector_indices()
         self.create_keyword_indices()
+        
+        if USE_BATCH_API:
+            self.process_documents_batch([str(json_file) for json_file in json_files])
+        else:
+            # One event loop and one driver for the whole run
+            asyncio.run(self.aprocess_documents([str(json_file) for json_file in json_files]))
+    
+    def process_documents_batch(self, json_paths: List[str]):
+        """Two-phase ingestion: collect every pending chunk, batch-extract them, then store."""
+        # Index the dedup lookups before the first one, as the async path does
+        self.create_entity_indices()
+        all_chunks = []
+        for json_path in json_paths:
+            try:
+                with open(json_path, 'rb') as f:
+                    data = orjson.loads(f.read())
+            except Exception as e:
+                logger.error(f"Error reading document {json_path}: {str(e)}")
+                continue
+            
+            source_document = data.get("file_sorgente", "")
+            existing = self.processed_chunk_ids(source_document)
+            
+            for chunk in data.get("chunks", []):
+                if chunk.get("testo") and chunk.get("id", "") not in existing:
+                    all_chunks.append((chunk.get("id", ""), chunk["testo"], source_document))
+        
+        knowledge_graphs = self.batch_extract(all_chunks)
+        graph_documents = []
+        for chunk_id, _, source_document in all_chunks:
+            kg = knowledge_graphs.get(chunk_id)
+            if kg is None:
+                logger.warning(f"No extraction result for chunk {chunk_id}")
+                continue
+            graph_documents.append(self.convert_to_graph_document(kg, chunk_id, source_document))
+        self.store_all(graph_documents)
     
     def close(self):
-        """Close the Neo4j connection."""
-        if hasattr(self, 'graph') and self.graph:
-            # Neo4jGraph handles connection cleanup automatically
-            pass
+        """Close the Neo4j connection and the embedding cache."""
+        # Only clean up clients that were actually created
+        if 'graph' in self.__dict__:
+            self.graph.close()
+        if 'embeddings' in self.__dict__:
+            self.embeddings.close()
 
 def main():
     """Main function to run the ingestion pipeline."""
@@ -292,6 +671,9 @@ def main():
     import os
     sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
     from config.settings import OPENAI_API_KEY
+    from src.logging_config import configure_logging
+    
+    configure_logging()
     
     # Initialize ingestor
     ingestor = GraphRAGIngestor(openai_api_key=OPENAI_API_KEY)
@@ -0,0 +1,15 @@
+"""Logging setup for the GraphRAG command-line entry points."""
+
+import logging
+
+from config.settings import LOG_LEVEL
+
+# Third-party loggers that emit one INFO line per HTTP request
+NOISY_LOGGERS = ("httpx", "openai", "neo4j")
+
+
+def configure_logging(level: str = LOG_LEVEL):
+    """Configure root logging once, for scripts only; library modules just get a logger."""
+    logging.basicConfig(level=level)
+    for name in NOISY_LOGGERS:
+        logging.getLogger(name).setLevel(logging.WARNING)
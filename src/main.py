@@ -3,19 +3,32 @@
 import os
 import sys
 import logging
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
+from typing import Optional
 
 # Add project root to path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from src.preprocess import DocumentPreprocessor
+from src.preprocess import DocumentPreprocessor, init_worker, write_json_atomic
 from src.ingest import GraphRAGIngestor
+from src.logging_config import configure_logging
 from config.settings import INPUT_DOCUMENTS_PATH, OUTPUT_JSON_PATH, OPENAI_API_KEY
 
-# Set up logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+def _preprocess_one(pdf_path: str) -> Optional[str]:
+    """Preprocess one PDF in a worker process and write its JSON, returning the output path."""
+    # Each worker builds its own preprocessor: nothing but the path crosses the process boundary
+    output_data = DocumentPreprocessor().process_pdf(pdf_path)
+    if not output_data:
+        return None
+    
+    output_filename = os.path.splitext(os.path.basename(pdf_path))[0] + '.json'
+    output_path = os.path.join(OUTPUT_JSON_PATH, output_filename)
+    write_json_atomic(output_path, output_data)
+    return output_path
+
 def run_pipeline(clear_database: bool = False):
     """Run the complete GraphRAG pipeline."""
     
@@ -30,35 +43,34 @@ def run_pipeline(clear_database: bool = False):
         # Create output directory if it doesn't exist
         os.makedirs(OUTPUT_JSON_PATH, exist_ok=True)
         
-        # Initialize preprocessor
-        preprocessor = DocumentPreprocessor()
-        
         # Process all PDF files
         pdf_files = [f for f in os.listdir(INPUT_DOCUMENTS_PATH) if f.endswith('.pdf')]
         
         logger.info(f"Found {len(pdf_files)} PDF files to process")
         print(f"Found {len(pdf_files)} PDF files to process")
         
+        # PDF parsing is CPU-bound and independent per file: spread it across processes
         processed_files = 0
-        for pdf_file in pdf_files:
-            pdf_path = os.path.join(INPUT_DOCUMENTS_PATH, pdf_file)
-            output_data = preprocessor.process_pdf(pdf_path)
-            
-            if output_data:
-                # Save to JSON file
-                output_filename = os.path.splitext(pdf_file)[0] + '.json'
-                output_path = os.path.join(OUTPUT_JSON_PATH, output_filename)
-                
-                import json
-                with open(output_path, 'w', encoding='utf-8') as f:
-                    json.dump(output_data, f, ensure_ascii=False, indent=2)
+        with ProcessPoolExecutor(max_workers=os.cpu_count(), initializer=init_worker) as executor:
+            futures = {
+                executor.submit(_preprocess_one, os.path.join(INPUT_DOCUMENTS_PATH, pdf_file)): pdf_file
+                for pdf_file in pdf_files
+            }
+            for future in as_completed(futures):
+                pdf_file = futures[future]
+                try:
+                    output_path = future.result()
+                except Exception as e:
+                    logger.error(f"Error processing {pdf_file}: {str(e)}")
+                    output_path = None
                 
-                logger.info(f"Saved {output_path}")
-                print(f"✅ Processed: {pdf_file}")
-                processed_files += 1
-            else:
-                logger.error(f"Failed to process {pdf_file}")
-                print(f"❌ Failed: {pdf_file}")
+                if output_path:
+                    logger.info(f"Saved {output_path}")
+                    print(f"✅ Processed: {pdf_file}")
+                    processed_files += 1
+                else:
+                    logger.error(f"Failed to process {pdf_file}")
+                    print(f"❌ Failed: {pdf_file}")
         
         print(f"\nPreprocessing completed: {processed_files}/{len(pdf_files)} files processed")
         
@@ -95,4 +107,5 @@ def run_pipeline(clear_database: bool = False):
     print("python src/chatbot.py")
 
 if __name__ == "__main__":
+    configure_logging()
     run_pipeline()
@@ -1,16 +1,74 @@
 """Lightweight preprocessing for Graphiti - LLM-First approach."""
 
-import fitz  # PyMuPDF
-import json
 import os
-from langdetect import detect
-from typing import Dict, List, Any
+import re
+import numpy as np
+import orjson
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import Dict, List, Any, Union
 import logging
 
-# Set up logging
-logging.basicConfig(level=logging.INFO)
+# PyMuPDF, langdetect and lingua are slow to import: they are loaded on first use
+
 logger = logging.getLogger(__name__)
 
+# Page breaks in text not extracted page by page: blank lines or form feeds
+_PAGE_BREAK_RE = re.compile(r'\n{2,}|\f')
+
+# Characters of text given to the language detector: accuracy saturates well before
+LANGUAGE_SAMPLE_SIZE = 2048
+
+def get_text_flags(fitz) -> int:
+    """Return PyMuPDF's plain-text extraction flags without image and ligature processing."""
+    return fitz.TEXTFLAGS_TEXT & ~fitz.TEXT_PRESERVE_IMAGES & ~fitz.TEXT_PRESERVE_LIGATURES
+
+def chunk_boundaries(text: str, chunk_size: int) -> List[int]:
+    """
+    Return the offsets that split `text` into windows of about `chunk_size` characters.
+    
+    Each fixed-size cut is moved back to just after the last newline of the window that
+    precedes it, when that window has one, so chunks end on line boundaries.
+    """
+    targets = np.arange(chunk_size, len(text), chunk_size)
+    if not len(targets):
+        return [0, len(text)]
+    # UTF-32 gives one code point per element, so indices are string offsets
+    codes = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)
+    newlines = np.flatnonzero(codes == ord("\n"))
+    if not len(newlines):
+        return [0, *targets.tolist(), len(text)]
+    idx = np.searchsorted(newlines, targets, side="right") - 1
+    cuts = np.where(idx >= 0, newlines[np.maximum(idx, 0)] + 1, targets)
+    # Keep the fixed-size cut when the window has no newline of its own
+    cuts = np.where(cuts > targets - chunk_size, cuts, targets)
+    return [0, *cuts.tolist(), len(text)]
+
+def write_json_atomic(output_path: str, data: Any):
+    """Write `data` as indented JSON to `output_path` so readers never see a truncated file."""
+    payload = orjson.dumps(data, option=orjson.OPT_INDENT_2)
+    # Write to a temporary file first so an interrupted run never leaves a truncated JSON
+    tmp_path = f"{output_path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(payload)
+    os.replace(tmp_path, output_path)
+
+@lru_cache(maxsize=1)
+def get_language_detector():
+    """Build the native lingua detector once per process, or return None if lingua is not installed."""
+    try:
+        from lingua import LanguageDetectorBuilder
+    except ImportError:  # lingua is optional: fall back to langdetect
+        return None
+    return LanguageDetectorBuilder.from_all_languages().with_low_accuracy_mode().build()
+
+def init_worker():
+    """Load PyMuPDF and the language detector once in a worker process, before its first PDF."""
+    import fitz  # noqa: F401
+    if get_language_detector() is None:
+        from langdetect.detector_factory import init_factory
+        init_factory()
+
 class DocumentPreprocessor:
     def __init__(self):
         """Initialize the lightweight preprocessor."""
@@ -18,37 +76,58 @@ class DocumentPreprocessor:
     
     def extract_text_from_pdf(self, pdf_path: str) -> str:
         """Extract clean text from PDF using PyMuPDF."""
+        # A single join instead of growing the text page by page
+        return "\n".join(self.extract_pages(pdf_path)).strip()
+    
+    def extract_pages(self, pdf_path: str) -> List[str]:
+        """Extract the text of each PDF page using PyMuPDF."""
         try:
-            doc = fitz.open(pdf_path)
-            full_text = ""
-            for page in doc:
-                full_text += page.get_text() + "\n"
+            import fitz  # PyMuPDF
+            
+            doc = fitz.open(filename=pdf_path, filetype="pdf")
+            flags = get_text_flags(fitz)
+            pages = []
+            # Load one page at a time so MuPDF can release each page before the next
+            for i in range(doc.page_count):
+                page = doc.load_page(i)
+                pages.append(page.get_text("text", flags=flags))
+                page = None
             doc.close()
-            return full_text.strip()
+            return pages
         except Exception as e:
             logger.error(f"Error extracting text from {pdf_path}: {str(e)}")
-            return ""
+            return []
     
     def detect_language(self, text: str) -> str:
-        """Detect language of text using langdetect."""
+        """Detect language of text using lingua when available, langdetect otherwise."""
+        text = text[:LANGUAGE_SAMPLE_SIZE]
         try:
-            return detect(text)
+            detector = get_language_detector()
+            if detector is None:
+                from langdetect import detect
+                return detect(text)
+            language = detector.detect_language_of(text)
+            return language.iso_code_639_1.name.lower() if language else "unknown"
         except:
             return "unknown"
     
-    def chunk_by_pages(self, text: str, filename: str) -> List[Dict[str, str]]:
+    def chunk_by_pages(self, pages: Union[List[str], str], filename: str) -> List[Dict[str, str]]:
         """
-        Simple chunking by pages. Since we already have page breaks from PyMuPDF,
-        we'll treat each page as a chunk.
+        Simple chunking by pages: each page extracted by PyMuPDF becomes a chunk.
+        Text from other extractors is split into pages on blank lines and form feeds.
         """
-        # Split by the page breaks that PyMuPDF adds
-        pages = text.split('\n\n')  # PyMuPDF adds double newlines between pages
+        if isinstance(pages, str):
+            pages = _PAGE_BREAK_RE.split(pages)
+        stem = os.path.splitext(filename)[0]
         chunks = []
         
         for i, page_text in enumerate(pages):
+            # Stripping never lengthens a page: reject short pages before copying them
+            if len(page_text) <= 50:
+                continue
             page_text = page_text.strip()
             if len(page_text) > 50:  # Only keep substantial pages
-                chunk_id = f"{os.path.splitext(filename)[0]}_pagina_{i+1}"
+                chunk_id = f"{stem}_pagina_{i+1}"
                 chunks.append({
                     "id": chunk_id,
                     "testo": page_text
@@ -57,11 +136,13 @@ class DocumentPreprocessor:
         # If no chunks were created (maybe different formatting), create one chunk per 1000 chars
         if not chunks:
             # Fallback: chunk by character count
+            text = "\n".join(pages)
             chunk_size = 2000  # Larger chunks for better context
-            for i in range(0, len(text), chunk_size):
-                chunk_text = text[i:i + chunk_size].strip()
+            boundaries = chunk_boundaries(text, chunk_size)
+            for i, (start, end) in enumerate(zip(boundaries, boundaries[1:])):
+                chunk_text = text[start:end].strip()
                 if len(chunk_text) > 50:
-                    chunk_id = f"{os.path.splitext(filename)[0]}_chunk_{i//chunk_size + 1}"
+                    chunk_id = f"{stem}_chunk_{i + 1}"
                     chunks.append({
                         "id": chunk_id,
                         "testo": chunk_text
@@ -81,17 +162,18 @@ class DocumentPreprocessor:
             # Get filename
             filename = os.path.basename(pdf_path)
             
-            # Extract text
-            full_text = self.extract_text_from_pdf(pdf_path)
-            if not full_text:
+            # Extract text, page by page
+            pages = self.extract_pages(pdf_path)
+            first_page = next((page for page in pages if page.strip()), None)
+            if first_page is None:
                 logger.error(f"No text extracted from {pdf_path}")
                 return None
             
-            # Detect language
-            language = self.detect_language(full_text)
+            # Detect language on the first page: the detector only needs a sample
+            language = self.detect_language(first_page)
             
             # Create chunks
-            chunks = self.chunk_by_pages(full_text, filename)
+            chunks = self.chunk_by_pages(pages, filename)
             
             # Create simple output structure
             output_data = {
@@ -115,6 +197,9 @@ def main():
     import os
     sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
     from config.settings import INPUT_DOCUMENTS_PATH, OUTPUT_JSON_PATH
+    from src.logging_config import configure_logging
+    
+    configure_logging()
     
     # Create output directory if it doesn't exist
     os.makedirs(OUTPUT_JSON_PATH, exist_ok=True)
@@ -127,21 +212,20 @@ def main():
     
     logger.info(f"Found {len(pdf_files)} PDF files to process")
     
-    for pdf_file in pdf_files:
-        pdf_path = os.path.join(INPUT_DOCUMENTS_PATH, pdf_file)
-        output_data = preprocessor.process_pdf(pdf_path)
-        
-        if output_data:
-            # Save to JSON file
-            output_filename = os.path.splitext(pdf_file)[0] + '.json'
-            output_path = os.path.join(OUTPUT_JSON_PATH, output_filename)
-            
-            with open(output_path, 'w', encoding='utf-8') as f:
-                json.dump(output_data, f, ensure_ascii=False, indent=2)
-            
-            logger.info(f"Saved {output_path}")
-        else:
-            logger.error(f"Failed to process {pdf_file}")
+    pdf_paths = [os.path.join(INPUT_DOCUMENTS_PATH, pdf_file) for pdf_file in pdf_files]
+    
+    # Text extraction is CPU-bound: parse PDFs in worker processes, write JSON here
+    with ProcessPoolExecutor(max_workers=min(os.cpu_count() or 1, 4), initializer=init_worker) as executor:
+        for pdf_file, output_data in zip(pdf_files, executor.map(preprocessor.process_pdf, pdf_paths)):
+            if output_data:
+                # Save to JSON file
+                output_filename = os.path.splitext(pdf_file)[0] + '.json'
+                output_path = os.path.join(OUTPUT_JSON_PATH, output_filename)
+                write_json_atomic(output_path, output_data)
+                
+                logger.info(f"Saved {output_path}")
+            else:
+                logger.error(f"Failed to process {pdf_file}")
 
 if __name__ == "__main__":
     main()
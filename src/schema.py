@@ -1,5 +1,6 @@
 """Schema definitions for the GraphRAG knowledge graph using LangChain."""
 
+from functools import lru_cache
 from typing import List, Optional, Dict, Any
 from pydantic import BaseModel, Field
 from langchain_core.prompts import ChatPromptTemplate
@@ -34,14 +35,19 @@ DOCUMENT_TYPES = [
     'Opinion'                  # English opinion
 ]
 
+# Type lists as they appear in field descriptions and prompts
+_ENTITY_TYPES_STR = ", ".join(ENTITY_TYPES)
+_RELATIONSHIP_TYPES_STR = ", ".join(RELATIONSHIP_TYPES)
+_DOCUMENT_TYPES_STR = ", ".join(DOCUMENT_TYPES)
+
 class Entity(BaseModel):
     """Entity extracted from the document."""
     id: str = Field(description="Unique identifier for the entity")
-    type: str = Field(description=f"Type of entity. Must be one of: {', '.join(ENTITY_TYPES)}")
+    type: str = Field(description=f"Type of entity. Must be one of: {_ENTITY_TYPES_STR}")
     name: str = Field(description="Name or title of the entity")
     description: Optional[str] = Field(default="", description="Additional details about the entity")
     publication_date: Optional[str] = Field(default=None, description="Publication date of the document in YYYY-MM-DD format")
-    document_type: Optional[str] = Field(default=None, description=f"Specific type of the document, if applicable. Must be one of: {', '.join(DOCUMENT_TYPES)}")
+    document_type: Optional[str] = Field(default=None, description=f"Specific type of the document, if applicable. Must be one of: {_DOCUMENT_TYPES_STR}")
     reference_number: Optional[str] = Field(default=None, description="Official reference number of the document, e.g., 'n. 370 del 20 giugno 2024'")
 
 class Relationship(BaseModel):
@@ -49,7 +55,7 @@ class Relationship(BaseModel):
     id: str = Field(description="Unique identifier for the relationship")
     source_entity_id: str = Field(description="ID of the source entity")
     target_entity_id: str = Field(description="ID of the target entity")
-    type: str = Field(description=f"Type of relationship. Must be one of: {', '.join(RELATIONSHIP_TYPES)}")
+    type: str = Field(description=f"Type of relationship. Must be one of: {_RELATIONSHIP_TYPES_STR}")
     description: Optional[str] = Field(default="", description="Additional details about the relationship")
 
 class KnowledgeGraph(BaseModel):
@@ -57,8 +63,9 @@ class KnowledgeGraph(BaseModel):
     entities: List[Entity] = Field(description="List of entities extracted from the document")
     relationships: List[Relationship] = Field(description="List of relationships between entities")
 
+@lru_cache(maxsize=1)
 def get_extraction_prompt() -> ChatPromptTemplate:
-    """Return the schema guidance prompt for the LLM using LangChain's ChatPromptTemplate."""
+    """Return the schema guidance prompt for the LLM using LangChain's ChatPromptTemplate, built once."""
     return ChatPromptTemplate.from_messages([
         ("system", """Sei un esperto analista legale specializzato in privacy. Analizza il testo fornito e estrai un grafo di conoscenza strutturato.
 
@@ -86,18 +93,19 @@ ISTRUZIONI DETTAGLIATE:
 Restituisci il risultato in formato JSON seguendo lo schema Pydantic fornito."""),
         ("human", "{text}")
     ]).partial(
-        entity_types=", ".join(ENTITY_TYPES),
-        relationship_types=", ".join(RELATIONSHIP_TYPES),
-        document_types=", ".join(DOCUMENT_TYPES)
+        entity_types=_ENTITY_TYPES_STR,
+        relationship_types=_RELATIONSHIP_TYPES_STR,
+        document_types=_DOCUMENT_TYPES_STR
     )
 
+@lru_cache(maxsize=8)
 def get_system_prompt(document_type: str = "documento giuridico") -> str:
     """Return the base system prompt for the LLM (legacy compatibility)."""
     return f"""Sei un esperto analista legale specializzato in privacy. Analizza il testo seguente e estrai un grafo di conoscenza.
 
 SCHEMA DESIDERATO:
-- Nodi (Entità): {', '.join(ENTITY_TYPES)}
-- Relazioni: {', '.join(RELATIONSHIP_TYPES)}
+- Nodi (Entità): {_ENTITY_TYPES_STR}
+- Relazioni: {_RELATIONSHIP_TYPES_STR}
 
 ISTRUZIONI:
 1. Identifica l'entità principale 'Provvedimento' e i suoi attributi chiave (data, numero, oggetto).
@@ -0,0 +1,149 @@
+"""Semantic cache that reuses results for near-duplicate questions."""
+
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+
+class SemCache:
+    """
+    Cache keyed by question meaning rather than exact text.
+
+    Questions are embedded and L2-normalized; a lookup returns the value stored for
+    the most similar cached question when the cosine similarity reaches `tau`.
+    At most `capacity` entries are kept: an OrderedDict tracks recency and the least
+    recently used entry's matrix row is reused for the next insertion.
+    Embedding requests run outside the lock, which only guards the matrix and its
+    bookkeeping, so concurrent lookups do not queue behind each other's API calls.
+    When `path` is set, each insertion is appended to a JSON Lines file, compacted
+    once it holds twice `capacity` lines; entries are re-embedded lazily on first use
+    (cheap when `embedder` is a CachedEmbeddings).
+    """
+
+    def __init__(self, embedder: Embeddings, tau: float = 0.93, path: Optional[str] = None,
+                 capacity: int = 1024):
+        """Initialize the cache with an embedder, a similarity threshold and a capacity."""
+        self.embedder = embedder
+        self.tau = tau
+        self.path = path
+        self.capacity = capacity
+        self._slots: "OrderedDict[str, int]" = OrderedDict()
+        self._questions: List[str] = []
+        self._values: List[Any] = []
+        self._matrix: Optional[np.ndarray] = None
+        self._loaded = path is None
+        self._log_lines = 0
+        self._lock = threading.Lock()
+        self._file_lock = threading.Lock()
+
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        """Embed texts into a matrix of unit-length float32 rows."""
+        vectors = np.asarray(self.embedder.embed_documents(texts), dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def _ensure_loaded(self):
+        """Load persisted entries from disk on first use."""
+        with self._lock:
+            if self._loaded:
+                return
+            self._loaded = True
+            if not os.path.exists(self.path):
+                return
+            # Later lines win, and their order is the recency order
+            entries: "OrderedDict[str, Any]" = OrderedDict()
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    self._log_lines += 1
+                    entry = json.loads(line)
+                    entries.pop(entry["question"], None)
+                    entries[entry["question"]] = entry["value"]
+            entries = list(entries.items())[-self.capacity:]
+            if entries:
+                self._questions = [question for question, _ in entries]
+                self._values = [value for _, value in entries]
+                self._matrix = self._embed(self._questions)
+                self._slots = OrderedDict((q, slot) for slot, q in enumerate(self._questions))
+
+    def _persist(self, question: str, value: Any):
+        """Append one entry to the log on disk, compacting it when it grows past twice the capacity."""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._file_lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps({"question": question, "value": value}, ensure_ascii=False) + "\n")
+            self._log_lines += 1
+            if self._log_lines <= 2 * self.capacity:
+                return
+            with self._lock:
+                entries = [{"question": q, "value": self._values[slot]} for q, slot in self._slots.items()]
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.writelines(json.dumps(entry, ensure_ascii=False) + "\n" for entry in entries)
+            os.replace(tmp_path, self.path)
+            self._log_lines = len(entries)
+
+    def get(self, question: str) -> Optional[Any]:
+        """Return the value cached for a semantically equivalent question, if any."""
+        try:
+            self._ensure_loaded()
+            with self._lock:
+                if not self._values:
+                    return None
+            query = self._embed([question])[0]
+            with self._lock:
+                scores = self._matrix @ query
+                best = int(np.argmax(scores))
+                if scores[best] >= self.tau:
+                    self._slots.move_to_end(self._questions[best])
+                    logger.info(f"Semantic cache hit (similarity {scores[best]:.3f}): '{self._questions[best]}'")
+                    return self._values[best]
+                return None
+        except Exception as e:
+            logger.warning(f"Error reading semantic cache: {str(e)}")
+            return None
+
+    def put(self, question: str, value: Any):
+        """Store a value for a question, evicting the least recently used entry when full."""
+        try:
+            self._ensure_loaded()
+            row = None
+            while True:
+                with self._lock:
+                    slot = self._slots.get(question)
+                    if slot is not None:
+                        # Already cached, possibly by a concurrent put while we were embedding
+                        self._values[slot] = value
+                        self._slots.move_to_end(question)
+                        break
+                    if row is not None:
+                        if len(self._slots) >= self.capacity:
+                            _, slot = self._slots.popitem(last=False)
+                            self._matrix[slot] = row[0]
+                            self._questions[slot] = question
+                            self._values[slot] = value
+                        else:
+                            slot = len(self._questions)
+                            self._matrix = row if self._matrix is None else np.vstack([self._matrix, row])
+                            self._questions.append(question)
+                            self._values.append(value)
+                        self._slots[question] = slot
+                        break
+                # Embed a new question without holding the lock, then insert it
+                row = self._embed([question])
+            if self.path:
+                self._persist(question, value)
+        except Exception as e:
+            logger.warning(f"Error writing semantic cache: {str(e)}")
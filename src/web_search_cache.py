@@ -0,0 +1,100 @@
+"""TTL cache for web search results, in memory and on disk."""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_query(query: str) -> str:
+    """Normalize a search query so trivially different spellings share a cache entry."""
+    return " ".join(query.lower().split())
+
+
+class WebSearchCache:
+    """
+    Cache of web search results keyed by normalized query, expiring after `ttl` seconds.
+
+    Entries live in an in-memory LRU of `maxsize` items and, when `path` is set, in one
+    JSON file per query under `path`, so results survive restarts. `alock_for(key)`
+    holds a per-key lock around the search to avoid duplicate requests for the same
+    query (cache stampede); each lock is dropped once no caller holds or waits on it,
+    so the lock table stays as small as the number of in-flight queries.
+    """
+
+    def __init__(self, path: Optional[str] = None, ttl: int = 86400, maxsize: int = 512):
+        """Initialize the cache directory, expiry and in-memory capacity."""
+        self.path = path
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._memory: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        # key -> [lock, number of callers holding or waiting on it]
+        self._locks: Dict[str, List[Any]] = {}
+        self._lock = threading.Lock()
+
+    @asynccontextmanager
+    async def alock_for(self, key: str):
+        """Hold the asyncio lock guarding searches for `key`, releasing it if the caller is cancelled."""
+        with self._lock:
+            entry = self._locks.setdefault(key, [asyncio.Lock(), 0])
+            entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._locks[key]
+
+    def _file(self, key: str) -> str:
+        """Return the disk path of the entry for `key`."""
+        return os.path.join(self.path, hashlib.sha256(key.encode("utf-8")).hexdigest() + ".json")
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the unexpired results cached for `key`, if any."""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+        if entry is None and self.path:
+            try:
+                with open(self._file(key), 'r', encoding='utf-8') as f:
+                    entry = json.load(f)
+            except (OSError, ValueError):
+                return None
+        if entry is None or time.time() - entry["created_at"] >= self.ttl:
+            return None
+        self._remember(key, entry)
+        return entry["results"]
+
+    def put(self, key: str, results: Any):
+        """Store the results for `key`."""
+        entry = {"created_at": time.time(), "results": results}
+        self._remember(key, entry)
+        if not self.path:
+            return
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            tmp_path = f"{self._file(key)}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(tmp_path, self._file(key))
+        except OSError as e:
+            logger.warning(f"Could not persist web search cache entry: {str(e)}")
+
+    def _remember(self, key: str, entry: Dict[str, Any]):
+        """Insert an entry into the in-memory LRU, evicting the oldest one."""
+        with self._lock:
+            self._memory[key] = entry
+            self._memory.move_to_end(key)
+            if len(self._memory) > self.maxsize:
+                self._memory.popitem(last=False)
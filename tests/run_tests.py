@@ -1,8 +1,12 @@
 """Test runner script for GraphRAG tests."""
 
-import subprocess
 import sys
 import os
+import importlib.util
+import pytest
+
+# Spread tests over all cores when pytest-xdist is installed, keeping each file on one worker
+PARALLEL_ARGS = ["-n", "auto", "--dist=loadfile"] if importlib.util.find_spec("xdist") else []
 
 def run_tests():
     """Run all GraphRAG tests."""
@@ -11,21 +15,17 @@ def run_tests():
     
     # Run pytest with coverage
     try:
-        # Run all tests
-        result = subprocess.run([
-            sys.executable, "-m", "pytest", 
+        # Run all tests in-process, streaming the output
+        exit_code = pytest.main([
             "tests/", 
             "-v", 
             "--tb=short",
-            "--disable-warnings"
-        ], capture_output=True, text=True)
-        
-        print(result.stdout)
-        if result.stderr:
-            print("STDERR:", result.stderr)
+            "--disable-warnings",
+            *PARALLEL_ARGS
+        ])
         
-        print(f"\nExit code: {result.returncode}")
-        return result.returncode == 0
+        print(f"\nExit code: {int(exit_code)}")
+        return exit_code == 0
         
     except Exception as e:
         print(f"Error running tests: {e}")
@@ -38,46 +38,63 @@ def run_unit_tests_only():
     
     try:
         # Run unit tests excluding integration tests
-        result = subprocess.run([
-            sys.executable, "-m", "pytest",
+        exit_code = pytest.main([
             "tests/",
             "-v",
             "--tb=short",
             "--disable-warnings",
-            "--ignore=tests/test_pipeline_integration.py"
-        ], capture_output=True, text=True)
+            "--ignore=tests/test_pipeline_integration.py",
+            *PARALLEL_ARGS
+        ])
         
-        print(result.stdout)
-        if result.stderr:
-            print("STDERR:", result.stderr)
-        
-        print(f"\nExit code: {result.returncode}")
-        return result.returncode == 0
+        print(f"\nExit code: {int(exit_code)}")
+        return exit_code == 0
         
     except Exception as e:
         print(f"Error running unit tests: {e}")
         return False
 
+def run_integration_tests():
+    """Run only the integration tests, which need live Neo4j and OpenAI services."""
+    print("🔌 Running Integration Tests Only")
+    print("=" * 35)
+    
+    try:
+        # Opt in before conftest.py is loaded, so it keeps the real credentials
+        os.environ["RUN_INTEGRATION"] = "1"
+        # Overrides the default "-m 'not integration'" from pyproject.toml
+        exit_code = pytest.main([
+            "tests/",
+            "-v",
+            "--tb=short",
+            "--disable-warnings",
+            "-m", "integration",
+            *PARALLEL_ARGS
+        ])
+        
+        print(f"\nExit code: {int(exit_code)}")
+        return exit_code == 0
+        
+    except Exception as e:
+        print(f"Error running integration tests: {e}")
+        return False
+
 def run_specific_test(test_file):
     """Run a specific test file."""
     print(f"🎯 Running Specific Test: {test_file}")
     print("=" * 40)
     
     try:
-        result = subprocess.run([
-            sys.executable, "-m", "pytest",
+        exit_code = pytest.main([
             f"tests/{test_file}",
             "-v",
             "--tb=short",
-            "--disable-warnings"
-        ], capture_output=True, text=True)
-        
-        print(result.stdout)
-        if result.stderr:
-            print("STDERR:", result.stderr)
+            "--disable-warnings",
+            *PARALLEL_ARGS
+        ])
         
-        print(f"\nExit code: {result.returncode}")
-        return result.returncode == 0
+        print(f"\nExit code: {int(exit_code)}")
+        return exit_code == 0
         
     except Exception as e:
         print(f"Error running specific test: {e}")
@@ -87,6 +104,8 @@ if __name__ == "__main__":
     if len(sys.argv) > 1:
         if sys.argv[1] == "unit":
             run_unit_tests_only()
+        elif sys.argv[1] == "integration":
+            run_integration_tests()
         elif sys.argv[1] == "all":
             run_tests()
         else:
@@ -95,6 +114,7 @@ if __name__ == "__main__":
         print("Usage:")
         print("  python tests/run_tests.py all      - Run all tests")
         print("  python tests/run_tests.py unit     - Run unit tests only")
+        print("  python tests/run_tests.py integration - Run integration tests only")
         print("  python tests/run_tests.py <file>   - Run specific test file")
         print("\nAvailable test files:")
         for file in os.listdir("."):
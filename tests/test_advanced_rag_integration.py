@@ -1,277 +1,196 @@
 """Integration tests for advanced RAG features (Adaptive RAG, CRAG, Self-RAG)."""
 
 import pytest
-from unittest.mock import Mock, patch, MagicMock
-import sys
-import os
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from types import SimpleNamespace
+from unittest.mock import Mock
+
+from langchain_openai import ChatOpenAI
+
+pytestmark = pytest.mark.usefixtures("no_sleep")
+
+@pytest.fixture
+def mocked_chatbot(patched_chatbot, monkeypatch):
+    """Build a GraphRAGChatbot with all external clients patched, exposing the LLM and vector store mocks."""
+    # Fresh mock state per test: the client patches are shared by the whole module
+    for mock in patched_chatbot.values():
+        mock.reset_mock(return_value=True, side_effect=True)
+    
+    # Spec'd mocks only expose the attributes of the real client
+    mock_llm_instance = Mock(spec=ChatOpenAI)
+    mock_bound_llm = Mock()
+    mock_llm_instance.bind_tools.return_value = mock_bound_llm
+    monkeypatch.setattr(patched_chatbot['ChatOpenAI'], "return_value", mock_llm_instance)
+    
+    from src.chatbot import GraphRAGChatbot
+    return SimpleNamespace(
+        chatbot=GraphRAGChatbot(openai_api_key="test-key"),
+        bound_llm=mock_bound_llm,
+        vector_store=patched_chatbot['Neo4jVector.from_existing_index'].return_value
+    )
 
 class TestAdvancedRAGIntegration:
     """Test advanced RAG integration."""
     
-    def test_adaptive_rag_workflow(self):
+    def test_adaptive_rag_workflow(self, mocked_chatbot):
         """Test Adaptive RAG workflow with query rewriting."""
         print("\nTesting Adaptive RAG workflow...")
         
-        # Mock all external dependencies
-        with patch('src.chatbot.ChatOpenAI') as mock_llm, \
-             patch('src.chatbot.Neo4jGraph') as mock_graph, \
-             patch('src.chatbot.GraphCypherQAChain') as mock_chain, \
-             patch('src.chatbot.Neo4jVector.from_existing_index') as mock_vector, \
-             patch('src.chatbot.TavilyClient') as mock_tavily:
-            
-            # Mock LLM responses for query rewriting
-            mock_llm_instance = MagicMock()
-            mock_llm.return_value = mock_llm_instance
-            
-            # Mock the LLM tool binding and invocation for rewrite sequence
-            mock_bound_llm = MagicMock()
-            mock_llm_instance.bind_tools.return_value = mock_bound_llm
-            
-            # First call: agent decides to rewrite query
-            mock_rewrite_response = Mock()
-            mock_rewrite_response.tool_calls = [{
-                "name": "rewrite_query_tool",
-                "args": {"question": "What are the rules?"},
-                "id": "call_1"
-            }]
-            mock_rewrite_response.content = ""
-            
-            # Second call: agent uses search after rewrite
-            mock_search_response = Mock()
-            mock_search_response.tool_calls = [{
-                "name": "hybrid_search_tool", 
-                "args": {"query": "Rewritten question about privacy regulations"},
-                "id": "call_2"
-            }]
-            mock_search_response.content = ""
-            
-            # Third call: agent generates final answer
-            mock_final_response = Mock()
-            mock_final_response.tool_calls = []
-            mock_final_response.content = "Final answer about privacy regulations"
-            
-            mock_bound_llm.invoke.side_effect = [
-                mock_rewrite_response,  # First agent decision
-                mock_search_response,   # Second agent decision after rewrite
-                mock_final_response     # Final answer
-            ]
-            
-            # Mock search tool responses
-            mock_vector_instance = Mock()
-            mock_vector.return_value = mock_vector_instance
-            mock_vector_instance.similarity_search.return_value = [
-                Mock(page_content="Privacy regulation document content", metadata={})
-            ]
-            
-            # Import and initialize chatbot
-            from src.chatbot import GraphRAGChatbot
-            chatbot = GraphRAGChatbot(openai_api_key="test-key")
-            
-            # Test the actual workflow execution with a question that should trigger rewrite
-            workflow = chatbot.build_workflow()
-            
-            # Test workflow building includes rewrite tool
-            assert workflow is not None
-            
-            # Test actual agent invocation sequence
-            initial_state = {"messages": [{"role": "user", "content": "What are the rules?"}]}
-            
-            # This would test the full sequence: rewrite -> search -> answer
-            # For now, just verify the workflow compiles correctly
-            print("  ✅ Adaptive RAG workflow building test passed")
-            
-            print("✅ Adaptive RAG workflow tests completed successfully")
+        # First call: agent decides to rewrite query
+        mock_rewrite_response = Mock()
+        mock_rewrite_response.tool_calls = [{
+            "name": "rewrite_query_tool",
+            "args": {"question": "What are the rules?"},
+            "id": "call_1"
+        }]
+        mock_rewrite_response.content = ""
+        
+        # Second call: agent uses search after rewrite
+        mock_search_response = Mock()
+        mock_search_response.tool_calls = [{
+            "name": "hybrid_search_tool",
+            "args": {"query": "Rewritten question about privacy regulations"},
+            "id": "call_2"
+        }]
+        mock_search_response.content = ""
+        
+        # Third call: agent generates final answer
+        mock_final_response = Mock()
+        mock_final_response.tool_calls = []
+        mock_final_response.content = "Final answer about privacy regulations"
+        
+        mocked_chatbot.bound_llm.invoke.side_effect = [
+            mock_rewrite_response,  # First agent decision
+            mock_search_response,   # Second agent decision after rewrite
+            mock_final_response     # Final answer
+        ]
+        
+        # Mock search tool responses
+        mocked_chatbot.vector_store.similarity_search.return_value = [
+            Mock(page_content="Privacy regulation document content", metadata={})
+        ]
+        
+        # Test the actual workflow execution with a question that should trigger rewrite
+        workflow = mocked_chatbot.chatbot.build_workflow()
+        
+        # Test workflow building includes rewrite tool
+        assert workflow is not None
+        
+        # This would test the full sequence: rewrite -> search -> answer
+        # For now, just verify the workflow compiles correctly
+        print("  ✅ Adaptive RAG workflow building test passed")
+        
+        print("✅ Adaptive RAG workflow tests completed successfully")
     
-    def test_crag_workflow(self):
+    def test_crag_workflow(self, mocked_chatbot):
         """Test CRAG workflow with document grading."""
         print("\nTesting CRAG workflow...")
         
-        # Mock all external dependencies
-        with patch('src.chatbot.ChatOpenAI') as mock_llm, \
-             patch('src.chatbot.Neo4jGraph') as mock_graph, \
-             patch('src.chatbot.GraphCypherQAChain') as mock_chain, \
-             patch('src.chatbot.Neo4jVector.from_existing_index') as mock_vector, \
-             patch('src.chatbot.TavilyClient') as mock_tavily:
-            
-            # Mock LLM responses for document grading
-            mock_llm_instance = MagicMock()
-            mock_llm.return_value = mock_llm_instance
-            
-            # Mock the LLM tool binding and invocation for CRAG sequence
-            mock_bound_llm = MagicMock()
-            mock_llm_instance.bind_tools.return_value = mock_bound_llm
-            
-            # First call: agent uses search
-            mock_search_response = Mock()
-            mock_search_response.tool_calls = [{
-                "name": "hybrid_search_tool",
-                "args": {"query": "Test question"},
-                "id": "call_1"
-            }]
-            mock_search_response.content = ""
-            
-            # Second call: agent grades documents
-            mock_grade_response = Mock()
-            mock_grade_response.tool_calls = [{
-                "name": "grade_documents_tool",
-                "args": {
-                    "documents": [{"content": "Test document"}],
-                    "question": "Test question"
-                },
-                "id": "call_2"
-            }]
-            mock_grade_response.content = ""
-            
-            # Third call: agent generates final answer
-            mock_final_response = Mock()
-            mock_final_response.tool_calls = []
-            mock_final_response.content = "Final answer after document grading"
-            
-            mock_bound_llm.invoke.side_effect = [
-                mock_search_response,  # First agent decision
-                mock_grade_response,   # Second agent decision for grading
-                mock_final_response    # Final answer
-            ]
-            
-            # Mock search tool responses
-            mock_vector_instance = Mock()
-            mock_vector.return_value = mock_vector_instance
-            mock_vector_instance.similarity_search.return_value = [
-                Mock(page_content="Test document content", metadata={})
-            ]
-            
-            # Mock grader responses
-            mock_relevance_grader = Mock()
-            mock_grade = Mock()
-            mock_grade.binary_score = "yes"
-            mock_relevance_grader.invoke.return_value = mock_grade
-            
-            # Import and initialize chatbot
-            from src.chatbot import GraphRAGChatbot
-            chatbot = GraphRAGChatbot(openai_api_key="test-key")
-            
-            # Test workflow building includes grading tools
-            workflow = chatbot.build_workflow()
-            assert workflow is not None
-            
-            print("  ✅ CRAG workflow building test passed")
-            
-            print("✅ CRAG workflow tests completed successfully")
+        # First call: agent uses search
+        mock_search_response = Mock()
+        mock_search_response.tool_calls = [{
+            "name": "hybrid_search_tool",
+            "args": {"query": "Test question"},
+            "id": "call_1"
+        }]
+        mock_search_response.content = ""
+        
+        # Second call: agent grades documents
+        mock_grade_response = Mock()
+        mock_grade_response.tool_calls = [{
+            "name": "grade_documents_tool",
+            "args": {
+                "documents": [{"content": "Test document"}],
+                "question": "Test question"
+            },
+            "id": "call_2"
+        }]
+        mock_grade_response.content = ""
+        
+        # Third call: agent generates final answer
+        mock_final_response = Mock()
+        mock_final_response.tool_calls = []
+        mock_final_response.content = "Final answer after document grading"
+        
+        mocked_chatbot.bound_llm.invoke.side_effect = [
+            mock_search_response,  # First agent decision
+            mock_grade_response,   # Second agent decision for grading
+            mock_final_response    # Final answer
+        ]
+        
+        # Mock search tool responses
+        mocked_chatbot.vector_store.similarity_search.return_value = [
+            Mock(page_content="Test document content", metadata={})
+        ]
+        
+        # Test workflow building includes grading tools
+        workflow = mocked_chatbot.chatbot.build_workflow()
+        assert workflow is not None
+        
+        print("  ✅ CRAG workflow building test passed")
+        
+        print("✅ CRAG workflow tests completed successfully")
     
-    def test_self_rag_workflow(self):
+    def test_self_rag_workflow(self, mocked_chatbot):
         """Test Self-RAG workflow with answer grading."""
         print("\nTesting Self-RAG workflow...")
         
-        # Mock all external dependencies
-        with patch('src.chatbot.ChatOpenAI') as mock_llm, \
-             patch('src.chatbot.Neo4jGraph') as mock_graph, \
-             patch('src.chatbot.GraphCypherQAChain') as mock_chain, \
-             patch('src.chatbot.Neo4jVector.from_existing_index') as mock_vector, \
-             patch('src.chatbot.TavilyClient') as mock_tavily:
-            
-            # Mock LLM responses for answer grading
-            mock_llm_instance = MagicMock()
-            mock_llm.return_value = mock_llm_instance
-            
-            # Mock the LLM tool binding and invocation for Self-RAG sequence
-            mock_bound_llm = MagicMock()
-            mock_llm_instance.bind_tools.return_value = mock_bound_llm
-            
-            # First call: agent uses search
-            mock_search_response = Mock()
-            mock_search_response.tool_calls = [{
-                "name": "hybrid_search_tool",
-                "args": {"query": "Test question"},
-                "id": "call_1"
-            }]
-            mock_search_response.content = ""
-            
-            # Second call: agent generates answer
-            mock_answer_response = Mock()
-            mock_answer_response.tool_calls = [{
-                "name": "grade_answer_tool",
-                "args": {
-                    "generation": "Test answer",
-                    "documents": [{"content": "Test document"}],
-                    "question": "Test question"
-                },
-                "id": "call_2"
-            }]
-            mock_answer_response.content = ""
-            
-            # Third call: final evaluation
-            mock_final_response = Mock()
-            mock_final_response.tool_calls = []
-            mock_final_response.content = "Final evaluated answer"
-            
-            mock_bound_llm.invoke.side_effect = [
-                mock_search_response,   # First agent decision
-                mock_answer_response,   # Second agent decision for answer grading
-                mock_final_response     # Final answer
-            ]
-            
-            # Mock search tool responses
-            mock_vector_instance = Mock()
-            mock_vector.return_value = mock_vector_instance
-            mock_vector_instance.similarity_search.return_value = [
-                Mock(page_content="Test document content", metadata={})
-            ]
-            
-            # Mock grader responses
-            mock_hallucination_grader = Mock()
-            mock_usefulness_grader = Mock()
-            
-            mock_hallucination_grade = Mock()
-            mock_hallucination_grade.binary_score = "yes"
-            mock_hallucination_grader.invoke.return_value = mock_hallucination_grade
-            
-            mock_usefulness_grade = Mock()
-            mock_usefulness_grade.binary_score = "yes"
-            mock_usefulness_grader.invoke.return_value = mock_usefulness_grade
-            
-            # Import and initialize chatbot
-            from src.chatbot import GraphRAGChatbot
-            chatbot = GraphRAGChatbot(openai_api_key="test-key")
-            
-            # Test workflow building includes answer grading tools
-            workflow = chatbot.build_workflow()
-            assert workflow is not None
-            
-            print("  ✅ Self-RAG workflow building test passed")
-            
-            print("✅ Self-RAG workflow tests completed successfully")
+        # First call: agent uses search
+        mock_search_response = Mock()
+        mock_search_response.tool_calls = [{
+            "name": "hybrid_search_tool",
+            "args": {"query": "Test question"},
+            "id": "call_1"
+        }]
+        mock_search_response.content = ""
+        
+        # Second call: agent generates answer
+        mock_answer_response = Mock()
+        mock_answer_response.tool_calls = [{
+            "name": "grade_answer_tool",
+            "args": {
+                "generation": "Test answer",
+                "documents": [{"content": "Test document"}],
+                "question": "Test question"
+            },
+            "id": "call_2"
+        }]
+        mock_answer_response.content = ""
+        
+        # Third call: final evaluation
+        mock_final_response = Mock()
+        mock_final_response.tool_calls = []
+        mock_final_response.content = "Final evaluated answer"
+        
+        mocked_chatbot.bound_llm.invoke.side_effect = [
+            mock_search_response,   # First agent decision
+            mock_answer_response,   # Second agent decision for answer grading
+            mock_final_response     # Final answer
+        ]
+        
+        # Mock search tool responses
+        mocked_chatbot.vector_store.similarity_search.return_value = [
+            Mock(page_content="Test document content", metadata={})
+        ]
+        
+        # Test workflow building includes answer grading tools
+        workflow = mocked_chatbot.chatbot.build_workflow()
+        assert workflow is not None
+        
+        print("  ✅ Self-RAG workflow building test passed")
+        
+        print("✅ Self-RAG workflow tests completed successfully")
     
-    def test_tool_integration_in_workflow(self):
+    def test_tool_integration_in_workflow(self, mocked_chatbot):
         """Test that all six tools are properly integrated in the workflow."""
         print("\nTesting complete tool integration...")
         
-        with patch('src.chatbot.ChatOpenAI') as mock_llm, \
-             patch('src.chatbot.Neo4jGraph'), \
-             patch('src.chatbot.GraphCypherQAChain'), \
-             patch('src.chatbot.Neo4jVector.from_existing_index'), \
-             patch('src.chatbot.TavilyClient'):
-            
-            mock_llm_instance = MagicMock()
-            mock_llm.return_value = mock_llm_instance
-            mock_llm_instance.bind_tools.return_value = MagicMock()
-            
-            # Import and initialize chatbot
-            from src.chatbot import GraphRAGChatbot
-            chatbot = GraphRAGChatbot(openai_api_key="test-key")
-            
-            # Build workflow and verify all tools are present
-            workflow = chatbot.build_workflow()
-            assert workflow is not None
-            
-            # The actual tool names should be available in the compiled workflow
-            print("  ✅ All six tools integrated in workflow")
-            print("✅ Complete tool integration test passed")
+        # Build workflow and verify all tools are present
+        workflow = mocked_chatbot.chatbot.build_workflow()
+        assert workflow is not None
+        
+        # The actual tool names should be available in the compiled workflow
+        print("  ✅ All six tools integrated in workflow")
+        print("✅ Complete tool integration test passed")
 
 if __name__ == "__main__":
-    test = TestAdvancedRAGIntegration()
-    test.test_adaptive_rag_workflow()
-    test.test_crag_workflow()
-    test.test_self_rag_workflow()
-    test.test_tool_integration_in_workflow()
-    print("\n🎉 All advanced RAG integration tests passed!")
+    pytest.main([__file__])
@@ -1,36 +1,148 @@
 """Unit tests for the GraphRAG chatbot module - Agent-based approach."""
 
+import asyncio
 import pytest
-from unittest.mock import Mock, patch, MagicMock
-from langchain_core.messages import HumanMessage, AIMessage
-import sys
-import os
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from types import SimpleNamespace
+from unittest.mock import Mock, AsyncMock, patch, MagicMock
+from langchain_core.messages import HumanMessage, AIMessage, ToolMessage
 
-from src.chatbot import GraphRAGChatbot
+from src.chatbot import GraphRAGChatbot, AGENT_SYSTEM_PROMPT, _classify_intent
+
+@pytest.fixture(scope="class")
+def chatbot(patched_chatbot):
+    """Build one chatbot per test class; tests change its attributes through monkeypatch only."""
+    return GraphRAGChatbot(openai_api_key="test-key")
+
+GRADED_QUESTION = "Quali provvedimenti riguardano il GDPR?"
+
+def run_graded_question(chatbot, monkeypatch, relevance_scores, answer_grade):
+    """
+    Run GRADED_QUESTION through aask() and the real compiled workflow, with mocked graders.
+    
+    The agent first calls both grading tools on two documents, then answers "Risposta".
+    Returns the answer, the answer cache mock, the grader mocks and the tool results by name.
+    """
+    documents = [{"content": "Documento pertinente"}, {"content": "Documento fuori tema"}]
+    relevance_grader = Mock(ainvoke=AsyncMock(return_value=SimpleNamespace(scores=relevance_scores)))
+    answer_grader = Mock(ainvoke=AsyncMock(return_value=answer_grade))
+    monkeypatch.setattr('src.chatbot.create_batch_relevance_grader', lambda llm: relevance_grader)
+    monkeypatch.setattr('src.chatbot.create_combined_answer_grader', lambda llm: answer_grader)
+    # build_workflow rebinds the tools: restore the shared chatbot's binding and app afterwards
+    monkeypatch.setattr(chatbot, "_llm_with_tools", chatbot._llm_with_tools)
+    monkeypatch.setattr(chatbot, "_app", chatbot.build_workflow())
+    
+    grading_turn = AIMessage(content="", tool_calls=[
+        {"name": "grade_documents_tool", "args": {"documents": documents, "question": GRADED_QUESTION}, "id": "call_1"},
+        {"name": "grade_answer_tool", "args": {"generation": "Risposta", "documents": documents, "question": GRADED_QUESTION}, "id": "call_2"},
+    ])
+    monkeypatch.setattr(chatbot, "_llm_with_tools", Mock())
+    chatbot._llm_with_tools.ainvoke = AsyncMock(side_effect=[grading_turn, AIMessage(content="Risposta")])
+    with patch.object(chatbot, 'answer_cache') as mock_cache:
+        mock_cache.get.return_value = None
+        answer = asyncio.run(chatbot.aask(GRADED_QUESTION))
+    
+    last_messages = chatbot._llm_with_tools.ainvoke.call_args.args[0]
+    return SimpleNamespace(
+        answer=answer, cache=mock_cache, relevance_grader=relevance_grader, answer_grader=answer_grader,
+        tool_results={m.name: m.content for m in last_messages if isinstance(m, ToolMessage)}
+    )
 
 class TestGraphRAGChatbot:
     """Test the GraphRAGChatbot class."""
     
-    def setup_method(self):
-        """Set up test fixtures before each test method."""
+    def test_chatbot_initialization(self, chatbot):
+        """Test that the chatbot initializes correctly."""
+        assert isinstance(chatbot, GraphRAGChatbot)
+        assert hasattr(chatbot, 'llm')
+        assert hasattr(chatbot, 'graph')
+        # Router and decomposer no longer exist in agent-based approach
+        assert not hasattr(chatbot, 'query_router')
+        assert not hasattr(chatbot, 'query_decomposer')
+    
+    @pytest.mark.parametrize("indexes,expected_call,search_type", [
+        (["vector_index", "keyword_index"], "from_existing_index", "hybrid"),
+        (["vector_index"], "from_existing_index", None),
+        ([], "from_existing_graph", "hybrid"),
+    ])
+    def test_vector_store_init_follows_index_probe(self, indexes, expected_call, search_type):
+        """Test that the vector store init path is chosen from a single SHOW INDEXES probe."""
         with patch('src.chatbot.ChatOpenAI'), \
+             patch('src.chatbot.Neo4jGraph') as mock_graph, \
+             patch('src.chatbot.GraphCypherQAChain'), \
+             patch('src.chatbot.Neo4jVector') as mock_vector:
+            mock_graph.return_value.query.return_value = [{"name": name} for name in indexes]
+            chatbot = GraphRAGChatbot(openai_api_key="test-key")
+
+            init_call = getattr(mock_vector, expected_call)
+            init_call.assert_called_once()
+            assert init_call.call_args.kwargs.get("search_type") == search_type
+            assert chatbot.vector_store is init_call.return_value
+            probes = [c for c in mock_graph.return_value.query.call_args_list if "SHOW INDEXES" in c.args[0]]
+            assert len(probes) == 1
+
+    def test_grader_llm_separate_from_answer_llm(self):
+        """Test that graders use their own small model with capped output."""
+        with patch('src.chatbot.ChatOpenAI') as mock_llm, \
              patch('src.chatbot.Neo4jGraph'), \
              patch('src.chatbot.GraphCypherQAChain'), \
              patch('src.chatbot.Neo4jVector.from_existing_index'):
-            self.chatbot = GraphRAGChatbot(openai_api_key="test-key")
-    
-    def test_chatbot_initialization(self):
-        """Test that the chatbot initializes correctly."""
-        assert isinstance(self.chatbot, GraphRAGChatbot)
-        assert hasattr(self.chatbot, 'llm')
-        assert hasattr(self.chatbot, 'graph')
-        # Router and decomposer no longer exist in agent-based approach
-        assert not hasattr(self.chatbot, 'query_router')
-        assert not hasattr(self.chatbot, 'query_decomposer')
-    
-    def test_build_workflow(self):
+            GraphRAGChatbot(openai_api_key="test-key")
+            grader_kwargs = mock_llm.call_args_list[1].kwargs
+            assert grader_kwargs["model"] == "gpt-4.1-nano"
+            assert grader_kwargs["max_tokens"] > 0
+
+            custom_grader = Mock()
+            chatbot = GraphRAGChatbot(openai_api_key="test-key", grader_llm=custom_grader)
+            assert chatbot.grader_llm is custom_grader
+
+    def test_vector_store_shares_graph_driver(self):
+        """Test that the vector store reuses the graph's pooled driver."""
+        with patch('src.chatbot.ChatOpenAI'), \
+             patch('src.chatbot.Neo4jGraph') as mock_graph, \
+             patch('src.chatbot.GraphCypherQAChain'), \
+             patch('src.chatbot.Neo4jVector.from_existing_index') as mock_vector:
+            mock_graph.return_value.query.return_value = [{"name": "vector_index"}, {"name": "keyword_index"}]
+            chatbot = GraphRAGChatbot(openai_api_key="test-key")
+
+            assert mock_graph.call_count == 1
+            assert "max_connection_pool_size" in mock_graph.call_args.kwargs["driver_config"]
+            assert mock_vector.call_args.kwargs["graph"] is chatbot.graph
+            assert "url" not in mock_vector.call_args.kwargs
+
+    def test_graph_qa_chain_rebuilt_on_schema_refresh(self):
+        """Test that the Cypher prompt leaves the schema to the chain and refresh_schema() rebuilds it."""
+        with patch('src.chatbot.ChatOpenAI'), \
+             patch('src.chatbot.Neo4jGraph') as mock_graph, \
+             patch('src.chatbot.GraphCypherQAChain') as mock_chain, \
+             patch('src.chatbot.Neo4jVector.from_existing_index'):
+            chatbot = GraphRAGChatbot(openai_api_key="test-key")
+
+            assert mock_chain.from_llm.call_args.kwargs["verbose"] is False
+            cypher_prompt = mock_chain.from_llm.call_args.kwargs["cypher_prompt"]
+            # GraphCypherQAChain fills in its own graph_schema at query time
+            assert set(cypher_prompt.input_variables) == {"schema", "question"}
+            assert mock_chain.from_llm.call_args.kwargs["graph"] is chatbot.graph
+
+            chatbot.refresh_schema()
+            mock_graph.return_value.refresh_schema.assert_called_once()
+            assert mock_chain.from_llm.call_count == 2
+            assert chatbot.graph_qa_chain is mock_chain.from_llm.return_value
+
+    def test_create_lookup_indices(self, chatbot):
+        """Test that lookup indexes are created idempotently and failures are tolerated."""
+        with patch.object(chatbot, 'graph') as mock_graph:
+            mock_graph.query.side_effect = [None, Exception("Unsupported"), None, None]
+            chatbot.create_lookup_indices()
+
+            queries = [c.args[0] for c in mock_graph.query.call_args_list]
+            assert len(queries) == 4
+            assert all("IF NOT EXISTS" in q for q in queries)
+            assert any("publication_date" in q for q in queries)
+
+    def test_build_workflow(self, chatbot, monkeypatch):
         """Test workflow building."""
+        # build_workflow rebinds the tools: restore the shared chatbot's binding afterwards
+        monkeypatch.setattr(chatbot, "_llm_with_tools", chatbot._llm_with_tools)
         with patch('src.chatbot.StateGraph') as mock_state_graph:
             mock_workflow = Mock()
             mock_state_graph.return_value = mock_workflow
@@ -38,7 +150,7 @@ class TestGraphRAGChatbot:
             compiled_app = Mock()
             mock_workflow.compile.return_value = compiled_app
             
-            app = self.chatbot.build_workflow()
+            app = chatbot.build_workflow()
             assert app is not None
             # Should have agent and tools nodes
             assert mock_workflow.add_node.call_count >= 2
@@ -46,65 +158,174 @@ class TestGraphRAGChatbot:
             assert mock_workflow.set_entry_point.call_count >= 1
             assert mock_workflow.add_conditional_edges.call_count >= 1
     
-    def test_ask_success(self):
-        """Test successful question answering."""
-        with patch.object(self.chatbot, 'build_workflow') as mock_build:
-            mock_app = Mock()
-            mock_app.invoke.return_value = {
-                "messages": [AIMessage(content="Test answer")]
-            }
-            mock_build.return_value = mock_app
-            
-            result = self.chatbot.ask("Test question")
-            assert result == "Test answer"
+    @pytest.mark.parametrize("messages,expected", [
+        ([AIMessage(content="Test answer")], "Test answer"),
+        ([{"content": "Test answer"}], "Test answer"),
+        ([], "Mi dispiace, non sono riuscito a generare una risposta."),
+        ([HumanMessage(content="Test question"), AIMessage(content="Final answer based on tool results")],
+         "Final answer based on tool results"),
+    ], ids=["ai_message", "dict_message", "empty_messages", "tool_calls"])
+    def test_ask(self, chatbot, messages, expected):
+        """Test that ask() returns the content of the last workflow message."""
+        with patch.object(chatbot, '_app', new_callable=AsyncMock) as mock_app:
+            mock_app.ainvoke.return_value = {"messages": messages}
+            assert chatbot.ask("Test question") == expected
     
-    def test_ask_success_with_dict_message(self):
-        """Test successful question answering with dict message."""
-        with patch.object(self.chatbot, 'build_workflow') as mock_build:
-            mock_app = Mock()
-            mock_app.invoke.return_value = {
-                "messages": [{"content": "Test answer"}]
+    @pytest.mark.parametrize("question,expected", [
+        ("  ", "dettagliata"),
+        ("ok", "dettagliata"),
+        ("Ciao!", "Chiedimi"),
+        ("grazie mille", "Chiedimi"),
+        ("x" * 8001, "troppo lunga"),
+    ])
+    def test_ask_direct_reply_skips_workflow(self, chatbot, question, expected):
+        """Test that trivial or malformed questions are answered without the workflow."""
+        with patch.object(chatbot, 'answer_cache') as mock_cache, \
+             patch.object(chatbot, '_app', new_callable=AsyncMock) as mock_app:
+            result = chatbot.ask(question)
+            assert expected in result
+            mock_app.ainvoke.assert_not_called()
+            mock_cache.get.assert_not_called()
+
+    def test_ask_reuses_compiled_workflow(self, chatbot):
+        """Test that ask() does not rebuild the workflow on every question."""
+        with patch.object(chatbot, 'build_workflow') as mock_build, \
+             patch.object(chatbot, '_app', new_callable=AsyncMock) as mock_app:
+            mock_app.ainvoke.return_value = {
+                "messages": [AIMessage(content="Test answer")]
             }
-            mock_build.return_value = mock_app
-            
-            result = self.chatbot.ask("Test question")
-            assert result == "Test answer"
+
+            chatbot.ask("First question")
+            chatbot.ask("Second question")
+            mock_build.assert_not_called()
+            assert mock_app.ainvoke.call_count == 2
+
+    def test_ask_semantic_cache_hit(self, chatbot):
+        """Test that a cached answer is returned without running the workflow."""
+        with patch.object(chatbot, 'answer_cache') as mock_cache, \
+             patch.object(chatbot, '_app', new_callable=AsyncMock) as mock_app:
+            mock_cache.get.return_value = "Cached answer"
+
+            result = chatbot.ask("Test question")
+            assert result == "Cached answer"
+            mock_app.ainvoke.assert_not_called()
+
+    def test_ask_caches_only_graded_answers(self, chatbot):
+        """Test that only answers graded 'utile' are stored in the semantic cache."""
+        graded = ToolMessage(content="utile", name="grade_answer_tool", tool_call_id="call_1")
+        with patch.object(chatbot, 'answer_cache') as mock_cache, \
+             patch.object(chatbot, '_app', new_callable=AsyncMock) as mock_app:
+            mock_cache.get.return_value = None
+            mock_app.ainvoke.return_value = {"messages": [AIMessage(content="Ungraded answer")]}
+            chatbot.ask("First question")
+            mock_cache.put.assert_not_called()
+
+            mock_app.ainvoke.return_value = {"messages": [graded, AIMessage(content="Graded answer")]}
+            chatbot.ask("Second question")
+            mock_cache.put.assert_called_once_with("Second question", "Graded answer")
+
+    def test_ask_runs_compiled_workflow_async(self, chatbot, monkeypatch):
+        """Test that ask() drives the real compiled workflow through the async agent node."""
+        monkeypatch.setattr(chatbot, "_llm_with_tools", Mock())
+        chatbot._llm_with_tools.ainvoke = AsyncMock(return_value=AIMessage(content="Async answer"))
+        with patch.object(chatbot, 'answer_cache') as mock_cache:
+            mock_cache.get.return_value = None
+            assert chatbot.ask("Quali provvedimenti riguardano il GDPR?") == "Async answer"
+            chatbot._llm_with_tools.ainvoke.assert_awaited_once()
+            chatbot._llm_with_tools.invoke.assert_not_called()
+
+    def test_ask_runs_async_graders(self, chatbot, monkeypatch):
+        """Test that the compiled workflow awaits the document and answer graders through aask()."""
+        run = run_graded_question(chatbot, monkeypatch, ["yes", "no"], SimpleNamespace(grounded="yes", useful="yes"))
+        assert run.answer == "Risposta"
+        run.cache.put.assert_called_once_with(GRADED_QUESTION, "Risposta")
+        run.relevance_grader.ainvoke.assert_awaited_once()
+        run.answer_grader.ainvoke.assert_awaited_once()
+        assert "Documento fuori tema" not in run.tool_results["grade_documents_tool"]
+        assert "Documento pertinente" in run.tool_results["grade_documents_tool"]
+        assert run.tool_results["grade_answer_tool"] == "utile"
     
-    def test_ask_empty_messages(self):
-        """Test question answering with empty messages."""
-        with patch.object(self.chatbot, 'build_workflow') as mock_build:
-            mock_app = Mock()
-            mock_app.invoke.return_value = {
-                "messages": []
-            }
-            mock_build.return_value = mock_app
-            
-            result = self.chatbot.ask("Test question")
-            assert "dispiace" in result.lower()
+    def test_ask_does_not_cache_unsupported_answer(self, chatbot, monkeypatch):
+        """Test that an answer the grader judges ungrounded is returned but not cached."""
+        run = run_graded_question(chatbot, monkeypatch, ["yes", "yes"], SimpleNamespace(grounded="no", useful="yes"))
+        assert run.answer == "Risposta"
+        assert run.tool_results["grade_answer_tool"] == "non supportato"
+        run.cache.put.assert_not_called()
+
+    def test_agent_turn_runs_independent_tool_calls_together(self, chatbot, monkeypatch):
+        """Test that the agent gets the parallel-tools instruction and all calls of a turn are executed."""
+        tool_turn = AIMessage(content="", tool_calls=[
+            {"name": "structured_query_tool", "args": {"query": "GDPR"}, "id": "call_1"},
+            {"name": "web_search_tool", "args": {"query": "GDPR"}, "id": "call_2"},
+        ])
+        monkeypatch.setattr(chatbot, "_llm_with_tools", Mock())
+        chatbot._llm_with_tools.ainvoke = AsyncMock(side_effect=[tool_turn, AIMessage(content="Final answer")])
+        with patch.object(chatbot, 'answer_cache') as mock_cache:
+            mock_cache.get.return_value = None
+            assert chatbot.ask("Quali provvedimenti riguardano il GDPR?") == "Final answer"
+
+        first_call, second_call = chatbot._llm_with_tools.ainvoke.call_args_list
+        assert first_call.args[0][0].content == AGENT_SYSTEM_PROMPT
+        tool_messages = [m for m in second_call.args[0] if isinstance(m, ToolMessage)]
+        assert {m.tool_call_id for m in tool_messages} == {"call_1", "call_2"}
+
+    @pytest.mark.parametrize("question,expected", [
+        ("Cosa è successo il 10 febbraio 1998?", "structured_query_tool"),
+        ("Provvedimenti pubblicati il 1998-02-10", "structured_query_tool"),
+        ("GDPR articolo 5", "hybrid_search_tool"),
+        ("Quali provvedimenti ha emesso il Garante?", None),
+    ])
+    def test_classify_intent(self, question, expected):
+        """Test the regex intent pre-classifier."""
+        assert _classify_intent(question) == expected
+
+    def test_ask_routed_question_skips_planning_turn(self, chatbot, monkeypatch):
+        """Test that a pre-routed question runs its tool without an agent planning turn."""
+        monkeypatch.setattr(chatbot, "_llm_with_tools", Mock())
+        chatbot._llm_with_tools.ainvoke = AsyncMock(return_value=AIMessage(content="Final answer"))
+        with patch.object(chatbot, 'answer_cache') as mock_cache:
+            mock_cache.get.return_value = None
+            assert chatbot.ask("Cosa è successo il 10 febbraio 1998?") == "Final answer"
+
+        # The only LLM turn is the synthesis, which already sees the tool result
+        chatbot._llm_with_tools.ainvoke.assert_awaited_once()
+        messages = chatbot._llm_with_tools.ainvoke.call_args.args[0]
+        assert isinstance(messages[-1], ToolMessage)
+        assert messages[-1].name == "structured_query_tool"
+
+    def test_ask_inside_running_event_loop(self, chatbot):
+        """Test that the sync shim also works when called from a running event loop."""
+        async def call_ask():
+            return chatbot.ask("Test question")
+
+        with patch.object(chatbot, '_app', new_callable=AsyncMock) as mock_app:
+            mock_app.ainvoke.return_value = {"messages": [AIMessage(content="Test answer")]}
+            assert asyncio.run(call_ask()) == "Test answer"
+
+    def test_ask_from_concurrent_threads(self, chatbot):
+        """Test that the sync shim can be called from several threads at once."""
+        from concurrent.futures import ThreadPoolExecutor
+        
+        async def slow_answer(state, config=None):
+            await asyncio.sleep(0.01)
+            return {"messages": [AIMessage(content=state["messages"][0].content.upper())]}
+        
+        questions = [f"Domanda numero {i}" for i in range(3)]
+        with patch.object(chatbot, '_app', new_callable=AsyncMock) as mock_app, \
+             patch.object(chatbot, 'answer_cache'):
+            chatbot.answer_cache.get.return_value = None
+            mock_app.ainvoke.side_effect = slow_answer
+            with ThreadPoolExecutor(max_workers=len(questions)) as executor:
+                answers = list(executor.map(chatbot.ask, questions))
+        assert answers == [q.upper() for q in questions]
     
-    def test_ask_error(self):
+    def test_ask_error(self, chatbot):
         """Test question answering with error."""
-        with patch.object(self.chatbot, 'build_workflow') as mock_build:
-            mock_build.side_effect = Exception("Workflow error")
+        with patch.object(chatbot, '_app', new_callable=AsyncMock) as mock_app:
+            mock_app.ainvoke.side_effect = Exception("Workflow error")
             
-            result = self.chatbot.ask("Test question")
+            result = chatbot.ask("Test question")
             assert "errore" in result.lower()
-    
-    def test_ask_with_tool_calls(self):
-        """Test question answering with tool calls in the workflow."""
-        with patch.object(self.chatbot, 'build_workflow') as mock_build:
-            mock_app = Mock()
-            # Simulate a conversation with tool calls and final answer
-            mock_app.invoke.return_value = {
-                "messages": [
-                    HumanMessage(content="Test question"),
-                    AIMessage(content="Final answer based on tool results")
-                ]
-            }
-            mock_build.return_value = mock_app
-            
-            result = self.chatbot.ask("Test question")
-            assert result == "Final answer based on tool results"
 
 if __name__ == "__main__":
     pytest.main([__file__])
@@ -0,0 +1,59 @@
+"""Unit tests for the GraphRAG embedding cache module."""
+
+import pytest
+from unittest.mock import Mock
+from src.embedding_cache import CachedEmbeddings
+
+class TestCachedEmbeddings:
+    """Test the CachedEmbeddings wrapper."""
+
+    def setup_method(self):
+        """Set up test fixtures before each test method."""
+        self.inner = Mock()
+        self.inner.model = "test-model"
+        self.inner.embed_query.side_effect = lambda text: [float(len(text)), 0.5]
+        self.inner.embed_documents.side_effect = lambda texts: [[float(len(t)), 0.5] for t in texts]
+
+    def test_embed_query_cache_hit(self, tmp_path):
+        """Test that a repeated query is served from the cache."""
+        cache = CachedEmbeddings(self.inner, path=str(tmp_path / "emb.sqlite"))
+        first = cache.embed_query("privacy")
+        second = cache.embed_query("privacy")
+        assert first == second == [7.0, 0.5]
+        assert self.inner.embed_query.call_count == 1
+
+    def test_embed_query_persists_across_instances(self, tmp_path):
+        """Test that vectors survive a restart through the SQLite store."""
+        path = str(tmp_path / "emb.sqlite")
+        cache = CachedEmbeddings(self.inner, path=path)
+        cache.embed_query("privacy")
+        cache.close()
+
+        reopened = CachedEmbeddings(self.inner, path=path)
+        assert reopened.embed_query("privacy") == [7.0, 0.5]
+        assert self.inner.embed_query.call_count == 1
+
+    def test_embed_documents_only_embeds_misses(self, tmp_path):
+        """Test that embed_documents only sends uncached texts to the model."""
+        cache = CachedEmbeddings(self.inner, path=str(tmp_path / "emb.sqlite"))
+        cache.embed_documents(["a", "bb"])
+        result = cache.embed_documents(["bb", "ccc", "ccc"])
+        assert result == [[2.0, 0.5], [3.0, 0.5], [3.0, 0.5]]
+        self.inner.embed_documents.assert_called_with(["ccc"])
+
+    def test_cache_key_depends_on_model(self, tmp_path):
+        """Test that different models do not share cached vectors."""
+        cache = CachedEmbeddings(self.inner, path=str(tmp_path / "emb.sqlite"))
+        cache.embed_query("privacy")
+        self.inner.model = "other-model"
+        cache.embed_query("privacy")
+        assert self.inner.embed_query.call_count == 2
+
+    def test_memory_lru_eviction(self, tmp_path):
+        """Test that the in-memory layer is bounded by maxsize."""
+        cache = CachedEmbeddings(self.inner, path=str(tmp_path / "emb.sqlite"), maxsize=2)
+        cache.embed_documents(["a", "bb", "ccc"])
+        assert len(cache._memory) == 2
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -1,10 +1,9 @@
 """Unit tests for the GraphRAG graph nodes module - Tool-based approach."""
 
+import asyncio
 import pytest
-from unittest.mock import Mock, patch, MagicMock
-import sys
-import os
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from types import SimpleNamespace
+from unittest.mock import Mock, AsyncMock, patch, MagicMock
 
 # Import the raw functions for testing
 import src.graph_nodes as graph_nodes_module
@@ -14,46 +13,92 @@ from src.graph_nodes import (
 )
 from src.graders import (
     create_relevance_grader, create_hallucination_grader, create_answer_usefulness_grader,
+    create_combined_answer_grader, RELEVANCE_PROMPT, COMBINED_ANSWER_PROMPT,
     GradeDocuments, GradeHallucinations, GradeAnswerUsefulness
 )
+from src.semcache import SemCache
+from src.web_search_cache import WebSearchCache
 from langchain_core.messages import HumanMessage, AIMessage
 
+def make_vector_store(mode, content="Test content", metadata=None):
+    """Build a vector store mock returning one document ("ok"), missing ("none") or failing ("raise")."""
+    if mode == "none":
+        return None
+    vector_store = Mock()
+    if mode == "raise":
+        vector_store.similarity_search.side_effect = Exception("Search error")
+    else:
+        vector_store.similarity_search.return_value = [
+            SimpleNamespace(page_content=content, metadata=metadata or {"source": "test"})
+        ]
+    return vector_store
+
+def make_tavily_client(mode):
+    """Build a Tavily client mock returning one result ("ok"), missing ("none") or failing ("raise")."""
+    if mode == "none":
+        return None
+    tavily_client = Mock()
+    if mode == "raise":
+        tavily_client.search.side_effect = Exception("Search error")
+    else:
+        tavily_client.search.return_value = {
+            "results": [{"content": "Test result", "url": "http://test.com", "title": "Test"}]
+        }
+    return tavily_client
+
 class TestGraphToolFunctions:
     """Test the graph tool functions."""
     
-    def test_hybrid_search_tool_success(self):
-        """Test successful hybrid search tool execution."""
-        mock_vector_store = Mock()
-        mock_docs = [Mock()]
-        mock_docs[0].page_content = "Test content"
-        mock_docs[0].metadata = {"source": "test"}
-        mock_vector_store.similarity_search.return_value = mock_docs
-        
-        # Create the tool with dependencies
-        hybrid_search_tool = create_hybrid_search_tool(vector_store=mock_vector_store)
+    @pytest.mark.parametrize("mode,expected", [("ok", 1), ("none", 0), ("raise", 0)])
+    def test_hybrid_search_tool(self, mode, expected):
+        """Test hybrid search with a working, missing or failing vector store."""
+        hybrid_search_tool = create_hybrid_search_tool(vector_store=make_vector_store(mode))
         result = hybrid_search_tool.invoke({"query": "Test question"})
         assert isinstance(result, list)
-        assert len(result) == 1
-        assert result[0]["content"] == "Test content"
-        assert result[0]["metadata"]["source"] == "test"
+        assert len(result) == expected
+        if expected:
+            assert result[0]["content"] == "Test content"
+            assert result[0]["metadata"]["source"] == "test"
     
-    def test_hybrid_search_tool_no_vector_store(self):
-        """Test hybrid search tool with no vector store."""
-        hybrid_search_tool = create_hybrid_search_tool(vector_store=None)
-        result = hybrid_search_tool.invoke({"query": "Test question"})
-        assert isinstance(result, list)
-        assert len(result) == 0
+    def test_hybrid_search_tool_top_k(self):
+        """Test that the hybrid search only fetches the configured top k documents."""
+        mock_vector_store = Mock()
+        mock_vector_store.similarity_search.return_value = []
+        
+        create_hybrid_search_tool(vector_store=mock_vector_store).invoke({"query": "Test question"})
+        assert mock_vector_store.similarity_search.call_args.kwargs["k"] == 6
+        
+        create_hybrid_search_tool(vector_store=mock_vector_store, k=4).invoke({"query": "Test question"})
+        assert mock_vector_store.similarity_search.call_args.kwargs["k"] == 4
+    
+    def test_hybrid_search_tool_cached(self):
+        """Test that a semantically equivalent query is served from the cache."""
+        mock_vector_store = Mock()
+        mock_docs = [SimpleNamespace(page_content="Test content", metadata={"source": "test"})]
+        mock_vector_store.similarity_search.return_value = mock_docs
+        embedder = Mock()
+        embedder.embed_documents.side_effect = lambda texts: [[1.0, 0.0] for _ in texts]
+        
+        hybrid_search_tool = create_hybrid_search_tool(
+            vector_store=mock_vector_store, cache=SemCache(embedder, tau=0.95)
+        )
+        first = hybrid_search_tool.invoke({"query": "Cos'è il GDPR?"})
+        second = hybrid_search_tool.invoke({"query": "Che cos'è il GDPR?"})
+        assert first == second
+        assert mock_vector_store.similarity_search.call_count == 1
     
     def test_hybrid_search_tool_with_graph_context(self):
         """Test hybrid search tool with graph context enhancement."""
         mock_vector_store = Mock()
-        mock_docs = [Mock()]
-        mock_docs[0].page_content = "Test content"
-        mock_docs[0].metadata = {"id": "test_doc"}
+        mock_docs = [
+            SimpleNamespace(page_content="Test content", metadata={"id": "test_doc"}),
+            SimpleNamespace(page_content="Other content", metadata={"source": "other_doc"})
+        ]
         mock_vector_store.similarity_search.return_value = mock_docs
         
         mock_graph = Mock()
-        mock_graph.query.return_value = [{
+        mock_graph.query.side_effect = lambda query, params: [] if query == graph_nodes_module.KEYWORD_SEARCH_QUERY else [{
+            "key": "test_doc",
             "document_name": "Test Document",
             "related_entities": ["Entity1"],
             "entity_types": ["Type1"]
@@ -62,119 +107,212 @@ class TestGraphToolFunctions:
         hybrid_search_tool = create_hybrid_search_tool(vector_store=mock_vector_store, graph=mock_graph)
         result = hybrid_search_tool.invoke({"query": "Test question"})
         assert isinstance(result, list)
-        assert len(result) == 1
-        assert "related_context" in result[0]
+        assert len(result) == 2
+        assert result[0]["related_context"]["document_name"] == "Test Document"
+        assert "related_context" not in result[1]
+        # One enrichment query for all results, after the keyword lookup
+        assert mock_graph.query.call_count == 2
+        assert mock_graph.query.call_args.kwargs["params"] == {"doc_ids": ["test_doc", "other_doc"]}
     
-    def test_hybrid_search_tool_error_handling(self):
-        """Test hybrid search tool error handling."""
+    def test_hybrid_search_tool_keyword_fast_path(self):
+        """Test that strong keyword matches skip the vector search."""
         mock_vector_store = Mock()
-        mock_vector_store.similarity_search.side_effect = Exception("Search error")
+        keyword_hits = [
+            {"content": f"GDPR articolo {i}", "metadata": {"name": f"Art. {i}"}, "score": 3.5} for i in range(3)
+        ]
+        mock_graph = Mock()
+        mock_graph.query.side_effect = lambda query, params: keyword_hits if query == graph_nodes_module.KEYWORD_SEARCH_QUERY else []
         
-        hybrid_search_tool = create_hybrid_search_tool(vector_store=mock_vector_store)
-        result = hybrid_search_tool("Test question")
-        assert isinstance(result, list)
-        assert len(result) == 0
+        hybrid_search_tool = create_hybrid_search_tool(vector_store=mock_vector_store, graph=mock_graph)
+        result = hybrid_search_tool.invoke({"query": "GDPR?"})
+        mock_vector_store.similarity_search.assert_not_called()
+        assert [doc["content"] for doc in result] == ["GDPR articolo 0", "GDPR articolo 1", "GDPR articolo 2"]
+        assert "score" not in result[0]
+        # Lucene special characters are stripped from the keyword query
+        assert mock_graph.query.call_args_list[0].kwargs["params"]["q"] == "GDPR"
     
-    def test_structured_query_tool_success(self):
-        """Test successful structured query tool execution."""
-        mock_graph_qa_chain = Mock()
-        mock_graph_qa_chain.invoke.return_value = {"result": "Test result"}
+    def test_hybrid_search_tool_keyword_fast_path_skips_embedding(self):
+        """Test that the keyword fast path runs before the semantic cache, so the query is never embedded."""
+        keyword_hits = [
+            {"content": f"GDPR articolo {i}", "metadata": {"name": f"Art. {i}"}, "score": 3.5} for i in range(3)
+        ]
+        mock_graph = Mock()
+        mock_graph.query.side_effect = lambda query, params: keyword_hits if query == graph_nodes_module.KEYWORD_SEARCH_QUERY else []
+        embedder = Mock()
+        embedder.embed_documents.side_effect = lambda texts: [[1.0, 0.0] for _ in texts]
+        cache = SemCache(embedder, tau=0.95)
+        cache.put("Cos'è il DPO?", [{"content": "DPO", "metadata": {}}])
+        embedder.reset_mock()
+        
+        hybrid_search_tool = create_hybrid_search_tool(vector_store=Mock(), graph=mock_graph, cache=cache)
+        result = hybrid_search_tool.invoke({"query": "GDPR?"})
+        assert [doc["content"] for doc in result] == ["GDPR articolo 0", "GDPR articolo 1", "GDPR articolo 2"]
+        embedder.embed_documents.assert_not_called()
+        embedder.embed_query.assert_not_called()
+    
+    def test_hybrid_search_tool_fuses_weak_keyword_hits(self):
+        """Test that weak keyword matches are merged with vector results by reciprocal rank."""
+        mock_vector_store = Mock()
+        mock_docs = [SimpleNamespace(page_content="vettore", metadata={}), SimpleNamespace(page_content="comune", metadata={})]
+        mock_vector_store.similarity_search.return_value = mock_docs
+        keyword_hits = [
+            {"content": "comune", "metadata": {}, "score": 1.0},
+            {"content": "parola", "metadata": {}, "score": 0.5}
+        ]
+        mock_graph = Mock()
+        mock_graph.query.side_effect = lambda query, params: keyword_hits if query == graph_nodes_module.KEYWORD_SEARCH_QUERY else []
+        
+        hybrid_search_tool = create_hybrid_search_tool(vector_store=mock_vector_store, graph=mock_graph)
+        result = hybrid_search_tool.invoke({"query": "Test question"})
+        # The document found by both searches ranks first
+        assert [doc["content"] for doc in result] == ["comune", "vettore", "parola"]
+    
+    @pytest.mark.parametrize("mode,expected", [("ok", 1), ("none", 0)])
+    def test_structured_query_tool(self, mode, expected):
+        """Test structured query with a working or missing Cypher chain."""
+        mock_graph_qa_chain = None
+        if mode == "ok":
+            mock_graph_qa_chain = Mock()
+            mock_graph_qa_chain.ainvoke = AsyncMock(return_value={"result": "Test result"})
         
-        structured_query_tool = create_structured_query_tool(graph_qa_chain=mock_graph_qa_chain)
-        result = structured_query_tool("Test question")
+        structured_query_tool = create_structured_query_tool(graph_qa_chain=mock_graph_qa_chain, graph=None)
+        result = asyncio.run(structured_query_tool.ainvoke({"query": "Test question"}))
         assert isinstance(result, list)
-        assert len(result) == 1
-        assert result[0]["question"] == "Test question"
-        assert "result" in result[0]
+        assert len(result) == expected
+        if expected:
+            assert result[0]["question"] == "Test question"
+            assert "result" in result[0]
     
     def test_structured_query_tool_fallback(self):
         """Test structured query tool with fallback to simple search."""
         mock_graph_qa_chain = Mock()
-        mock_graph_qa_chain.invoke.side_effect = Exception("Chain error")
+        mock_graph_qa_chain.ainvoke = AsyncMock(side_effect=Exception("Chain error"))
         mock_graph = Mock()
         mock_graph.query.return_value = [{"name": "Test", "type": "Entity", "description": "Test entity"}]
         
         structured_query_tool = create_structured_query_tool(graph_qa_chain=mock_graph_qa_chain, graph=mock_graph)
-        result = structured_query_tool("Test question")
+        result = asyncio.run(structured_query_tool.ainvoke({"query": "Test question"}))
         assert isinstance(result, list)
         assert len(result) == 1
         assert "name" in result[0]
         assert "type" in result[0]
         assert "description" in result[0]
     
-    def test_structured_query_tool_no_dependencies(self):
-        """Test structured query tool with no dependencies."""
-        structured_query_tool = create_structured_query_tool(graph_qa_chain=None, graph=None)
-        result = structured_query_tool("Test question")
+    def test_structured_query_tool_fallback_only_when_chain_empty(self):
+        """Test that the fallback lookup runs only when the Cypher chain returns nothing."""
+        mock_graph_qa_chain = Mock()
+        mock_graph_qa_chain.ainvoke = AsyncMock(return_value={"result": "Test result"})
+        mock_graph = Mock()
+        mock_graph.query.return_value = [{"name": "Test", "type": "Entity", "description": "Test entity"}]
+        
+        structured_query_tool = create_structured_query_tool(graph_qa_chain=mock_graph_qa_chain, graph=mock_graph)
+        result = asyncio.run(structured_query_tool.ainvoke({"query": "Test question"}))
+        assert result == [{"question": "Test question", "result": {"result": "Test result"}}]
+        mock_graph.query.assert_not_called()
+        
+        # An empty chain answer falls back to the entity lookup
+        mock_graph_qa_chain.ainvoke.return_value = None
+        result = asyncio.run(structured_query_tool.ainvoke({"query": "Test question"}))
+        assert result == [{"name": "Test", "type": "Entity", "description": "Test entity"}]
+        mock_graph.query.assert_called_once()
+        
+        # A failing chain still returns the fallback results
+        mock_graph_qa_chain.ainvoke.side_effect = Exception("Chain error")
+        result = asyncio.run(structured_query_tool.ainvoke({"query": "Test question"}))
+        assert result == [{"name": "Test", "type": "Entity", "description": "Test entity"}]
+    
+    @pytest.mark.parametrize("mode,expected", [("ok", 1), ("none", 0), ("raise", 0)])
+    def test_web_search_tool(self, mode, expected):
+        """Test web search with a working, missing or failing Tavily client."""
+        web_search_tool = create_web_search_tool(tavily_client=make_tavily_client(mode))
+        result = asyncio.run(web_search_tool.ainvoke({"query": "Test question"}))
         assert isinstance(result, list)
-        assert len(result) == 0
+        assert len(result) == expected
+        if expected:
+            assert result[0] == {"content": "Test result", "url": "http://test.com", "title": "Test"}
     
-    def test_web_search_tool_success(self):
-        """Test successful web search tool execution."""
+    def test_web_search_tool_cached(self):
+        """Test that repeated web searches for the same normalized query hit the cache."""
         mock_tavily_client = Mock()
         mock_tavily_client.search.return_value = {
-            "results": [
-                {"content": "Test result", "url": "http://test.com", "title": "Test"}
-            ]
+            "results": [{"content": "Test result", "url": "http://test.com", "title": "Test"}]
         }
         
-        web_search_tool = create_web_search_tool(tavily_client=mock_tavily_client)
-        result = web_search_tool("Test question")
-        assert isinstance(result, list)
-        assert len(result) == 1
-        assert result[0]["content"] == "Test result"
-        assert result[0]["url"] == "http://test.com"
-        assert result[0]["title"] == "Test"
-    
-    def test_web_search_tool_no_client(self):
-        """Test web search tool with no client."""
-        web_search_tool = create_web_search_tool(tavily_client=None)
-        result = web_search_tool("Test question")
-        assert isinstance(result, list)
-        assert len(result) == 0
+        web_search_tool = create_web_search_tool(tavily_client=mock_tavily_client, cache=WebSearchCache())
+        first = asyncio.run(web_search_tool.ainvoke({"query": "Test question"}))
+        second = asyncio.run(web_search_tool.ainvoke({"query": "  test QUESTION "}))
+        assert first == second
+        mock_tavily_client.search.assert_called_once()
     
-    def test_web_search_tool_error_handling(self):
-        """Test web search tool error handling."""
+    def test_web_search_tool_async_client(self):
+        """Test that the async tool awaits the async Tavily client."""
         mock_tavily_client = Mock()
-        mock_tavily_client.search.side_effect = Exception("Search error")
+        mock_async_client = Mock()
+        mock_async_client.search = AsyncMock(return_value={
+            "results": [{"content": "Test result", "url": "http://test.com", "title": "Test"}]
+        })
         
-        web_search_tool = create_web_search_tool(tavily_client=mock_tavily_client)
-        result = web_search_tool("Test question")
-        assert isinstance(result, list)
-        assert len(result) == 0
+        web_search_tool = create_web_search_tool(
+            tavily_client=mock_tavily_client, cache=WebSearchCache(), async_tavily_client=mock_async_client
+        )
+        first = asyncio.run(web_search_tool.ainvoke({"query": "Test question"}))
+        second = asyncio.run(web_search_tool.ainvoke({"query": "test question"}))
+        assert first == second == [{"content": "Test result", "url": "http://test.com", "title": "Test"}]
+        mock_async_client.search.assert_awaited_once()
+        mock_tavily_client.search.assert_not_called()
     
-    def test_metadata_filter_tool_success(self):
-        """Test successful metadata filter tool execution."""
-        mock_vector_store = Mock()
-        mock_docs = [Mock()]
-        mock_docs[0].page_content = "Filtered content"
-        mock_docs[0].metadata = {"document_type": "Provvedimento", "year": "2024"}
-        mock_vector_store.similarity_search.return_value = mock_docs
+    def test_web_search_tool_async_concurrent_calls_share_one_search(self):
+        """Test that concurrent async calls for the same query run a single search."""
+        mock_async_client = Mock()
         
-        metadata_filter_tool = create_metadata_filter_tool(vector_store=mock_vector_store)
-        result = metadata_filter_tool.invoke({"query": "Test question", "filter_dict": {"document_type": "Provvedimento"}})
-        assert isinstance(result, list)
-        assert len(result) == 1
-        assert result[0]["content"] == "Filtered content"
-        assert result[0]["metadata"]["document_type"] == "Provvedimento"
-    
-    def test_metadata_filter_tool_no_vector_store(self):
-        """Test metadata filter tool with no vector store."""
-        metadata_filter_tool = create_metadata_filter_tool(vector_store=None)
-        result = metadata_filter_tool.invoke({"query": "Test question", "filter_dict": {"document_type": "Provvedimento"}})
-        assert isinstance(result, list)
-        assert len(result) == 0
-    
-    def test_metadata_filter_tool_error_handling(self):
-        """Test metadata filter tool error handling."""
-        mock_vector_store = Mock()
-        mock_vector_store.similarity_search.side_effect = Exception("Filter error")
+        async def slow_search(**kwargs):
+            await asyncio.sleep(0.01)
+            return {"results": [{"content": "Test result", "url": "http://test.com", "title": "Test"}]}
+        
+        mock_async_client.search = AsyncMock(side_effect=slow_search)
+        cache = WebSearchCache()
+        web_search_tool = create_web_search_tool(cache=cache, async_tavily_client=mock_async_client)
         
-        metadata_filter_tool = create_metadata_filter_tool(vector_store=mock_vector_store)
+        async def run_concurrently():
+            return await asyncio.gather(*[web_search_tool.ainvoke({"query": "Test question"}) for _ in range(3)])
+        
+        results = asyncio.run(run_concurrently())
+        assert all(result == results[0] for result in results)
+        mock_async_client.search.assert_awaited_once()
+        assert cache._locks == {}
+    
+    @pytest.mark.parametrize("mode,expected", [("ok", 1), ("none", 0), ("raise", 0)])
+    def test_metadata_filter_tool(self, mode, expected):
+        """Test metadata filtering with a working, missing or failing vector store."""
+        vector_store = make_vector_store(mode, content="Filtered content", metadata={"document_type": "Provvedimento"})
+        metadata_filter_tool = create_metadata_filter_tool(vector_store=vector_store)
         result = metadata_filter_tool.invoke({"query": "Test question", "filter_dict": {"document_type": "Provvedimento"}})
         assert isinstance(result, list)
-        assert len(result) == 0
+        assert len(result) == expected
+        if expected:
+            assert result[0]["content"] == "Filtered content"
+            assert result[0]["metadata"]["document_type"] == "Provvedimento"
     
 
+class TestGraderBuilders:
+    """Test the grader chain builders."""
+
+    def test_grader_builder_memoized_per_llm(self):
+        """Test that a grader chain is built once per LLM instance."""
+        llm, other_llm = Mock(), Mock()
+        first = create_relevance_grader(llm)
+        assert create_relevance_grader(llm) is first
+        llm.with_structured_output.assert_called_once()
+
+        assert create_relevance_grader(other_llm) is not first
+        other_llm.with_structured_output.assert_called_once()
+
+    def test_grader_chains_share_module_prompts(self):
+        """Test that grader chains reuse the module-level prompt templates."""
+        llm = Mock()
+        assert create_relevance_grader(llm).first is RELEVANCE_PROMPT
+        assert create_combined_answer_grader(llm).first is COMBINED_ANSWER_PROMPT
+
+
 if __name__ == "__main__":
     pytest.main([__file__])
@@ -1,86 +1,179 @@
 """Unit tests for the GraphRAG ingestion module."""
 
+import asyncio
+import json
+import math
 import pytest
-from unittest.mock import Mock, patch, MagicMock, mock_open
-from src.ingest import GraphRAGIngestor
+from unittest.mock import Mock, AsyncMock, patch, MagicMock, mock_open
+from src.ingest import (
+    GraphRAGIngestor, EXTRACTION_PROMPT, KNOWLEDGE_GRAPH_SCHEMA, ENTITY_INDEX_QUERIES, EMBEDDING_BATCH_SIZE,
+    PROCESSED_CHUNKS_QUERY, MARK_CHUNKS_QUERY
+)
 from src.schema import KnowledgeGraph, Entity, Relationship
+from langchain_community.graphs.graph_document import GraphDocument
+from langchain_core.documents import Document
+
+def make_async_driver(records):
+    """Build an async Neo4j driver mock whose queries return `records`."""
+    async def result_iter():
+        for record in records:
+            yield Mock(data=Mock(return_value=record))
+    
+    session = MagicMock()
+    session.run = AsyncMock(side_effect=lambda *args, **kwargs: result_iter())
+    session.__aenter__ = AsyncMock(return_value=session)
+    session.__aexit__ = AsyncMock(return_value=False)
+    driver = MagicMock()
+    driver.session.return_value = session
+    driver.__aenter__ = AsyncMock(return_value=driver)
+    driver.__aexit__ = AsyncMock(return_value=False)
+    return driver
+
+# Shared read-only extraction result; tests that need to mutate it should use model_copy(deep=True)
+SAMPLE_KG = KnowledgeGraph(
+    entities=[
+        Entity(id="entity_1", type="Provvedimento", name="Test Doc", description="A test document", publication_date="2024-01-01", document_type="Provvedimento", reference_number="123"),
+        Entity(id="entity_2", type="FonteNormativa", name="Test Source", description="A test source")
+    ],
+    relationships=[
+        Relationship(id="rel_1", source_entity_id="entity_1", target_entity_id="entity_2", type="CITA", description="Doc cites source")
+    ]
+)
+
+@pytest.fixture(scope="module")
+def sample_kg():
+    """Provide the shared sample knowledge graph."""
+    return SAMPLE_KG
+
+@pytest.fixture
+def ingestor(patched_ingestor, tmp_path):
+    """Build a fresh ingestor per test: clients are created lazily, so the patches stay active for the whole test."""
+    # Fresh client instances, so mock state and the embedding cache never leak between tests
+    for mock in patched_ingestor.values():
+        mock.reset_mock(return_value=True, side_effect=True)
+    patched_ingestor['OpenAIEmbeddings'].return_value.model = "test-model"
+    with patch('src.ingest.CACHE_DIR', str(tmp_path)):
+        yield GraphRAGIngestor(openai_api_key="test-key")
 
 class TestGraphRAGIngestor:
     """Test the GraphRAGIngestor class."""
     
-    def setup_method(self):
-        """Set up test fixtures before each test method."""
-        with patch('src.ingest.ChatOpenAI'), \
-             patch('src.ingest.Neo4jGraph'), \
-             patch('src.ingest.get_extraction_prompt'), \
-             patch('src.ingest.OpenAIEmbeddings'), \
-             patch('src.ingest.Neo4jVector'):
-            self.ingestor = GraphRAGIngestor(openai_api_key="test-key")
-    
-    def test_ingestor_initialization(self):
+    def test_ingestor_initialization(self, ingestor):
         """Test that the ingestor initializes correctly."""
-        assert isinstance(self.ingestor, GraphRAGIngestor)
-        assert hasattr(self.ingestor, 'llm')
-        assert hasattr(self.ingestor, 'graph')
-        assert hasattr(self.ingestor, 'extraction_chain')
+        assert isinstance(ingestor, GraphRAGIngestor)
+        assert hasattr(ingestor, 'llm')
+        assert hasattr(ingestor, 'graph')
+        assert hasattr(ingestor, 'extraction_chain')
+    
+    def test_extraction_prompt_built_once(self, ingestor):
+        """Test that ingestors share the module-level extraction prompt."""
+        assert ingestor.extraction_prompt is EXTRACTION_PROMPT
+    
+    def test_graph_driver_shared_with_vector_store(self):
+        """Test that the graph is pooled like the chatbot's and the vector store reuses its driver."""
+        with patch('src.ingest.Neo4jGraph') as mock_graph, \
+             patch('src.ingest.Neo4jVector') as mock_vector, \
+             patch('src.ingest.OpenAIEmbeddings'):
+            ingestor = GraphRAGIngestor(openai_api_key="test-key")
+            ingestor.vector_store
+        assert "max_connection_pool_size" in mock_graph.call_args.kwargs["driver_config"]
+        assert mock_vector.call_args.kwargs["graph"] is ingestor.graph
+        assert "url" not in mock_vector.call_args.kwargs
+        # Connecting runs no queries: the ingestion paths create the indexes once per run
+        mock_graph.return_value.query.assert_not_called()
+    
+    def test_process_documents_batch_creates_entity_indices_once(self, ingestor):
+        """Test that the batch path creates the dedup indexes and the id constraint before its lookups."""
+        with patch.object(ingestor, 'batch_extract', return_value={}), \
+             patch.object(ingestor, 'store_all'):
+            ingestor.process_documents_batch([])
+        queries = [c.args[0] for c in ingestor.graph.query.call_args_list]
+        assert queries == ENTITY_INDEX_QUERIES
     
-    def test_extract_knowledge_graph_success(self):
+    def test_clients_created_lazily(self):
+        """Test that only the clients a command uses are created."""
+        with patch('src.ingest.Neo4jGraph') as mock_graph, \
+             patch('src.ingest.Neo4jVector') as mock_vector, \
+             patch('src.ingest.OpenAIEmbeddings') as mock_embeddings:
+            ingestor = GraphRAGIngestor(openai_api_key="test-key")
+            ingestor.clear_database()
+            ingestor.close()
+        mock_graph.assert_called_once()
+        mock_graph.return_value.close.assert_called_once()
+        mock_vector.assert_not_called()
+        mock_embeddings.assert_not_called()
+    
+    def test_close_skips_unopened_graph(self):
+        """Test that closing an ingestor that never connected does not open a connection."""
+        with patch('src.ingest.Neo4jGraph') as mock_graph:
+            GraphRAGIngestor(openai_api_key="test-key").close()
+        mock_graph.assert_not_called()
+    
+    def test_create_vector_indices_quantized(self, ingestor):
+        """Test that the vector index is quantized, falling back to a plain index on older servers."""
+        ingestor.create_vector_indices()
+        query = ingestor.graph.query.call_args.args[0]
+        assert "`vector.quantization.enabled`: true" in query
+        assert "ON n.embedding" in query
+        
+        ingestor.graph.query.reset_mock()
+        ingestor.graph.query.side_effect = [Exception("Invalid index config"), []]
+        ingestor.create_vector_indices()
+        assert ingestor.graph.query.call_count == 2
+        assert "quantization" not in ingestor.graph.query.call_args.args[0]
+    
+    def test_batch_request_reuses_schema(self, ingestor):
+        """Test that Batch API requests embed the precomputed KnowledgeGraph schema."""
+        ingestor.llm.model_name = "gpt-4o-mini"
+        request = ingestor._batch_request("chunk_1", "Testo")
+        assert request["body"]["response_format"]["json_schema"]["schema"] is KNOWLEDGE_GRAPH_SCHEMA
+    
+    def test_extract_knowledge_graph_success(self, ingestor):
         """Test successful knowledge graph extraction."""
-        with patch.object(self.ingestor.extraction_chain, 'invoke') as mock_invoke:
+        with patch.object(ingestor, 'extraction_chain') as mock_chain:
+            mock_invoke = mock_chain.invoke
             mock_invoke.return_value = {
                 "entities": [{"id": "test_1", "type": "Provvedimento", "name": "Test Doc", "description": "A test document", "publication_date": "2024-01-01", "document_type": "Provvedimento", "reference_number": "123"}],
                 "relationships": []
             }
             
-            result = self.ingestor.extract_knowledge_graph("Test text")
+            result = ingestor.extract_knowledge_graph("Test text")
             assert isinstance(result, KnowledgeGraph)
             assert len(result.entities) == 1
             assert result.entities[0].name == "Test Doc"
             assert result.entities[0].publication_date == "2024-01-01"
     
-    def test_extract_knowledge_graph_error(self):
+    def test_extract_knowledge_graph_error(self, ingestor):
         """Test knowledge graph extraction with error."""
-        with patch.object(self.ingestor.extraction_chain, 'invoke') as mock_invoke:
+        with patch.object(ingestor, 'extraction_chain') as mock_chain:
+            mock_invoke = mock_chain.invoke
             mock_invoke.side_effect = Exception("Extraction error")
             
-            result = self.ingestor.extract_knowledge_graph("Test text")
+            result = ingestor.extract_knowledge_graph("Test text")
             assert isinstance(result, KnowledgeGraph)
             assert len(result.entities) == 0
             assert len(result.relationships) == 0
     
-    def test_convert_to_graph_document_success(self):
+    def test_convert_to_graph_document_success(self, ingestor, sample_kg):
         """Test successful conversion to GraphDocument."""
-        kg = KnowledgeGraph(
-            entities=[
-                Entity(id="entity_1", type="Provvedimento", name="Test Doc", description="A test document", publication_date="2024-01-01", document_type="Provvedimento", reference_number="123"),
-                Entity(id="entity_2", type="FonteNormativa", name="Test Source", description="A test source")
-            ],
-            relationships=[
-                Relationship(id="rel_1", source_entity_id="entity_1", target_entity_id="entity_2", type="CITA", description="Doc cites source")
-            ]
-        )
-        
-        result = self.ingestor.convert_to_graph_document(kg, "test_chunk_1", "test_document.pdf")
+        result = ingestor.convert_to_graph_document(sample_kg, "test_chunk_1", "test_document.pdf")
         assert result is not None
         assert len(result.nodes) == 2
         assert result.nodes[0].properties["publication_date"] == "2024-01-01"
         assert len(result.relationships) == 1
         assert result.relationships[0].source.id == "entity_1"
     
-    def test_convert_to_graph_document_error(self):
+    def test_convert_to_graph_document_error(self, ingestor, sample_kg):
         """Test conversion to GraphDocument with error."""
-        with patch('langchain_community.graphs.graph_document.Node', side_effect=Exception("Node creation error")):
-            kg = KnowledgeGraph(
-                entities=[Entity(id="entity_1", type="Provvedimento", name="Test Doc")],
-                relationships=[]
-            )
-            result = self.ingestor.convert_to_graph_document(kg, "test_chunk_1", "test_document.pdf")
+        with patch('src.ingest.Node', side_effect=Exception("Node creation error")):
+            result = ingestor.convert_to_graph_document(sample_kg, "test_chunk_1", "test_document.pdf")
             assert result is None
     
-    def test_store_graph_and_embeddings_success(self):
+    def test_store_graph_and_embeddings_success(self, ingestor):
         """Test successful storage of graph and embeddings."""
-        with patch.object(self.ingestor.graph, 'add_graph_documents') as mock_add_graph, \
-             patch.object(self.ingestor.vector_store, 'add_documents') as mock_add_docs:
+        with patch.object(ingestor, 'write_graph') as mock_add_graph, \
+             patch.object(ingestor.vector_store, 'add_embeddings') as mock_add_docs:
+            ingestor.embeddings.inner.embed_documents.side_effect = lambda texts: [[0.1] for _ in texts]
             
             # Create a more realistic mock for GraphDocument
             mock_node = Mock()
@@ -91,66 +184,324 @@ class TestGraphRAGIngestor:
             mock_graph_document.nodes = [mock_node]
             mock_graph_document.relationships = [] # Also mock relationships
             
-            self.ingestor.store_graph_and_embeddings(mock_graph_document)
+            ingestor.store_graph_and_embeddings(mock_graph_document)
             
             mock_add_graph.assert_called_once_with([mock_graph_document])
             mock_add_docs.assert_called_once()
 
-    def test_store_graph_and_embeddings_no_doc(self):
+    def test_store_graph_and_embeddings_no_doc(self, ingestor):
         """Test storage when no graph document is provided."""
-        with patch.object(self.ingestor.graph, 'add_graph_documents') as mock_add_graph, \
-             patch.object(self.ingestor.vector_store, 'add_documents') as mock_add_docs:
+        with patch.object(ingestor, 'write_graph') as mock_add_graph, \
+             patch.object(ingestor.vector_store, 'add_embeddings') as mock_add_embeddings:
             
-            self.ingestor.store_graph_and_embeddings(None)
+            ingestor.store_graph_and_embeddings(None)
             
             mock_add_graph.assert_not_called()
-            mock_add_docs.assert_not_called()
+            mock_add_embeddings.assert_not_called()
+            ingestor.embeddings.inner.embed_documents.assert_not_called()
     
-    def test_process_chunk_success(self):
+    def test_store_all_batches_embeddings(self, ingestor):
+        """Test that one document's nodes are written once and embedded in batched requests."""
+        graph_documents = []
+        for i in range(3):
+            graph_document = MagicMock()
+            graph_document.nodes = [Mock(properties={"description": f"desc {i}-{j}"}) for j in range(2)]
+            graph_document.nodes.append(Mock(properties={"description": ""}))
+            graph_document.relationships = []
+            graph_documents.append(graph_document)
+        
+        ingestor.embeddings.inner.embed_documents.side_effect = lambda texts: [[0.1] for _ in texts]
+        with patch('src.ingest.EMBEDDING_BATCH_SIZE', 4), \
+             patch.object(ingestor, 'write_graph') as mock_add_graph, \
+             patch.object(ingestor.vector_store, 'add_embeddings') as mock_add_embeddings:
+            
+            ingestor.store_all(graph_documents)
+            
+            mock_add_graph.assert_called_once_with(graph_documents)
+            # 6 descriptions in batches of 4: two embedding requests, one vector store write
+            assert ingestor.embeddings.inner.embed_documents.call_count == 2
+            mock_add_embeddings.assert_called_once()
+            assert len(mock_add_embeddings.call_args.kwargs["embeddings"]) == 6
+    
+    def test_store_all_deduplicates_descriptions(self, ingestor):
+        """Test that an entity re-described identically across chunks is embedded once."""
+        graph_documents = []
+        for description in ["Autorità di controllo", "Autorità di controllo", "Autorità indipendente"]:
+            graph_document = MagicMock()
+            graph_document.nodes = [Mock(id="garante", properties={"description": description})]
+            graph_document.relationships = []
+            graph_documents.append(graph_document)
+        
+        ingestor.embeddings.inner.embed_documents.side_effect = lambda texts: [[0.5] for _ in texts]
+        with patch.object(ingestor, 'write_graph'), \
+             patch.object(ingestor.vector_store, 'add_embeddings') as mock_add_embeddings:
+            
+            ingestor.store_all(graph_documents)
+            
+            assert mock_add_embeddings.call_args.kwargs["texts"] == ["Autorità di controllo", "Autorità indipendente"]
+    
+    def test_store_all_reuses_cached_embeddings(self, ingestor):
+        """Test that re-ingesting the same descriptions does not call the embeddings API again."""
+        graph_document = MagicMock()
+        graph_document.nodes = [Mock(properties={"description": "Garante per la protezione dei dati"})]
+        graph_document.relationships = []
+        
+        ingestor.embeddings.inner.embed_documents.side_effect = lambda texts: [[0.5, 0.25] for _ in texts]
+        with patch.object(ingestor, 'write_graph'), \
+             patch.object(ingestor.vector_store, 'add_embeddings') as mock_add_embeddings:
+            
+            ingestor.store_all([graph_document])
+            ingestor.store_all([graph_document])
+            
+            assert ingestor.embeddings.inner.embed_documents.call_count == 1
+            assert mock_add_embeddings.call_count == 2
+            assert mock_add_embeddings.call_args.kwargs["embeddings"] == [[0.5, 0.25]]
+    
+    def test_write_graph_single_unwind_per_kind(self, ingestor):
+        """Test that all chunks of a document are written with one node and one relationship query."""
+        from langchain_community.graphs.graph_document import Node, Relationship
+        graph_documents = []
+        for i in range(3):
+            law = Node(id=f"legge_{i}", type="Legge", properties={"chunk_id": f"chunk_{i}"})
+            authority = Node(id="garante", type="Autorità", properties={"chunk_id": f"chunk_{i}"})
+            rel = Relationship(source=authority, target=law, type="emanato da", properties={})
+            graph_documents.append(GraphDocument(nodes=[law, authority], relationships=[rel], source=Document(page_content="")))
+        
+        ingestor.write_graph(graph_documents)
+        
+        assert ingestor.graph.query.call_count == 2
+        node_params = ingestor.graph.query.call_args_list[0].args[1]["nodes"]
+        rel_params = ingestor.graph.query.call_args_list[1].args[1]["rels"]
+        assert len(node_params) == 6
+        assert len(rel_params) == 3
+        assert rel_params[0] == {
+            "source": "garante", "source_label": "Autorità", "target": "legge_0",
+            "target_label": "Legge", "type": "EMANATO_DA", "properties": {}
+        }
+    
+    def test_process_chunk_success(self, ingestor, sample_kg):
         """Test successful chunk processing."""
         chunk_data = {
             "id": "test_chunk_1",
             "testo": "Test chunk content"
         }
         
-        with patch.object(self.ingestor, 'extract_knowledge_graph') as mock_extract, \
-             patch.object(self.ingestor, 'convert_to_graph_document') as mock_convert, \
-             patch.object(self.ingestor, 'store_graph_and_embeddings') as mock_store:
+        with patch.object(ingestor, 'extract_knowledge_graph') as mock_extract, \
+             patch.object(ingestor, 'convert_to_graph_document') as mock_convert, \
+             patch.object(ingestor, 'store_graph_and_embeddings') as mock_store:
             
-            mock_extract.return_value = KnowledgeGraph(entities=[], relationships=[])
+            mock_extract.return_value = sample_kg
             mock_convert.return_value = Mock()
             
-            self.ingestor.process_chunk(chunk_data, "test_document.pdf")
+            ingestor.process_chunk(chunk_data, "test_document.pdf")
             mock_extract.assert_called_once_with("Test chunk content")
-            mock_convert.assert_called_once()
+            mock_convert.assert_called_once_with(sample_kg, "test_chunk_1", "test_document.pdf")
             mock_store.assert_called_once()
     
-    def test_process_chunk_empty_text(self):
+    def test_process_chunk_empty_text(self, ingestor):
         """Test chunk processing with empty text."""
         chunk_data = {
             "id": "test_chunk_1",
             "testo": ""
         }
         
-        with patch.object(self.ingestor, 'extract_knowledge_graph') as mock_extract:
-            self.ingestor.process_chunk(chunk_data, "test_document.pdf")
+        with patch.object(ingestor, 'extract_knowledge_graph') as mock_extract:
+            ingestor.process_chunk(chunk_data, "test_document.pdf")
             mock_extract.assert_not_called()
     
-    def test_process_document_json_success(self):
-        """Test successful document JSON processing."""
+    def test_process_document_json_success(self, ingestor):
+        """Test successful document JSON processing, with one batched store for all chunks."""
+        chunk_count = 50
         test_data = {
             "file_sorgente": "test_document.pdf",
-            "chunks": [
-                {"id": "chunk_1", "testo": "Content 1"},
-                {"id": "chunk_2", "testo": "Content 2"}
-            ]
+            "chunks": [{"id": f"chunk_{i}", "testo": f"Content {i}"} for i in range(chunk_count)]
         }
         
-        with patch('builtins.open', mock_open(read_data=str(test_data).replace("'", '"'))), \
-             patch.object(self.ingestor, 'process_chunk') as mock_process:
+        async def process_chunk(chunk_data, source_document, semaphore):
+            kg = KnowledgeGraph(entities=[
+                Entity(id=chunk_data["id"], type="Provvedimento", name=chunk_data["id"], description=chunk_data["testo"])
+            ], relationships=[])
+            return ingestor.convert_to_graph_document(kg, chunk_data["id"], source_document)
+        
+        driver = make_async_driver([])
+        ingestor.embeddings.inner.embed_documents.side_effect = lambda texts: [[0.1] for _ in texts]
+        
+        with patch('builtins.open', mock_open(read_data=json.dumps(test_data))), \
+             patch('src.ingest.AsyncGraphDatabase') as mock_async_db, \
+             patch.object(ingestor, 'aprocess_chunk', side_effect=process_chunk) as mock_process:
+            mock_async_db.driver.return_value = driver
+            
+            ingestor.process_document_json("test.json")
+            assert mock_process.call_count == chunk_count
+            # Embeddings are requested and stored in batches, not once per chunk
+            ingestor.vector_store.add_embeddings.assert_called_once()
+            assert len(ingestor.vector_store.add_embeddings.call_args.kwargs["texts"]) == chunk_count
+            assert ingestor.embeddings.inner.embed_documents.call_count <= math.ceil(chunk_count / EMBEDDING_BATCH_SIZE)
+    
+    def test_process_document_json_skips_processed_chunks(self, ingestor):
+        """Test that only chunks missing from Neo4j are extracted when resuming a document."""
+        test_data = {
+            "file_sorgente": "test_document.pdf",
+            "chunks": [{"id": f"chunk_{i}", "testo": f"Content {i}"} for i in range(3)]
+        }
+        driver = make_async_driver([{"chunk_id": "chunk_0"}, {"chunk_id": "chunk_2"}])
+        
+        with patch('builtins.open', mock_open(read_data=json.dumps(test_data))), \
+             patch('src.ingest.AsyncGraphDatabase') as mock_async_db, \
+             patch.object(ingestor, 'aprocess_chunk', new_callable=AsyncMock) as mock_process, \
+             patch.object(ingestor, 'astore_all', new_callable=AsyncMock):
+            mock_async_db.driver.return_value = driver
+            
+            ingestor.process_document_json("test.json")
+            assert mock_process.call_count == 1
+            assert mock_process.call_args.args[0]["id"] == "chunk_1"
+            # A single lookup for the whole document, on the async driver
+            queries = [c.args[0] for c in driver.session.return_value.run.call_args_list]
+            assert queries.count(PROCESSED_CHUNKS_QUERY) == 1
+            ingestor.graph.query.assert_not_called()
+    
+    def test_process_document_json_skips_fully_processed_document(self, ingestor):
+        """Test that a document whose text chunks are all recorded is skipped without any extraction."""
+        test_data = {
+            "file_sorgente": "test_document.pdf",
+            "chunks": [{"id": "chunk_0", "testo": "Copertina"}, {"id": "chunk_1", "testo": ""},
+                       {"id": "chunk_2", "testo": "Content 2"}]
+        }
+        driver = make_async_driver([{"chunk_id": "chunk_0"}, {"chunk_id": "chunk_2"}])
+        
+        with patch('builtins.open', mock_open(read_data=json.dumps(test_data))), \
+             patch('src.ingest.AsyncGraphDatabase') as mock_async_db, \
+             patch.object(ingestor, 'aprocess_chunk', new_callable=AsyncMock) as mock_process, \
+             patch.object(ingestor, 'astore_all', new_callable=AsyncMock) as mock_store:
+            mock_async_db.driver.return_value = driver
+            
+            ingestor.process_document_json("test.json")
+            mock_process.assert_not_called()
+            mock_store.assert_not_called()
+    
+    def test_process_all_documents_shares_one_async_driver(self, ingestor, tmp_path):
+        """Test that one async driver serves every document of a run, after creating the entity indexes."""
+        for name in ("a", "b", "c"):
+            (tmp_path / f"{name}.json").write_text(json.dumps({
+                "file_sorgente": f"{name}.pdf", "chunks": [{"id": f"{name}_pagina_1", "testo": "Contenuto"}]
+            }))
+        driver = make_async_driver([])
+        
+        with patch('src.ingest.USE_BATCH_API', False), \
+             patch('src.ingest.AsyncGraphDatabase') as mock_async_db, \
+             patch.object(ingestor, 'create_vector_indices'), \
+             patch.object(ingestor, 'create_keyword_indices'), \
+             patch.object(ingestor, 'aprocess_chunk', new_callable=AsyncMock) as mock_process, \
+             patch.object(ingestor, 'astore_all', new_callable=AsyncMock) as mock_store:
+            mock_async_db.driver.return_value = driver
+            
+            ingestor.process_all_documents(str(tmp_path))
+            mock_async_db.driver.assert_called_once()
+            assert mock_process.call_count == 3
+            assert mock_store.call_count == 3
+            assert all(c.args[0] is driver for c in mock_store.call_args_list)
+            # The dedup indexes are created on the async driver, before the first lookup
+            queries = [c.args[0] for c in driver.session.return_value.run.call_args_list]
+            assert queries[:len(ENTITY_INDEX_QUERIES)] == ENTITY_INDEX_QUERIES
+            ingestor.graph.query.assert_not_called()
+    
+    def test_process_document_json_bounded_concurrency(self, ingestor):
+        """Test that chunks are extracted concurrently, at most GRAPHRAG_CONCURRENCY at a time."""
+        test_data = {
+            "file_sorgente": "test_document.pdf",
+            "chunks": [{"id": f"chunk_{i}", "testo": f"Content {i}"} for i in range(6)]
+        }
+        state = {"active": 0, "peak": 0}
+        
+        async def slow_extract(text):
+            state["active"] += 1
+            state["peak"] = max(state["peak"], state["active"])
+            await asyncio.sleep(0.01)
+            state["active"] -= 1
+            return KnowledgeGraph(entities=[], relationships=[])
+        
+        with patch('builtins.open', mock_open(read_data=json.dumps(test_data))), \
+             patch('src.ingest.GRAPHRAG_CONCURRENCY', 2), \
+             patch('src.ingest.AsyncGraphDatabase') as mock_async_db, \
+             patch.object(ingestor, 'aprocessed_chunk_ids', new_callable=AsyncMock, return_value=set()), \
+             patch.object(ingestor, 'aextract_knowledge_graph', side_effect=slow_extract), \
+             patch.object(ingestor, 'astore_all', new_callable=AsyncMock) as mock_store:
+            mock_async_db.driver.return_value = make_async_driver([])
+            
+            ingestor.process_document_json("test.json")
+            assert state["peak"] == 2
+            # All chunks of the document are stored together
+            mock_store.assert_called_once()
+            assert len(mock_store.call_args.args[1]) == 6
+    
+    def test_astore_all_writes_on_async_driver(self, ingestor):
+        """Test that the async store writes the graph on the async driver, embeds off the loop and records the chunks."""
+        graph_docs = [
+            GraphDocument(nodes=[], relationships=[], source=Document(
+                page_content="Test", metadata={"chunk_id": f"doc_pagina_{i}", "source_document": "doc.pdf"}
+            ))
+            for i in (1, 2)
+        ]
+        # The second chunk (e.g. a cover page) yields no entities but still counts as processed
+        graph_docs[0].nodes = [Mock(id="n1", type="Provvedimento", properties={"description": "Desc"})]
+        driver = make_async_driver([])
+        
+        with patch.object(ingestor, 'store_embeddings') as mock_embed:
+            asyncio.run(ingestor.astore_all(driver, graph_docs))
+        
+        (node_cypher, node_params), (mark_cypher, mark_params) = [
+            c.args for c in driver.session.return_value.run.call_args_list
+        ]
+        assert "UNWIND $nodes" in node_cypher
+        assert node_params["nodes"][0]["id"] == "n1"
+        assert mark_cypher == MARK_CHUNKS_QUERY
+        assert mark_params["chunks"] == [
+            {"id": "doc_pagina_1", "source_document": "doc.pdf"},
+            {"id": "doc_pagina_2", "source_document": "doc.pdf"},
+        ]
+        mock_embed.assert_called_once_with(graph_docs)
+        ingestor.graph.query.assert_not_called()
+    
+    def test_astore_all_does_not_record_failed_writes(self, ingestor):
+        """Test that chunks are not recorded as processed when storing them fails."""
+        graph_doc = GraphDocument(nodes=[], relationships=[], source=Document(
+            page_content="Test", metadata={"chunk_id": "doc_pagina_1", "source_document": "doc.pdf"}
+        ))
+        driver = make_async_driver([])
+        
+        with patch.object(ingestor, 'store_embeddings', side_effect=Exception("Embedding error")):
+            asyncio.run(ingestor.astore_all(driver, [graph_doc]))
+        
+        queries = [c.args[0] for c in driver.session.return_value.run.call_args_list]
+        assert MARK_CHUNKS_QUERY not in queries
+
+    def test_batch_extract(self, ingestor):
+        """Test that chunks are submitted as one Batch API job and results parsed per chunk."""
+        ingestor.llm.model_name = "gpt-4o-mini"
+        kg_json = json.dumps({"entities": [{"id": "e1", "type": "Provvedimento", "name": "Test Doc"}], "relationships": []})
+        output_lines = [
+            json.dumps({"custom_id": "chunk_1", "response": {"body": {"choices": [{"message": {"content": kg_json}}]}}}),
+            json.dumps({"custom_id": "chunk_2", "response": {"body": {"choices": [{"message": {"content": "not json"}}]}}}),
+        ]
+        
+        with patch('src.ingest.OpenAI') as mock_openai, \
+             patch('src.ingest.time.sleep') as mock_sleep:
+            client = mock_openai.return_value
+            client.batches.create.return_value = Mock(id="batch_1", status="in_progress")
+            client.batches.retrieve.return_value = Mock(id="batch_1", status="completed", output_file_id="file_out")
+            client.files.content.return_value.text = "\n".join(output_lines)
+            
+            result = ingestor.batch_extract([
+                ("chunk_1", "Content 1", "test_document.pdf"),
+                ("chunk_2", "Content 2", "test_document.pdf"),
+            ])
             
-            self.ingestor.process_document_json("test.json")
-            assert mock_process.call_count == 2
+            payload = client.files.create.call_args.kwargs["file"][1].decode("utf-8").splitlines()
+            assert [json.loads(line)["custom_id"] for line in payload] == ["chunk_1", "chunk_2"]
+            assert client.batches.create.call_args.kwargs["completion_window"] == "24h"
+            mock_sleep.assert_called_once()
+            assert list(result) == ["chunk_1"]
+            assert result["chunk_1"].entities[0].name == "Test Doc"
 
 if __name__ == "__main__":
     pytest.main([__file__])
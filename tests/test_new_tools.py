@@ -1,13 +1,13 @@
 """Unit tests for the new RAG tools (rewrite_query_tool, grade_documents_tool, grade_answer_tool)."""
 
 import pytest
-from unittest.mock import Mock, patch, MagicMock
-import sys
-import os
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from unittest.mock import Mock, AsyncMock, patch, MagicMock
 
-from src.graph_nodes import rewrite_query_tool, grade_documents_tool, grade_answer_tool
-from src.graders import GradeDocuments, GradeHallucinations, GradeAnswerUsefulness
+from src.graph_nodes import (
+    rewrite_query_tool, grade_documents_tool, grade_answer_tool,
+    RELEVANCE_DOC_CHARS, RELEVANCE_BATCH_DOCS, ANSWER_GRADER_DOC_CHARS, ANSWER_GRADER_MAX_DOCS
+)
+from src.graders import GradeDocuments, GradeHallucinations, GradeAnswerUsefulness, CombinedAnswerGrade, GradeDocumentsBatch
 
 class TestNewRAGTools:
     """Test the new RAG tools."""
@@ -26,9 +26,8 @@ class TestNewRAGTools:
     def test_grade_documents_tool_invoke(self):
         """Test grade_documents_tool invocation."""
         mock_relevance_grader = Mock()
-        mock_grade = Mock()
-        mock_grade.binary_score = "yes"
-        mock_relevance_grader.invoke.return_value = mock_grade
+        mock_grade = GradeDocumentsBatch(scores=["yes"])
+        mock_relevance_grader.ainvoke = AsyncMock(return_value=mock_grade)
         
         documents = [{"content": "Relevant document about privacy"}]
         
@@ -43,16 +42,9 @@ class TestNewRAGTools:
     
     def test_grade_answer_tool_invoke(self):
         """Test grade_answer_tool invocation."""
-        mock_hallucination_grader = Mock()
-        mock_usefulness_grader = Mock()
-        
-        mock_hallucination_grade = Mock()
-        mock_hallucination_grade.binary_score = "yes"
-        mock_hallucination_grader.invoke.return_value = mock_hallucination_grade
-        
-        mock_usefulness_grade = Mock()
-        mock_usefulness_grade.binary_score = "yes"
-        mock_usefulness_grader.invoke.return_value = mock_usefulness_grade
+        mock_answer_grader = Mock()
+        mock_grade = CombinedAnswerGrade(grounded="yes", useful="yes")
+        mock_answer_grader.ainvoke = AsyncMock(return_value=mock_grade)
         
         documents = [{"content": "Test document"}]
         
@@ -60,10 +52,101 @@ class TestNewRAGTools:
             "generation": "Test answer",
             "documents": documents,
             "question": "Test question",
-            "hallucination_grader": mock_hallucination_grader,
-            "usefulness_grader": mock_usefulness_grader
+            "answer_grader": mock_answer_grader
         })
         assert result == "utile"
+        # Groundedness and usefulness are judged in a single call
+        mock_answer_grader.ainvoke.assert_awaited_once()
+
+    def test_grade_answer_tool_truncates_documents(self):
+        """Test that the answer grader only sees a bounded, truncated document context."""
+        mock_answer_grader = Mock()
+        mock_answer_grader.ainvoke = AsyncMock(return_value=CombinedAnswerGrade(grounded="yes", useful="yes"))
+        documents = [{"content": f"  doc {i} " + "x" * 2000} for i in range(10)]
+        
+        grade_answer_tool.invoke({
+            "generation": "Test answer",
+            "documents": documents,
+            "question": "Test question",
+            "answer_grader": mock_answer_grader
+        })
+        context = mock_answer_grader.ainvoke.call_args.args[0]["documents"]
+        parts = context.split("\n---\n")
+        assert len(parts) == ANSWER_GRADER_MAX_DOCS
+        assert all(len(part) <= ANSWER_GRADER_DOC_CHARS and part.startswith("doc") for part in parts)
+
+    @pytest.mark.parametrize("grounded,useful,expected", [
+        ("no", "yes", "non supportato"),
+        ("no", "no", "non supportato"),
+        ("yes", "no", "non utile"),
+        (" No", "yes", "non supportato"),
+        ("Yes", "NO ", "non utile"),
+    ])
+    def test_grade_answer_tool_rejections(self, grounded, useful, expected):
+        """Test that a failed groundedness check takes precedence over usefulness, whatever the case."""
+        mock_answer_grader = Mock()
+        mock_answer_grader.ainvoke = AsyncMock(return_value=CombinedAnswerGrade(grounded=grounded, useful=useful))
+        
+        result = grade_answer_tool.invoke({
+            "generation": "Test answer",
+            "documents": [{"content": "Test document"}],
+            "question": "Test question",
+            "answer_grader": mock_answer_grader
+        })
+        assert result == expected
+
+    def test_grade_documents_tool_single_batched_call(self):
+        """Test that all documents are graded in one numbered, truncated prompt."""
+        mock_relevance_grader = Mock()
+        mock_relevance_grader.ainvoke = AsyncMock(return_value=GradeDocumentsBatch(scores=["yes", "no", "yes"]))
+
+        documents = [{"content": "doc 1"}, {"content": "x" * 2000}, {"page_content": "doc 3"}]
+
+        result = grade_documents_tool.invoke({
+            "documents": documents,
+            "question": "Privacy question",
+            "relevance_grader": mock_relevance_grader
+        })
+        assert result == [documents[0], documents[2]]
+        mock_relevance_grader.ainvoke.assert_awaited_once()
+        numbered_docs = mock_relevance_grader.ainvoke.call_args.args[0]["numbered_docs"]
+        assert numbered_docs.startswith("[0] doc 1\n[1] ")
+        assert "x" * (RELEVANCE_DOC_CHARS + 1) not in numbered_docs
+
+    def test_grade_documents_tool_keeps_unscored_documents(self):
+        """Test that documents missing from a short score list are kept."""
+        mock_relevance_grader = Mock()
+        mock_relevance_grader.ainvoke = AsyncMock(return_value=GradeDocumentsBatch(scores=["no"]))
+
+        documents = [{"content": "doc 1"}, {"content": "doc 2"}]
+
+        result = grade_documents_tool.invoke({
+            "documents": documents,
+            "question": "Privacy question",
+            "relevance_grader": mock_relevance_grader
+        })
+        assert result == [documents[1]]
+
+    def test_grade_documents_tool_concurrent_batches(self):
+        """Test that large document sets are graded in concurrent batches and a failed batch is kept."""
+        async def grade(inputs):
+            count = inputs["numbered_docs"].count("\n") + 1
+            if "doc 0" in inputs["numbered_docs"]:
+                raise Exception("API error")
+            return GradeDocumentsBatch(scores=["no"] * count)
+
+        mock_relevance_grader = Mock()
+        mock_relevance_grader.ainvoke = AsyncMock(side_effect=grade)
+        documents = [{"content": f"doc {i}"} for i in range(RELEVANCE_BATCH_DOCS + 2)]
+
+        result = grade_documents_tool.invoke({
+            "documents": documents,
+            "question": "Privacy question",
+            "relevance_grader": mock_relevance_grader
+        })
+        assert mock_relevance_grader.ainvoke.await_count == 2
+        # The failed first batch fails open; the second batch is filtered out
+        assert result == documents[:RELEVANCE_BATCH_DOCS]
 
 if __name__ == "__main__":
     pytest.main([__file__])
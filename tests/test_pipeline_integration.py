@@ -5,34 +5,24 @@ to establish a proper testing structure. These tests verify that components can
 imported and initialized correctly without requiring actual API keys or external services.
 """
 
-import os
-import sys
-import json
-from unittest.mock import patch, MagicMock, ANY
+import pytest
+from types import SimpleNamespace
+from unittest.mock import patch, MagicMock
 
-# Add project root to path
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+pytestmark = pytest.mark.usefixtures("no_sleep")
 
 def test_schema():
     """Test the schema definitions."""
-    print("Testing schema definitions...")
-    
     from src.schema import ENTITY_TYPES, RELATIONSHIP_TYPES, KnowledgeGraph, get_extraction_prompt
-    print("✅ Schema imports successful")
-    print(f"Entity types: {ENTITY_TYPES}")
-    print(f"Relationship types: {RELATIONSHIP_TYPES}")
     
     # Test Pydantic model
     test_graph = KnowledgeGraph(
         entities=[],
         relationships=[]
     )
-    print("✅ Pydantic model creation successful")
     
     # Test prompt creation
     prompt = get_extraction_prompt()
-    print("✅ Prompt creation successful")
-    print(f"Prompt type: {type(prompt)}")
     
     # Use assertions for pytest
     assert ENTITY_TYPES is not None
@@ -42,153 +32,67 @@ def test_schema():
 
 def test_preprocessing():
     """Test the preprocessing component."""
-    print("\nTesting preprocessing component...")
-    
     from src.preprocess import DocumentPreprocessor
-    print("✅ Preprocessor imports successful")
     
     # Test initialization
     preprocessor = DocumentPreprocessor()
-    print("✅ Preprocessor initialization successful")
     
     # Use assertions for pytest
     assert preprocessor is not None
 
-def test_ingestion_components():
+def test_ingestion_components(patched_ingestor):
     """Test the ingestion components."""
-    print("\nTesting ingestion components...")
+    # Mock the embedding dimension calculation during initialization
+    patched_ingestor['OpenAIEmbeddings'].return_value.embed_query.return_value = [0.1] * 1536
     
-    # Mock Neo4j connections
-    import sys
-    import os
-    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from src.ingest import GraphRAGIngestor
     
-    with patch('src.ingest.Neo4jGraph'), \
-         patch('src.ingest.ChatOpenAI'), \
-         patch('src.ingest.OpenAIEmbeddings') as mock_embeddings:
-        # Mock the embedding dimension calculation during initialization
-        mock_embeddings.return_value.embed_query.return_value = [0.1] * 1536
-        
-        from src.ingest import GraphRAGIngestor
-        print("✅ Ingestor imports successful")
-        
-        # Test initialization (without connecting to services)
-        ingestor = GraphRAGIngestor(openai_api_key="test-key")
-        print("✅ Ingestor initialization successful")
-        
-        # Use assertions for pytest
-        assert ingestor is not None
-
-def test_chatbot_components():
-    """Test the chatbot components."""
-    print("\nTesting chatbot components...")
+    # Test initialization (without connecting to services)
+    ingestor = GraphRAGIngestor(openai_api_key="test-key")
     
-    with patch('src.chatbot.ChatOpenAI'), \
-         patch('src.chatbot.Neo4jGraph'), \
-         patch('src.chatbot.GraphCypherQAChain'), \
-         patch('src.chatbot.Neo4jVector.from_existing_index'):
+    # Use assertions for pytest
+    assert ingestor is not None
+
+class TestChatbot:
+    """Test the chatbot components under the module-wide client patches."""
+    def test_chatbot_components(self, patched_chatbot):
+        """Test the chatbot components."""
         from src.chatbot import GraphRAGChatbot
         # QueryRouter and QueryDecomposer no longer exist in agent-based approach
-        print("✅ Chatbot imports successful")
         
         # Test initialization
         chatbot = GraphRAGChatbot(openai_api_key="test-key")
-        print("✅ Chatbot initialization successful")
         
         # Use assertions for pytest
         assert chatbot is not None
-
-def test_agent_tool_selection():
-    """Test that the agent chooses the correct tool based on question type."""
-    print("\nTesting agent tool selection behavior...")
     
-    # Mock all external dependencies
-    with patch('src.chatbot.ChatOpenAI') as mock_llm, \
-         patch('src.chatbot.Neo4jGraph'), \
-         patch('src.chatbot.GraphCypherQAChain'), \
-         patch('src.chatbot.Neo4jVector.from_existing_index'), \
-         patch('src.chatbot.TavilyClient'):
-        
-        # Mock LLM instance
-        mock_llm_instance = MagicMock()
-        mock_llm.return_value = mock_llm_instance
-        
-        # Mock the LLM response with tool calls
-        mock_response = MagicMock()
-        mock_response.tool_calls = [{
-            "name": "hybrid_search_tool",
-            "args": {"query": "What are the privacy regulations?"},
-            "id": "call_1"
-        }]
-        mock_response.content = ""
-        
-        mock_llm_instance.bind_tools.return_value.invoke.return_value = mock_response
+    @pytest.mark.parametrize("configure_llm", [True, False], ids=["tool_selection", "default_llm"])
+    def test_agent_workflow(self, patched_chatbot, monkeypatch, configure_llm):
+        """Test that the agent workflow builds with all RAG tools, binding them to the LLM."""
+        if configure_llm:
+            # Fresh LLM instance for this test, so the module-wide mock is not mutated
+            mock_llm_instance = MagicMock()
+            monkeypatch.setattr(patched_chatbot['ChatOpenAI'], "return_value", mock_llm_instance)
+            
+            # LLM response with tool calls
+            mock_response = SimpleNamespace(tool_calls=[{
+                "name": "hybrid_search_tool",
+                "args": {"query": "What are the privacy regulations?"},
+                "id": "call_1"
+            }], content="")
+            mock_llm_instance.bind_tools.return_value.invoke.return_value = mock_response
         
         # Import and initialize chatbot
         from src.chatbot import GraphRAGChatbot
         chatbot = GraphRAGChatbot(openai_api_key="test-key")
         
-        # Test that the build_workflow method can be called
+        # Test that the build_workflow method includes the rewrite and grading tools
         workflow = chatbot.build_workflow()
-        print("  ✅ Workflow building test passed")
-        
-        # Test that the LLM is properly bound with tools
-        mock_llm_instance.bind_tools.assert_called()
-        print("  ✅ Tool binding test passed")
+        assert workflow is not None
         
-        print("✅ Agent tool selection tests completed successfully")
-
-def test_new_rag_tools_integration():
-    """Test integration of new RAG tools (rewrite_query_tool, grade_documents_tool, grade_answer_tool)."""
-    print("\nTesting new RAG tools integration...")
-    
-    # Mock all external dependencies
-    with patch('src.chatbot.ChatOpenAI') as mock_llm, \
-         patch('src.chatbot.Neo4jGraph'), \
-         patch('src.chatbot.GraphCypherQAChain'), \
-         patch('src.chatbot.Neo4jVector.from_existing_index'), \
-         patch('src.chatbot.TavilyClient'):
-        
-        # Import and initialize chatbot
-        from src.chatbot import GraphRAGChatbot
-        chatbot = GraphRAGChatbot(openai_api_key="test-key")
-        
-        # Test that the build_workflow method includes new tools
-        workflow = chatbot.build_workflow()
-        print("  ✅ Workflow with new tools building test passed")
-        
-        print("✅ New RAG tools integration tests completed successfully")
-
-def main():
-    """Run all tests."""
-    print("🧪 Running GraphRAG Component Tests")
-    print("=" * 40)
-    
-    tests = [
-        test_schema,
-        test_preprocessing,
-        test_ingestion_components,
-        test_chatbot_components,
-        test_agent_tool_selection,
-        test_new_rag_tools_integration
-    ]
-    
-    passed = 0
-    total = len(tests)
-    
-    for test in tests:
-        try:
-            test()
-            passed += 1
-        except Exception as e:
-            print(f"❌ Test {test.__name__} failed: {e}")
-    
-    print(f"\n🏁 Test Results: {passed}/{total} tests passed")
-    
-    if passed == total:
-        print("🎉 All tests passed! The pipeline components are working correctly.")
-    else:
-        print("⚠️  Some tests failed. Please check the output above.")
+        if configure_llm:
+            # Test that the LLM is properly bound with tools
+            mock_llm_instance.bind_tools.assert_called()
 
 if __name__ == "__main__":
-    main()
+    pytest.main([__file__])
@@ -1,106 +1,201 @@
 """Unit tests for the GraphRAG preprocessing module."""
 
 import pytest
+import orjson
 import os
+import subprocess
+import sys
+from types import SimpleNamespace
 from unittest.mock import Mock, patch, mock_open
-from src.preprocess import DocumentPreprocessor
+from src.preprocess import DocumentPreprocessor, LANGUAGE_SAMPLE_SIZE, chunk_boundaries, get_text_flags, write_json_atomic
+
+@pytest.fixture(scope="module")
+def chunking_corpora():
+    """Provide the page lists and text used by the chunking tests, built once."""
+    return {
+        "pages": ["A" * 60, "B" * 60, "C" * 60],  # Each page > 50 chars
+        "text": "A" * 60 + "\f" + "B" * 60 + "\n\n\n" + "C" * 60,
+        "short_pages": ["A" * 25, "B" * 25],  # Pages < 50 chars trigger fallback chunking
+    }
+
+@pytest.fixture(scope="class")
+def preprocessor():
+    """Share one preprocessor across the class: it holds no per-document state."""
+    return DocumentPreprocessor()
 
 class TestDocumentPreprocessor:
     """Test the DocumentPreprocessor class."""
     
-    def setup_method(self):
-        """Set up test fixtures before each test method."""
-        self.preprocessor = DocumentPreprocessor()
-    
-    def test_preprocessor_initialization(self):
+    def test_preprocessor_initialization(self, preprocessor):
         """Test that the preprocessor initializes correctly."""
-        assert isinstance(self.preprocessor, DocumentPreprocessor)
+        assert isinstance(preprocessor, DocumentPreprocessor)
+    
+    def test_init_worker_preloads_libraries(self):
+        """Test that the worker initializer loads PyMuPDF and langdetect's profiles."""
+        code = ("import sys, src.preprocess as p; p.get_language_detector = lambda: None; p.init_worker(); "
+                "from langdetect import detector_factory; print('fitz' in sys.modules and detector_factory._factory is not None)")
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+        # PyMuPDF prints a deprecation notice for the fitz name on import
+        assert result.stdout.splitlines()[-1] == "True"
     
-    @patch('src.preprocess.fitz.open')
-    def test_extract_text_from_pdf_success(self, mock_fitz_open):
+    def test_import_skips_pdf_and_language_libraries(self):
+        """Test that importing the module does not load PyMuPDF or langdetect."""
+        code = "import sys, src.preprocess; print('fitz' in sys.modules or 'langdetect' in sys.modules)"
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+        assert result.stdout.strip() == "False"
+    
+    def test_extract_text_from_pdf_success(self, preprocessor, monkeypatch):
         """Test successful PDF text extraction."""
-        # Mock the PyMuPDF document
-        mock_doc = Mock()
-        mock_page1 = Mock()
-        mock_page2 = Mock()
-        mock_page1.get_text.return_value = "Page 1 content\n"
-        mock_page2.get_text.return_value = "Page 2 content\n"
-        mock_doc.__iter__ = Mock(return_value=iter([mock_page1, mock_page2]))
-        mock_doc.__len__ = Mock(return_value=2)
-        mock_fitz_open.return_value = mock_doc
+        # Stand-in PyMuPDF document: only the attributes extract_pages reads
+        pages = [
+            SimpleNamespace(get_text=lambda *args, **kwargs: "Page 1 content\n"),
+            SimpleNamespace(get_text=lambda *args, **kwargs: "Page 2 content\n")
+        ]
+        doc = SimpleNamespace(page_count=len(pages), load_page=pages.__getitem__, close=lambda: None)
+        monkeypatch.setattr("fitz.open", lambda **kwargs: doc)
         
-        result = self.preprocessor.extract_text_from_pdf("test.pdf")
+        result = preprocessor.extract_text_from_pdf("test.pdf")
         assert "Page 1 content" in result
         assert "Page 2 content" in result
         # The actual implementation strips the final result
         assert result == "Page 1 content\n\nPage 2 content"
     
-    @patch('src.preprocess.fitz.open')
-    def test_extract_text_from_pdf_error(self, mock_fitz_open):
+    def test_extract_text_from_pdf_error(self, preprocessor, monkeypatch):
         """Test PDF text extraction with error."""
-        mock_fitz_open.side_effect = Exception("PDF error")
-        result = self.preprocessor.extract_text_from_pdf("test.pdf")
+        monkeypatch.setattr("fitz.open", Mock(side_effect=Exception("PDF error")))
+        result = preprocessor.extract_text_from_pdf("test.pdf")
         assert result == ""
     
-    @patch('src.preprocess.detect')
-    def test_detect_language_success(self, mock_detect):
+    def test_extract_pages(self, preprocessor, monkeypatch):
+        """Test that each PDF page is returned as its own string."""
+        mock_doc = Mock()
+        mock_page1 = Mock()
+        mock_page2 = Mock()
+        mock_page1.get_text.return_value = "Page 1 content\n"
+        mock_page2.get_text.return_value = "Page 2 content\n"
+        mock_doc.page_count = 2
+        mock_doc.load_page.side_effect = [mock_page1, mock_page2]
+        mock_fitz_open = Mock(return_value=mock_doc)
+        monkeypatch.setattr("fitz.open", mock_fitz_open)
+        
+        result = preprocessor.extract_pages("test.pdf")
+        assert result == ["Page 1 content\n", "Page 2 content\n"]
+        import fitz
+        mock_page1.get_text.assert_called_once_with("text", flags=get_text_flags(fitz))
+        mock_fitz_open.assert_called_once_with(filename="test.pdf", filetype="pdf")
+        mock_doc.close.assert_called_once()
+    
+    def test_extract_pages_error(self, preprocessor, monkeypatch):
+        """Test page extraction with error."""
+        monkeypatch.setattr("fitz.open", Mock(side_effect=Exception("PDF error")))
+        assert preprocessor.extract_pages("test.pdf") == []
+    
+    def test_detect_language_success(self, preprocessor, monkeypatch):
         """Test successful language detection."""
-        mock_detect.return_value = "it"
-        result = self.preprocessor.detect_language("Testo in italiano")
+        monkeypatch.setattr("src.preprocess.get_language_detector", lambda: None)
+        monkeypatch.setattr("langdetect.detect", lambda text: "it")
+        result = preprocessor.detect_language("Testo in italiano")
         assert result == "it"
     
-    @patch('src.preprocess.detect')
-    def test_detect_language_error(self, mock_detect):
+    def test_detect_language_with_lingua(self, preprocessor, monkeypatch):
+        """Test that the lingua detector is preferred over langdetect when installed."""
+        detector = Mock()
+        detector.detect_language_of.return_value.iso_code_639_1.name = "IT"
+        mock_detect = Mock()
+        monkeypatch.setattr("src.preprocess.get_language_detector", lambda: detector)
+        monkeypatch.setattr("langdetect.detect", mock_detect)
+        result = preprocessor.detect_language("Testo in italiano")
+        assert result == "it"
+        mock_detect.assert_not_called()
+    
+    def test_detect_language_uses_prefix_sample(self, preprocessor, monkeypatch):
+        """Test that only the first LANGUAGE_SAMPLE_SIZE characters are analysed."""
+        samples = []
+        monkeypatch.setattr("src.preprocess.get_language_detector", lambda: None)
+        monkeypatch.setattr("langdetect.detect", lambda text: samples.append(text) or "it")
+        preprocessor.detect_language("a" * (LANGUAGE_SAMPLE_SIZE * 3))
+        assert [len(sample) for sample in samples] == [LANGUAGE_SAMPLE_SIZE]
+    
+    def test_detect_language_error(self, preprocessor, monkeypatch):
         """Test language detection with error."""
-        mock_detect.side_effect = Exception("Detection error")
-        result = self.preprocessor.detect_language("Test text")
+        monkeypatch.setattr("src.preprocess.get_language_detector", lambda: None)
+        monkeypatch.setattr("langdetect.detect", Mock(side_effect=Exception("Detection error")))
+        result = preprocessor.detect_language("Test text")
         assert result == "unknown"
     
-    def test_chunk_by_pages_with_valid_pages(self):
+    def test_chunk_by_pages_with_valid_pages(self, preprocessor, chunking_corpora):
         """Test chunking by pages with valid content."""
-        # Create text that will be split into multiple chunks
-        text = "A" * 60 + "\n\n" + "B" * 60 + "\n\n" + "C" * 60  # Each part > 50 chars
-        chunks = self.preprocessor.chunk_by_pages(text, "test_doc.pdf")
+        chunks = preprocessor.chunk_by_pages(chunking_corpora["pages"], "test_doc.pdf")
         assert len(chunks) == 3
         assert chunks[0]["id"] == "test_doc_pagina_1"
         assert "A" * 60 in chunks[0]["testo"]
     
-    def test_chunk_by_pages_with_fallback_chunking(self):
+    def test_chunk_by_pages_splits_plain_text(self, preprocessor, chunking_corpora):
+        """Test that plain text is split into pages on blank lines and form feeds."""
+        chunks = preprocessor.chunk_by_pages(chunking_corpora["text"], "test_doc.pdf")
+        assert [chunk["testo"] for chunk in chunks] == chunking_corpora["pages"]
+    
+    def test_chunk_by_pages_with_fallback_chunking(self, preprocessor, chunking_corpora):
         """Test fallback chunking when page splitting doesn't create substantial chunks."""
-        # Create text that when split by \n\n results in chunks < 50 chars each
-        # This should trigger fallback chunking
-        text = "A" * 25 + "\n\n" + "B" * 25  # Two small chunks that will be filtered out
-        chunks = self.preprocessor.chunk_by_pages(text, "test_doc.pdf")
+        chunks = preprocessor.chunk_by_pages(chunking_corpora["short_pages"], "test_doc.pdf")
         assert len(chunks) > 0
         # Should use fallback chunking since page chunks were too short
         assert "test_doc_chunk_" in chunks[0]["id"]
     
-    def test_process_pdf_success(self):
+    def test_chunk_boundaries_cut_after_newlines(self):
+        """Test that fallback windows end on the last newline before the size limit."""
+        text = "à" * 15 + "\n" + "b" * 10 + "c" * 14
+        assert chunk_boundaries(text, 20) == [0, 16, 40]
+    
+    def test_chunk_boundaries_without_newlines(self):
+        """Test that text without newlines is cut at fixed-size offsets."""
+        assert chunk_boundaries("a" * 45, 20) == [0, 20, 40, 45]
+        assert chunk_boundaries("a" * 10, 20) == [0, 10]
+    
+    def test_process_pdf_success(self, preprocessor):
         """Test successful PDF processing."""
-        with patch.object(self.preprocessor, 'extract_text_from_pdf') as mock_extract, \
-             patch.object(self.preprocessor, 'detect_language') as mock_detect, \
-             patch.object(self.preprocessor, 'chunk_by_pages') as mock_chunk:
+        with patch.object(preprocessor, 'extract_pages') as mock_extract, \
+             patch.object(preprocessor, 'detect_language') as mock_detect, \
+             patch.object(preprocessor, 'chunk_by_pages') as mock_chunk:
             
-            mock_extract.return_value = "Test document content"
+            mock_extract.return_value = ["Test document content"]
             mock_detect.return_value = "it"
             mock_chunk.return_value = [
                 {"id": "test_pagina_1", "testo": "Page 1 content"},
                 {"id": "test_pagina_2", "testo": "Page 2 content"}
             ]
             
-            result = self.preprocessor.process_pdf("test.pdf")
+            result = preprocessor.process_pdf("test.pdf")
             assert result is not None
             assert result["file_sorgente"] == "test.pdf"
             assert result["metadati"]["lingua"] == "it"
             assert result["metadati"]["numero_pagine"] == 2
             assert len(result["chunks"]) == 2
     
-    def test_process_pdf_empty_text(self):
+    def test_process_pdf_empty_text(self, preprocessor):
         """Test PDF processing with empty text."""
-        with patch.object(self.preprocessor, 'extract_text_from_pdf') as mock_extract:
-            mock_extract.return_value = ""
-            result = self.preprocessor.process_pdf("test.pdf")
+        with patch.object(preprocessor, 'extract_pages') as mock_extract:
+            mock_extract.return_value = ["", "  \n"]
+            result = preprocessor.process_pdf("test.pdf")
             assert result is None
+    
+    def test_write_json_atomic(self, tmp_path):
+        """Test that the JSON is written in full and no temporary file is left behind."""
+        output_path = tmp_path / "doc.json"
+        output_path.write_text("stale")
+        write_json_atomic(str(output_path), {"file_sorgente": "doc.pdf", "testo": "Provvedimento è"})
+        
+        assert orjson.loads(output_path.read_bytes()) == {"file_sorgente": "doc.pdf", "testo": "Provvedimento è"}
+        assert [p.name for p in tmp_path.iterdir()] == ["doc.json"]
+    
+    def test_write_json_atomic_keeps_old_file_on_failure(self, tmp_path):
+        """Test that a failed serialization leaves the previous output untouched."""
+        output_path = tmp_path / "doc.json"
+        output_path.write_text('{"ok": true}')
+        with pytest.raises(TypeError):
+            write_json_atomic(str(output_path), {"bad": object()})
+        assert output_path.read_text() == '{"ok": true}'
+        assert [p.name for p in tmp_path.iterdir()] == ["doc.json"]
 
 if __name__ == "__main__":
     pytest.main([__file__])
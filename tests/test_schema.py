@@ -7,6 +7,11 @@ from src.schema import (
     get_extraction_prompt, get_system_prompt
 )
 
+@pytest.fixture(scope="module")
+def extraction_prompt():
+    """Provide the extraction prompt, built once for the module."""
+    return get_extraction_prompt()
+
 class TestSchemaDefinitions:
     """Test the schema constants and data structures."""
     
@@ -86,12 +91,15 @@ class TestSchemaDefinitions:
         assert kg.entities[0].id == "test_entity_1"
         assert kg.relationships[0].id == "test_rel_1"
     
-    def test_get_extraction_prompt_returns_prompt(self):
+    def test_get_extraction_prompt_returns_prompt(self, extraction_prompt):
         """Test that get_extraction_prompt returns a ChatPromptTemplate."""
         from langchain_core.prompts import ChatPromptTemplate
-        prompt = get_extraction_prompt()
-        assert isinstance(prompt, ChatPromptTemplate)
-        assert len(prompt.messages) > 0
+        assert isinstance(extraction_prompt, ChatPromptTemplate)
+        assert len(extraction_prompt.messages) > 0
+    
+    def test_get_extraction_prompt_is_cached(self, extraction_prompt):
+        """Test that the extraction prompt is built once and reused."""
+        assert get_extraction_prompt() is extraction_prompt
     
     def test_get_system_prompt_returns_string(self):
         """Test that get_system_prompt returns a string."""
@@ -0,0 +1,104 @@
+"""Unit tests for the GraphRAG semantic cache module."""
+
+import pytest
+from unittest.mock import Mock
+from src.semcache import SemCache
+
+VECTORS = {
+    "Cos'è il GDPR?": [1.0, 0.0, 0.0],
+    "Che cos'è il GDPR?": [0.99, 0.05, 0.0],
+    "Chi è il Garante?": [0.0, 1.0, 0.0],
+    "Cosa fa il DPO?": [0.0, 0.0, 1.0],
+}
+
+def make_embedder():
+    """Build an embedder mock backed by the fixed VECTORS table."""
+    embedder = Mock()
+    embedder.embed_documents.side_effect = lambda texts: [VECTORS[t] for t in texts]
+    return embedder
+
+class TestSemCache:
+    """Test the SemCache class."""
+
+    def test_get_empty_cache_skips_embedding(self):
+        """Test that an empty cache returns None without calling the embedder."""
+        embedder = make_embedder()
+        cache = SemCache(embedder)
+        assert cache.get("Cos'è il GDPR?") is None
+        embedder.embed_documents.assert_not_called()
+
+    def test_get_paraphrase_hit(self):
+        """Test that a paraphrased question returns the cached value."""
+        cache = SemCache(make_embedder(), tau=0.93)
+        cache.put("Cos'è il GDPR?", "Il GDPR è il regolamento europeo.")
+        assert cache.get("Che cos'è il GDPR?") == "Il GDPR è il regolamento europeo."
+
+    def test_get_unrelated_miss(self):
+        """Test that an unrelated question is a cache miss."""
+        cache = SemCache(make_embedder(), tau=0.93)
+        cache.put("Cos'è il GDPR?", "Il GDPR è il regolamento europeo.")
+        assert cache.get("Chi è il Garante?") is None
+
+    def test_persistence(self, tmp_path):
+        """Test that entries are reloaded from disk by a new instance."""
+        path = str(tmp_path / "answers.jsonl")
+        SemCache(make_embedder(), path=path).put("Cos'è il GDPR?", "Risposta")
+        assert SemCache(make_embedder(), path=path).get("Che cos'è il GDPR?") == "Risposta"
+
+    def test_capacity_evicts_least_recently_used(self):
+        """Test that a full cache evicts the entry that was used least recently."""
+        cache = SemCache(make_embedder(), tau=0.93, capacity=2)
+        cache.put("Cos'è il GDPR?", "GDPR")
+        cache.put("Chi è il Garante?", "Garante")
+        assert cache.get("Che cos'è il GDPR?") == "GDPR"
+        cache.put("Cosa fa il DPO?", "DPO")
+        assert cache.get("Chi è il Garante?") is None
+        assert cache.get("Cos'è il GDPR?") == "GDPR"
+        assert cache.get("Cosa fa il DPO?") == "DPO"
+
+    def test_embedding_error_is_a_miss(self):
+        """Test that embedder failures degrade to a cache miss."""
+        embedder = make_embedder()
+        cache = SemCache(embedder)
+        cache.put("Cos'è il GDPR?", "Risposta")
+        embedder.embed_documents.side_effect = Exception("API error")
+        assert cache.get("Che cos'è il GDPR?") is None
+
+    def test_embedding_runs_outside_lock(self):
+        """Test that lookups and inserts call the embedder without holding the cache lock."""
+        embedder = make_embedder()
+        cache = SemCache(embedder)
+        lock_states = []
+        
+        def embed(texts):
+            lock_states.append(cache._lock.locked())
+            return [VECTORS[t] for t in texts]
+        
+        embedder.embed_documents.side_effect = embed
+        cache.put("Cos'è il GDPR?", "Risposta")
+        assert cache.get("Che cos'è il GDPR?") == "Risposta"
+        assert lock_states == [False, False]
+
+    def test_persistence_appends_entries(self, tmp_path):
+        """Test that each insertion appends one line and the latest value wins on reload."""
+        path = tmp_path / "answers.jsonl"
+        cache = SemCache(make_embedder(), path=str(path))
+        cache.put("Cos'è il GDPR?", "Prima risposta")
+        cache.put("Chi è il Garante?", "Garante")
+        cache.put("Cos'è il GDPR?", "Seconda risposta")
+        assert len(path.read_text(encoding="utf-8").splitlines()) == 3
+        assert SemCache(make_embedder(), path=str(path)).get("Che cos'è il GDPR?") == "Seconda risposta"
+
+    def test_persistence_compacts_log(self, tmp_path):
+        """Test that the log is rewritten with the live entries once it exceeds twice the capacity."""
+        path = tmp_path / "answers.jsonl"
+        cache = SemCache(make_embedder(), path=str(path), capacity=1)
+        for question in ["Cos'è il GDPR?", "Chi è il Garante?", "Cosa fa il DPO?"]:
+            cache.put(question, question.upper())
+        assert len(path.read_text(encoding="utf-8").splitlines()) == 1
+        reloaded = SemCache(make_embedder(), path=str(path), capacity=1)
+        assert reloaded.get("Cosa fa il DPO?") == "COSA FA IL DPO?"
+        assert reloaded.get("Cos'è il GDPR?") is None
+
+if __name__ == "__main__":
+    pytest.main([__file__])
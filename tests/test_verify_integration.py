@@ -0,0 +1,72 @@
+"""Integration tests for GraphRAG v4 hybrid search enhancements."""
+
+import pytest
+
+@pytest.fixture(scope="module")
+def graph_nodes():
+    """Import the graph nodes module once for the tool factory checks."""
+    import src.graph_nodes as graph_nodes
+    return graph_nodes
+
+@pytest.fixture(scope="module")
+def signatures(graph_nodes):
+    """Inspect the tool factory signatures once for the module."""
+    import inspect
+    names = ("create_hybrid_search_tool", "create_structured_query_tool",
+             "create_web_search_tool", "create_metadata_filter_tool")
+    return {name: inspect.signature(getattr(graph_nodes, name)) for name in names}
+
+class TestEnhancementIntegration:
+    """Test integration of hybrid search enhancements."""
+    
+    def test_agent_state_appends_messages(self):
+        """Verify AgentState merges node updates into the message history."""
+        import typing
+        from langchain_core.messages import AIMessage, HumanMessage
+        from langgraph.graph.message import add_messages
+        from src.graph_state import AgentState
+        
+        hints = typing.get_type_hints(AgentState, include_extras=True)
+        assert set(hints) == {"messages"}
+        reducer = hints["messages"].__metadata__[0]
+        assert reducer is add_messages
+        
+        merged = reducer([HumanMessage("Domanda")], [AIMessage("Risposta")])
+        assert [m.content for m in merged] == ["Domanda", "Risposta"]
+    
+    @pytest.mark.parametrize("name,params,tool_name", [
+        ("create_hybrid_search_tool", ["vector_store", "graph", "k", "cache"], "hybrid_search_tool"),
+        ("create_structured_query_tool", ["graph_qa_chain", "graph"], "structured_query_tool"),
+        ("create_web_search_tool", ["tavily_client", "cache", "async_tavily_client"], "web_search_tool"),
+        ("create_metadata_filter_tool", ["vector_store"], "metadata_filter_tool"),
+    ])
+    def test_graph_node_function(self, graph_nodes, signatures, name, params, tool_name):
+        """Verify the tool factory takes its injected dependencies and builds the named tool."""
+        factory = getattr(graph_nodes, name)
+        
+        # Check function signature
+        for param in params:
+            assert param in signatures[name].parameters
+        
+        assert factory().name == tool_name
+    
+    def test_enhanced_vector_store_initialization(self):
+        """Test that vector store is initialized with hybrid search support."""
+        # The Neo4j and OpenAI clients are mocked so initialization cannot reach a server
+        from unittest.mock import patch
+        from src.chatbot import GraphRAGChatbot
+        
+        with patch('src.chatbot.ChatOpenAI'), \
+             patch('src.chatbot.Neo4jGraph') as mock_neo4j_graph, \
+             patch('src.chatbot.GraphCypherQAChain'), \
+             patch('src.chatbot.Neo4jVector') as mock_neo4j_vector:
+            # The SHOW INDEXES probe reports both indexes, selecting the hybrid branch
+            mock_neo4j_graph.return_value.query.return_value = [{"name": "vector_index"}, {"name": "keyword_index"}]
+            
+            chatbot = GraphRAGChatbot(openai_api_key="test-key")
+            mock_neo4j_vector.from_existing_index.assert_called_once()
+            assert mock_neo4j_vector.from_existing_index.call_args.kwargs["search_type"] == "hybrid"
+            assert chatbot.vector_store is mock_neo4j_vector.from_existing_index.return_value
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,81 @@
+"""Unit tests for the GraphRAG web search cache module."""
+
+import asyncio
+import pytest
+from unittest.mock import patch
+from src.web_search_cache import WebSearchCache, normalize_query
+
+RESULTS = [{"content": "Il GDPR è il regolamento europeo.", "url": "http://test.com", "title": "GDPR"}]
+
+class TestWebSearchCache:
+    """Test the WebSearchCache class."""
+
+    def test_normalize_query(self):
+        """Test that case and whitespace differences map to the same key."""
+        assert normalize_query("  Cos'è   il GDPR? ") == normalize_query("cos'è il gdpr?")
+
+    def test_get_put(self):
+        """Test that stored results are returned and unknown keys miss."""
+        cache = WebSearchCache()
+        cache.put("gdpr", RESULTS)
+        assert cache.get("gdpr") == RESULTS
+        assert cache.get("garante") is None
+
+    def test_expired_entry_is_a_miss(self):
+        """Test that entries older than the TTL are ignored."""
+        cache = WebSearchCache(ttl=60)
+        with patch('src.web_search_cache.time.time', return_value=1000.0):
+            cache.put("gdpr", RESULTS)
+        with patch('src.web_search_cache.time.time', return_value=1061.0):
+            assert cache.get("gdpr") is None
+
+    def test_persistence(self, tmp_path):
+        """Test that entries are reloaded from disk by a new instance."""
+        WebSearchCache(path=str(tmp_path)).put("gdpr", RESULTS)
+        assert WebSearchCache(path=str(tmp_path)).get("gdpr") == RESULTS
+
+    def test_memory_lru_eviction(self):
+        """Test that the in-memory layer is bounded by maxsize."""
+        cache = WebSearchCache(maxsize=2)
+        for key in ["a", "b", "c"]:
+            cache.put(key, RESULTS)
+        assert cache.get("a") is None
+        assert cache.get("c") == RESULTS
+
+    def test_lock_dropped_after_use(self):
+        """Test that per-key locks do not accumulate once their searches finish."""
+        cache = WebSearchCache()
+
+        async def scenario():
+            for key in ["a", "b", "c"]:
+                async with cache.alock_for(key):
+                    assert key in cache._locks
+
+        asyncio.run(scenario())
+        assert cache._locks == {}
+
+    def test_async_lock_released_on_cancellation(self):
+        """Test that a cancelled waiter neither leaks the lock nor its table entry."""
+        cache = WebSearchCache()
+
+        async def scenario():
+            async def waiter():
+                async with cache.alock_for("gdpr"):
+                    pass
+
+            async with cache.alock_for("gdpr"):
+                task = asyncio.create_task(waiter())
+                await asyncio.sleep(0)
+                task.cancel()
+                with pytest.raises(asyncio.CancelledError):
+                    await task
+            assert cache._locks == {}
+            # The key can be locked again after the cancellation
+            async with cache.alock_for("gdpr"):
+                pass
+
+        asyncio.run(scenario())
+        assert cache._locks == {}
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -1,117 +0,0 @@
-"""Integration tests for GraphRAG v4 hybrid search enhancements."""
-
-import pytest
-import sys
-import os
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-
-from src.graph_state import GraphState
-from src.graph_nodes import hybrid_search, extract_metadata
-from src.chatbot_v4 import GraphRAGChatbot
-
-class TestEnhancementIntegration:
-    """Test integration of hybrid search enhancements."""
-    
-    def test_graph_state_metadata_filter(self):
-        """Verify GraphState has been updated with metadata_filter."""
-        # Test GraphState initialization
-        state = GraphState(question="Test question")
-        assert hasattr(state, 'metadata_filter')
-        assert state.metadata_filter == {}
-        
-        # Test GraphState with metadata
-        state_with_meta = GraphState(
-            question="Test question",
-            metadata_filter={"document_type": "provvedimento", "authority": "Garante Privacy"}
-        )
-        assert state_with_meta.metadata_filter["document_type"] == "provvedimento"
-        assert state_with_meta.metadata_filter["authority"] == "Garante Privacy"
-    
-    def test_hybrid_search_function_exists(self):
-        """Verify hybrid_search function exists and is callable."""
-        import inspect
-        assert inspect.isfunction(hybrid_search)
-        
-        # Check function signature
-        sig = inspect.signature(hybrid_search)
-        params = list(sig.parameters.keys())
-        assert 'state' in params
-        assert 'vector_store' in params
-    
-    def test_extract_metadata_function_exists(self):
-        """Verify extract_metadata function exists and is callable."""
-        import inspect
-        assert inspect.isfunction(extract_metadata)
-        
-        # Check function signature
-        sig = inspect.signature(extract_metadata)
-        params = list(sig.parameters.keys())
-        assert 'state' in params
-        assert 'llm' in params
-    
-    def test_workflow_integration(self):
-        """Verify workflow integration in chatbot_v4.py."""
-        # Try to import the chatbot and check if new functions are available
-        import src.graph_nodes as graph_nodes
-        assert hasattr(graph_nodes, 'hybrid_search')
-        assert hasattr(graph_nodes, 'extract_metadata')
-        
-        # Check that GraphState has metadata_filter
-        from src.graph_state import GraphState
-        state = GraphState(question="test")
-        assert hasattr(state, 'metadata_filter')
-    
-    def test_enhanced_vector_store_initialization(self):
-        """Test that vector store is initialized with hybrid search support."""
-        # This test would require actual Neo4j connection, so we'll mock it
-        from unittest.mock import patch, Mock
-        
-        with patch('src.chatbot_v4.Neo4jVector') as mock_neo4j_vector:
-            with patch('src.chatbot_v4.OpenAIEmbeddings') as mock_embeddings:
-                with patch('src.chatbot_v4.Neo4jGraph') as mock_neo4j_graph:
-                    # Mock the vector store to return a hybrid-enabled instance
-                    mock_vector_store = Mock()
-                    mock_neo4j_vector.from_existing_index.return_value = mock_vector_store
-                    
-                    # Initialize chatbot (this will trigger vector store initialization)
-                    try:
-                        chatbot = GraphRAGChatbot(openai_api_key="test-key")
-                        # If we get here, initialization worked
-                        assert hasattr(chatbot, 'vector_store')
-                    except Exception as e:
-                        # Even if there are connection errors, the structure should be correct
-                        assert True  # Initialization code path was exercised
-
-class TestEnhancementSummary:
-    """Test that all enhancements are properly implemented."""
-    
-    def test_enhancement_checklist(self):
-        """Verify all required enhancements are implemented."""
-        # Import GraphState properly
-        from src.graph_state import GraphState
-        
-        # 1. GraphState should have metadata_filter field
-        state = GraphState(question="test")
-        assert hasattr(state, 'metadata_filter')
-        
-        # 2. hybrid_search function should exist
-        import inspect
-        assert inspect.isfunction(hybrid_search)
-        
-        # 3. extract_metadata function should exist
-        assert inspect.isfunction(extract_metadata)
-        
-        # 4. Functions should be importable from graph_nodes
-        import src.graph_nodes as graph_nodes
-        assert hasattr(graph_nodes, 'hybrid_search')
-        assert hasattr(graph_nodes, 'extract_metadata')
-        
-        # 5. GraphState should be importable and functional
-        test_state = GraphState(
-            question="test",
-            metadata_filter={"test": "value"}
-        )
-        assert test_state.metadata_filter["test"] == "value"
-
-if __name__ == "__main__":
-    pytest.main([__file__, "-v"])